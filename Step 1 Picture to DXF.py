@@ -1,7 +1,12 @@
-from PyQt5 import QtWidgets, QtGui
+from PyQt5 import QtWidgets, QtGui, QtCore
 from src.ui import Ui_MainWindow # type: ignore
-from src.processing import find_diameter, find_contours, save_contours_as_dxf, select_image, import_to_openscad, exit_application, clear_canvas, create_main_window, display_image_on_canvas # type: ignore
+from src.pipeline import OFFSET_METHODS # type: ignore
+from src.image_io import read_image # type: ignore
+from src.rig_calibration import RigScale, save_rig_scale, RIG_SCALE_FILE # type: ignore
+from src.processing_worker import ProcessingRunner # type: ignore
+from src.processing import get_settings, preview_contours, select_image, import_to_openscad, exit_application, clear_canvas, create_main_window, display_image_on_canvas, display_contours, pipeline_cache # type: ignore
 import cv2
+import pyperclip
 import traceback
 from PIL import Image
 import threading
@@ -20,6 +25,79 @@ def create_main_window():
     
     ui.console_text.setText("Input Project Name then Load Image")  # Set default console text
 
+    # Offset method selector (not in ui.ui so pyuic5 regeneration keeps working)
+    ui.label_offset_method = QtWidgets.QLabel("Offset Method:", ui.centralwidget)
+    ui.label_offset_method.setAlignment(ui.label_offset.alignment())
+    ui.offset_method = QtWidgets.QComboBox(ui.centralwidget)
+    ui.offset_method.addItems(OFFSET_METHODS)
+    ui.offset_method.setToolTip("raster: dilate the traced image. distance: raster offset from a distance transform, "
+                                "fast at any offset. polygon: offset the traced outline exactly (needs pyclipper)")
+    ui.gridLayout.addWidget(ui.label_offset_method, 6, 0, 1, 1)
+    ui.gridLayout.addWidget(ui.offset_method, 6, 1, 1, 1)
+
+    # Fixed camera rig: use the saved px/inch instead of finding the token
+    ui.trusted_rig = QtWidgets.QCheckBox("Trusted rig scale", ui.centralwidget)
+    ui.trusted_rig.setLayoutDirection(QtCore.Qt.RightToLeft)
+    ui.trusted_rig.setToolTip("Skip token detection and use the saved rig px/inch. The token is still checked every few images.")
+    ui.save_rig = QtWidgets.QPushButton("Save Rig Scale", ui.centralwidget)
+    ui.save_rig.setToolTip("Save the px/inch of the current image's token for this camera")
+    ui.gridLayout.addWidget(ui.trusted_rig, 7, 0, 1, 1)
+    ui.gridLayout.addWidget(ui.save_rig, 7, 1, 1, 1)
+
+    # Sliders for live preview, next to the fields they drive
+    ui.threshold_slider = QtWidgets.QSlider(QtCore.Qt.Horizontal, ui.centralwidget)
+    ui.threshold_slider.setRange(0, 255)
+    ui.offset_slider = QtWidgets.QSlider(QtCore.Qt.Horizontal, ui.centralwidget)
+    ui.offset_slider.setRange(1, 100)  # hundredths of an inch, a zero offset has no kernel
+    ui.resolution_slider = QtWidgets.QSlider(QtCore.Qt.Horizontal, ui.centralwidget)
+    ui.resolution_slider.setRange(1, 50)
+    for slider, row in ((ui.threshold_slider, 0), (ui.offset_slider, 1), (ui.resolution_slider, 3)):
+        slider.setToolTip("Drag for a live preview, the full resolution pass runs on release")
+        ui.gridLayout.addWidget(slider, row, 2, 1, 1)
+
+    # Processing runs in the background and can be stopped
+    ui.cancel_button = QtWidgets.QPushButton("Cancel Processing", ui.centralwidget)
+    ui.cancel_button.setEnabled(False)
+    ui.gridLayout.addWidget(ui.cancel_button, 8, 1, 1, 1)
+
+    # Line / arc fitting in mm instead of approxPolyDP at Resolution (0 = off)
+    ui.label_curve_tolerance = QtWidgets.QLabel("Arc Fit Tolerance (mm):", ui.centralwidget)
+    ui.label_curve_tolerance.setAlignment(ui.label_offset.alignment())
+    ui.curve_tolerance = QtWidgets.QDoubleSpinBox(ui.centralwidget)
+    ui.curve_tolerance.setRange(0.0, 2.0)
+    ui.curve_tolerance.setSingleStep(0.05)
+    ui.curve_tolerance.setSpecialValueText("Off")
+    ui.curve_tolerance.setToolTip("Fit the outlines with lines and arcs that stay within this distance of the offset outline. "
+                                  "Far fewer DXF vertices than Resolution, which is ignored while this is on.")
+    ui.gridLayout.addWidget(ui.label_curve_tolerance, 9, 0, 1, 1)
+    ui.gridLayout.addWidget(ui.curve_tolerance, 9, 1, 1, 1)
+
+    # Round and rectangular outlines as shape_data primitives instead of DXFs (0 = off)
+    ui.label_shape_tolerance = QtWidgets.QLabel("Shape Fit Tolerance (mm):", ui.centralwidget)
+    ui.label_shape_tolerance.setAlignment(ui.label_offset.alignment())
+    ui.shape_tolerance = QtWidgets.QDoubleSpinBox(ui.centralwidget)
+    ui.shape_tolerance.setRange(0.0, 2.0)
+    ui.shape_tolerance.setSingleStep(0.1)
+    ui.shape_tolerance.setSpecialValueText("Off")
+    ui.shape_tolerance.setToolTip("Cut outlines that are within this distance of a circle or a rectangle as native "
+                                  "shape_data cutouts instead of imported DXFs, which renders much faster.")
+    ui.gridLayout.addWidget(ui.label_shape_tolerance, 10, 0, 1, 1)
+    ui.gridLayout.addWidget(ui.shape_tolerance, 10, 1, 1, 1)
+
+    # Union of overlapping tool outlines, fewer cuts for OpenSCAD
+    ui.merge_outlines = QtWidgets.QCheckBox("Merge overlapping outlines", ui.centralwidget)
+    ui.merge_outlines.setLayoutDirection(QtCore.Qt.RightToLeft)
+    ui.merge_outlines.setToolTip("Merge tool outlines that overlap or touch (and holes inside a tool) into one outline "
+                                 "before export, so the board has fewer cuts to render (needs pyclipper)")
+    ui.gridLayout.addWidget(ui.merge_outlines, 11, 0, 1, 1)
+
+    # Chamfer stacked from precomputed slices instead of the minkowski cone
+    ui.chamfer_layers = QtWidgets.QCheckBox("Layered chamfer", ui.centralwidget)
+    ui.chamfer_layers.setLayoutDirection(QtCore.Qt.RightToLeft)
+    ui.chamfer_layers.setToolTip("Write the chamfer as stacked offset slices next to every DXF and build it from them "
+                                 "in OpenSCAD, which renders much faster than minkowski (needs pyclipper)")
+    ui.gridLayout.addWidget(ui.chamfer_layers, 11, 1, 1, 1)
+
     # Load defaults if available
     defaults_path = os.path.join(os.path.dirname(__file__), "default_settings.txt")
     if os.path.exists(defaults_path):
@@ -39,6 +117,16 @@ def create_main_window():
                     ui.token_entry.setText(defaults['token'])
                 if 'resolution' in defaults:
                     ui.resolution_entry.setText(defaults['resolution'])
+                if defaults.get('offset_method') in OFFSET_METHODS:
+                    ui.offset_method.setCurrentText(defaults['offset_method'])
+                if 'curve_tolerance' in defaults:
+                    ui.curve_tolerance.setValue(float(defaults['curve_tolerance']))
+                if 'shape_tolerance' in defaults:
+                    ui.shape_tolerance.setValue(float(defaults['shape_tolerance']))
+                if 'merge_outlines' in defaults:
+                    ui.merge_outlines.setChecked(defaults['merge_outlines'] == "1")
+                if 'chamfer_method' in defaults:
+                    ui.chamfer_layers.setChecked(defaults['chamfer_method'] == "layers")
         except Exception:
             pass
     
@@ -88,7 +176,7 @@ def main():
                 print("No image selected. Exiting.")
                 return
             print(f"Loaded image: {input_image_path}")
-            image = cv2.imread(input_image_path)
+            image = read_image(input_image_path)
             if image is None:
                 print("Failed to load image.")
                 return
@@ -114,35 +202,124 @@ def main():
     ui.splitDXF.toggled.connect(on_splitdxf_toggled)
 
     def process_image(splitDXF=None):
-        global image
-        if image is None:
+        if globals().get('image') is None:
             console_text.setText("No image loaded. Please load or capture an image first.")
             return
         try:
-            clear_canvas(canvas, keep_original=True)
-            console_text.setText(f"Processing image.")
             folder_name = ui.lineEdit.text().strip()  # Get folder name from lineEdit
             if not folder_name:
                 console_text.setText("Project name is empty. Please enter a valid name.")
                 return
-            diameter, threshold_input = find_diameter(image, canvas, threshold_entry, offset_entry, token_entry, resolution_entry, console_text)
-            if diameter is None or threshold_input is None:
-                return  # Return to main loop if the user selects "no"
-            contours, offset_image = find_contours(image, diameter, threshold_input, canvas, console_text)
             # Always get splitDXF from UI if not explicitly passed
             if splitDXF is None:
                 splitDXF = ui.splitDXF.isChecked()
-            dxf_path, gridx_size, gridy_size = save_contours_as_dxf(contours, file_name, float(token_entry.text()) / diameter, console_text, folder_name, splitDXF=splitDXF)
-            console_text.setText(f"Processing image\nGrid X Size: {gridx_size}, Grid Y Size: {gridy_size}")
+            params = get_settings(threshold_entry, offset_entry, token_entry, resolution_entry,
+                                  ui.offset_method.currentText(), splitDXF, ui.curve_tolerance.value(),
+                                  ui.shape_tolerance.value(), ui.merge_outlines.isChecked(),
+                                  "layers" if ui.chamfer_layers.isChecked() else "minkowski")
+            clear_canvas(canvas, keep_original=True)
+            import_button.setEnabled(False)
+            ui.cancel_button.setEnabled(True)
+            console_text.setText("Processing image.")
+            # Supersedes anything still running, only the newest result is shown
+            runner.submit(image, params, file_name, folder_name)
+        except Exception as e:
+            console_text.setText(f"Error processing image: {str(e)}")
+            print(traceback.format_exc())
+
+    def on_processing_progress(message):
+        console_text.setText(f"Processing image: {message}")
+
+    def on_processing_cancelled():
+        ui.cancel_button.setEnabled(False)
+        console_text.setText("Processing cancelled.")
+
+    def on_processing_finished(result):
+        ui.cancel_button.setEnabled(False)
+        try:
+            if result["diameter"] is None:
+                console_text.setText(result["token_message"])
+                return
+            display_contours(image, result["traced_contours"], canvas, 2, "Traced", (0, 255, 0))  # Green color for traced image
+            display_contours(image, result["offset_contours"], canvas, 3, "Offset", (255, 0, 0))  # Blue color for filtered contours
+            dxf_path = result["dxf_path"]
+            if dxf_path is None:
+                console_text.setText(result["dxf_message"])
+                return
+            if isinstance(dxf_path, str):
+                pyperclip.copy(dxf_path)
+            stages_run = ", ".join(result["stages"]) or "none (cached)"
+            rig_warnings = "\n".join(pipeline_cache.rig.take_warnings()) if pipeline_cache.rig is not None else ""
+            console_text.setText(f"Processing image\n{result['token_message']}\nGrid X Size: {result['gridx_size']}, Grid Y Size: {result['gridy_size']}\nStages rerun: {stages_run}"
+                                 + (f"\n{result['export_report']}" if result["export_report"] else "")
+                                 + (f"\n{rig_warnings}" if rig_warnings else ""))
             import_button.setEnabled(True)
-            import_button.dxf_path = dxf_path
-            import_button.gridx_size = gridx_size
-            import_button.gridy_size = gridy_size
-            import_button.folder_name = folder_name  # Store folder name for import_to_openscad
+            # import_to_openscad reads the rest from this job's manifest
+            import_button.file_name = result["file_name"]
+            import_button.folder_name = result["folder_name"]
         except Exception as e:
             console_text.setText(f"Error processing image: {str(e)}")
             print(traceback.format_exc())
 
+    def on_processing_failed(message):
+        ui.cancel_button.setEnabled(False)
+        console_text.setText(f"Error processing image: {message}")
+
+    # Live preview: slider moves update the traced and offset panes from a
+    # canvas sized proxy (debounced); the full resolution pass runs when the
+    # slider is released or the sliders have been idle for a moment.
+    SLIDER_FIELDS = ((ui.threshold_slider, threshold_entry, 1), (ui.offset_slider, offset_entry, 100),
+                     (ui.resolution_slider, resolution_entry, 1))
+    preview_timer = QtCore.QTimer(window)
+    preview_timer.setSingleShot(True)
+    preview_timer.setInterval(60)  # ms debounce between slider moves and the preview
+    idle_timer = QtCore.QTimer(window)
+    idle_timer.setSingleShot(True)
+    idle_timer.setInterval(1500)  # ms without slider moves before the full resolution pass
+
+    def sync_sliders():
+        for slider, entry, steps in SLIDER_FIELDS:
+            try:
+                value = round(float(entry.text()) * steps)
+            except ValueError:
+                continue
+            slider.blockSignals(True)
+            slider.setValue(value)
+            slider.blockSignals(False)
+
+    def on_slider_moved(entry, value):
+        entry.setText(f"{value:g}")
+        if globals().get('image') is None:
+            return
+        # A full pass with the old values would overwrite the preview; drop it
+        # quietly so its cancellation does not replace the preview message either
+        runner.supersede()
+        ui.cancel_button.setEnabled(False)
+        preview_timer.start()
+        idle_timer.start()
+
+    def run_preview():
+        try:
+            params = get_settings(threshold_entry, offset_entry, token_entry, resolution_entry,
+                                  ui.offset_method.currentText(), curve_tolerance=ui.curve_tolerance.value())
+            traced_contours, offset_contours, scale, message = preview_contours(image, params)
+            clear_canvas(canvas, keep_original=True)
+            if traced_contours is not None:
+                display_contours(image, traced_contours, canvas, 2, "Traced (preview)", (0, 255, 0), scale)
+                display_contours(image, offset_contours, canvas, 3, "Offset (preview)", (255, 0, 0), scale)
+            console_text.setText(message)
+        except Exception as e:
+            console_text.setText(f"Error previewing image: {str(e)}")
+            print(traceback.format_exc())
+
+    def run_full_pass():
+        idle_timer.stop()
+        preview_timer.stop()
+        process_image()
+
+    runner = ProcessingRunner(on_processing_progress, on_processing_finished, on_processing_failed,
+                              on_processing_cancelled, window)
+
     def save_defaults():
         try:
             defaults_path = os.path.join(os.path.dirname(__file__), "default_settings.txt")
@@ -151,10 +328,52 @@ def main():
                 f.write(f"offset={offset_entry.text()}\n")
                 f.write(f"token={token_entry.text()}\n")
                 f.write(f"resolution={resolution_entry.text()}\n")
+                f.write(f"offset_method={ui.offset_method.currentText()}\n")
+                f.write(f"curve_tolerance={ui.curve_tolerance.value():g}\n")
+                f.write(f"shape_tolerance={ui.shape_tolerance.value():g}\n")
+                f.write(f"merge_outlines={int(ui.merge_outlines.isChecked())}\n")
+                f.write(f"chamfer_method={'layers' if ui.chamfer_layers.isChecked() else 'minkowski'}\n")
             console_text.setText("Defaults saved.")
         except Exception as e:
             console_text.setText(f"Error saving defaults: {str(e)}")
 
+    def toggle_trusted_rig(checked):
+        if not checked:
+            pipeline_cache.rig = None
+            return
+        rig = RigScale.load()
+        if rig is None:
+            console_text.setText("No rig scale saved for this camera calibration. Load an image with the token and press Save Rig Scale.")
+            ui.trusted_rig.setChecked(False)
+            return
+        pipeline_cache.rig = rig
+        console_text.setText(f"Trusted rig scale: {rig.px_per_inch:.2f} px/in")
+
+    def save_rig():
+        if globals().get('image') is None:
+            console_text.setText("No image loaded. Please load an image with the token first.")
+            return
+        if not pipeline_cache.lock.acquire(blocking=False):
+            console_text.setText("Processing is still running, save the rig scale when it has finished.")
+            return
+        try:
+            threshold_input = float(threshold_entry.text())
+            token = float(token_entry.text())
+            pipeline_cache.set_image(image)
+            match = pipeline_cache.token(threshold_input)
+            if match is None:
+                console_text.setText("No token found in this image, adjust the threshold and try again.")
+                return
+            save_rig_scale(match.diameter / token, image.shape, token)
+            console_text.setText(f"Saved rig scale {match.diameter / token:.2f} px/in to {RIG_SCALE_FILE}")
+            if ui.trusted_rig.isChecked():
+                toggle_trusted_rig(True)
+        except Exception as e:
+            console_text.setText(f"Error saving rig scale: {str(e)}")
+            print(traceback.format_exc())
+        finally:
+            pipeline_cache.lock.release()
+
     def launch_capture_image():
         folder_name = ui.lineEdit.text().strip()
         if not folder_name:
@@ -167,10 +386,20 @@ def main():
 
     load_button.clicked.connect(load_image)
     process_button.clicked.connect(lambda: process_image(splitDXF=ui.splitDXF.isChecked()))
-    import_button.clicked.connect(lambda: import_to_openscad(import_button.dxf_path, import_button.gridx_size, import_button.gridy_size, console_text, file_name, import_button.folder_name, ui.splitDXF.isChecked()))
+    import_button.clicked.connect(lambda: import_to_openscad(console_text, import_button.file_name, import_button.folder_name))
     exit_button.clicked.connect(lambda: exit_application(console_text))
     ui.SaveDefault.clicked.connect(save_defaults)
     ui.captureImage.clicked.connect(launch_capture_image)
+    ui.cancel_button.clicked.connect(runner.cancel)
+    for slider, entry, steps in SLIDER_FIELDS:
+        slider.valueChanged.connect(lambda value, entry=entry, steps=steps: on_slider_moved(entry, value / steps))
+        slider.sliderReleased.connect(run_full_pass)
+        entry.editingFinished.connect(sync_sliders)
+    preview_timer.timeout.connect(run_preview)
+    idle_timer.timeout.connect(run_full_pass)
+    sync_sliders()
+    ui.trusted_rig.toggled.connect(toggle_trusted_rig)
+    ui.save_rig.clicked.connect(save_rig)
     
     window.showMaximized()  # Show the main window in maximized view
     app.exec_()
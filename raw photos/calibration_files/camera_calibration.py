@@ -3,6 +3,10 @@ import cv2
 import glob
 import os
 import pickle
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from src.undistortion import Undistorter  # type: ignore
 
 # Camera calibration parameters
 # You can modify these variables as needed
@@ -113,19 +117,14 @@ def undistort_images(mtx, dist):
     
     print(f"Undistorting {len(images)} images...")
     
+    # Remap tables are built once per image size and saved next to calibration_data.pkl
+    undistorter = Undistorter(mtx, dist, os.getcwd())
+    
     for idx, fname in enumerate(images):
         img = cv2.imread(fname)
-        h, w = img.shape[:2]
-        
-        # Refine camera matrix based on free scaling parameter
-        newcameramtx, roi = cv2.getOptimalNewCameraMatrix(mtx, dist, (w, h), 1, (w, h))
-        
-        # Undistort image
-        dst = cv2.undistort(img, mtx, dist, None, newcameramtx)
         
-        # Crop the image (optional)
-        x, y, w, h = roi
-        dst = dst[y:y+h, x:x+w]
+        # Undistort image, cropped to the valid region
+        dst = undistorter(img)
         
         # Save undistorted image directly in the current directory
         output_img_path = f'undistorted_{os.path.basename(fname)}'
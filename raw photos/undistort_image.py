@@ -1,9 +1,13 @@
 import cv2
 import pickle
 import os
+import sys
 from tkinter import Tk
 from tkinter.filedialog import askopenfilename
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.undistortion import Undistorter  # type: ignore
+
 # Path to calibration data
 CALIBRATION_FILE = 'calibration_files/calibration_data.pkl'
 UNDISTORTED_IMAGES_DIR = '../Design Files'
@@ -28,31 +32,19 @@ def load_calibration_data(calibration_file):
     
     return data['camera_matrix'], data['distortion_coefficients']
 
-def undistort_image(img, mtx, dist):
+def undistort_image(img, undistorter):
     """
     Undistort a single image using the calibration data.
     
     Args:
         img: Input image as a numpy array.
-        mtx: Camera matrix.
-        dist: Distortion coefficients.
+        undistorter: Undistorter holding the camera matrix and distortion
+            coefficients; its remap tables are built once per image size.
     
     Returns:
-        dst: Undistorted image as a numpy array.
+        dst: Undistorted image as a numpy array, cropped to the valid region.
     """
-    h, w = img.shape[:2]
-    
-    # Refine camera matrix based on free scaling parameter
-    newcameramtx, roi = cv2.getOptimalNewCameraMatrix(mtx, dist, (w, h), 1, (w, h))
-    
-    # Undistort image
-    dst = cv2.undistort(img, mtx, dist, None, newcameramtx)
-    
-    # Crop the image (optional)
-    x, y, w, h = roi
-    dst = dst[y:y+h, x:x+w]
-    
-    return dst
+    return undistorter(img)
 
 def save_image(dst, output_dir, image_name):
     """
@@ -81,6 +73,9 @@ def main():
         print("Failed to load calibration data. Exiting.")
         return
     
+    # Remap tables are saved next to the calibration data for the next run
+    undistorter = Undistorter(mtx, dist, os.path.dirname(os.path.abspath(CALIBRATION_FILE)))
+    
     # Directory to save undistorted images
     output_dir = UNDISTORTED_IMAGES_DIR
     if not os.path.exists(output_dir):
@@ -102,7 +97,7 @@ def main():
             continue
         
         # Undistort the image
-        dst = undistort_image(img, mtx, dist)
+        dst = undistort_image(img, undistorter)
         
         # Save the undistorted image
         save_image(dst, output_dir, image_file)
@@ -0,0 +1,167 @@
+"""
+Headless batch version of Step 1.
+
+Runs every photo in a folder through the same pipeline the GUI uses, one
+image per worker process, and writes a per-image summary next to the
+generated DXF/SCAD files (each image also gets its own manifest). No
+display or clipboard is needed.
+
+Usage (from the repository root):
+    python -m src.batch_process "Tool Cart 3" --threshold 145 --offset 0.1 --token 3 --resolution 20
+"""
+import argparse
+import concurrent.futures
+import csv
+import os
+import sys
+import time
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.pipeline import process_image_file, curve_fit_report, ProcessParams, OFFSET_METHODS  # type: ignore
+from src.preflight import format_problem  # type: ignore
+from src.primitives import shape_summary  # type: ignore
+from src.dxf_writer import DXF_WRITERS  # type: ignore
+from src.chamfer import CHAMFER_METHODS  # type: ignore
+from src.image_io import IMAGE_EXTENSIONS  # type: ignore
+from src.token_detector import TokenDetector  # type: ignore
+from src.rig_calibration import RigScale, load_rig_scale  # type: ignore
+
+SUMMARY_FIELDS = ["file_name", "contour_count", "gridx_size", "gridy_size", "token_confidence", "token_source",
+                  "vertices_before", "vertices_after", "max_error_mm", "shapes", "geometry_errors", "geometry_warnings", "total_time", "error"]
+
+
+def find_images(folder):
+    return sorted(
+        os.path.join(folder, f) for f in os.listdir(folder)
+        if f.lower().endswith(IMAGE_EXTENSIONS) and not f.startswith('_')
+    )
+
+
+_token_detector = None
+_rig = None
+
+
+def _process_one(job, px_per_inch=None, rig_shape=None):
+    # One OpenCV thread per worker, the pool already uses every core
+    import cv2
+    cv2.setNumThreads(1)
+    # Each worker keeps its detector so the token position from the last
+    # photo it processed is searched first
+    global _token_detector, _rig
+    if _token_detector is None:
+        _token_detector = TokenDetector()
+    if px_per_inch is not None and _rig is None:
+        _rig = RigScale(px_per_inch, rig_shape, background=False)
+    return process_image_file(token_detector=_token_detector, rig=_rig, **job)
+
+
+def run_batch(image_folder, output_folder, params, workers=None, px_per_inch=None, validate=False, rig_shape=None):
+    images = find_images(image_folder)
+    jobs = [dict(image_path=path, folder_name=output_folder, params=params, validate=validate) for path in images]
+    summaries = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_process_one, job, px_per_inch, rig_shape) for job in jobs]
+        for future in concurrent.futures.as_completed(futures):
+            summary = future.result()
+            summaries.append(summary)
+            print(format_summary_line(summary))
+            for warning in summary.get("warnings", []):
+                print(f"  WARNING: {warning}")
+            for problem in summary.get("problems", []):
+                print(f"  {format_problem(problem)}")
+    summaries.sort(key=lambda s: s["file_name"])
+    return summaries
+
+
+def format_summary_line(summary):
+    if summary["error"]:
+        return f"{summary['file_name']}: FAILED ({summary['error']})"
+    timings = ", ".join(f"{stage} {seconds * 1000:.0f} ms" for stage, seconds in summary["timings"].items())
+    line = (f"{summary['file_name']}: {summary['contour_count']} contours, "
+            f"grid {summary['gridx_size']}x{summary['gridy_size']} [{timings}]")
+    if "vertices_after" in summary:
+        line += f"\n  {curve_fit_report(summary)}"
+    if "shape_data" in summary:
+        line += f"\n  {shape_summary(summary['shape_data'], summary['contour_count'] - summary['shapes'])}"
+    return line
+
+
+def write_summary(summaries, output_folder):
+    stages = []
+    for summary in summaries:
+        for stage in summary["timings"]:
+            if stage not in stages:
+                stages.append(stage)
+    summary_path = os.path.join(output_folder, "batch_summary.csv")
+    with open(summary_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_FIELDS + [f"{stage}_time" for stage in stages])
+        for summary in summaries:
+            row = [summary.get(field, "") for field in SUMMARY_FIELDS]
+            row += [round(summary["timings"].get(stage, 0), 4) for stage in stages]
+            writer.writerow(row)
+    return summary_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Turn a folder of tool photos into DXF + SCAD files.")
+    parser.add_argument("image_folder", help="Folder of photos (files starting with '_' are unedited captures and are skipped)")
+    parser.add_argument("--output", help="Project folder for the design files (default: the image folder)")
+    parser.add_argument("--threshold", type=float, default=110)
+    parser.add_argument("--offset", type=float, default=0.1, help="Offset in inches")
+    parser.add_argument("--token", type=float, default=3.0, help="Token diameter in inches")
+    parser.add_argument("--resolution", type=float, default=10)
+    parser.add_argument("--offset-method", choices=OFFSET_METHODS, default="raster",
+                        help="raster: dilate the mask; distance: distance-transform raster offset; "
+                             "polygon: offset the traced outline exactly (needs pyclipper)")
+    parser.add_argument("--single-dxf", action="store_true", help="Write one combined DXF per image instead of one per tool")
+    parser.add_argument("--dxf-writer", choices=DXF_WRITERS, default="fast",
+                        help="fast: stream R12 DXF straight to disk; ezdxf: build each file with ezdxf")
+    parser.add_argument("--curve-tolerance", type=float, default=0.0, metavar="MM",
+                        help="Fit the outlines with lines and arcs within this many mm instead of simplifying "
+                             "with --resolution (0: off)")
+    parser.add_argument("--shape-tolerance", type=float, default=0.0, metavar="MM",
+                        help="Cut outlines within this many mm of a circle or a rectangle as shape_data primitives "
+                             "instead of DXFs (0: off)")
+    parser.add_argument("--merge-outlines", action="store_true",
+                        help="Merge tool outlines that overlap or touch into one before export (needs pyclipper)")
+    parser.add_argument("--chamfer-method", choices=CHAMFER_METHODS, default="minkowski",
+                        help="minkowski: the template's cone chamfer; layers: write stacked chamfer slices next to "
+                             "every DXF and build the chamfer from them, much faster to render (needs pyclipper)")
+    parser.add_argument("--validate-dxf", action="store_true", help="Read every DXF back with ezdxf and fail the image if it is wrong")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per core)")
+    parser.add_argument("--trusted-rig", action="store_true",
+                        help="Use the saved rig px/inch instead of detecting the token (see src/rig_calibration.py)")
+    args = parser.parse_args(argv)
+    if args.offset <= 0 or args.token <= 0:
+        parser.error("--offset and --token must be greater than 0")
+
+    px_per_inch = rig_shape = None
+    if args.trusted_rig:
+        rig_data = load_rig_scale()
+        if rig_data is None:
+            print("No usable rig scale saved, run python -m src.rig_calibration first.")
+            return 1
+        px_per_inch = rig_data['px_per_inch']
+        rig_shape = rig_data.get('image_shape')
+
+    output_folder = os.path.abspath(args.output or args.image_folder)
+    os.makedirs(output_folder, exist_ok=True)
+    start = time.perf_counter()
+    params = ProcessParams(args.threshold, args.offset, args.token, args.resolution, args.offset_method,
+                           splitDXF=not args.single_dxf, dxf_writer=args.dxf_writer,
+                           curve_tolerance=args.curve_tolerance, shape_tolerance=args.shape_tolerance,
+                           merge_outlines=args.merge_outlines, chamfer_method=args.chamfer_method)
+    summaries = run_batch(args.image_folder, output_folder, params, workers=args.workers, px_per_inch=px_per_inch,
+                          validate=args.validate_dxf, rig_shape=rig_shape)
+    summary_path = write_summary(summaries, output_folder)
+    failed = sum(1 for s in summaries if s["error"])
+    print(f"Processed {len(summaries)} images ({failed} failed) in {time.perf_counter() - start:.1f} s")
+    print(f"Summary written to {summary_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
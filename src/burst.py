@@ -0,0 +1,127 @@
+"""
+Multi-frame denoising of a burst of webcam frames.
+
+Sensor noise makes the edges in the 8-bit threshold mask ragged, which
+costs MORPH_OPEN, approxPolyDP and the vertex count downstream. Over a
+burst of N frames of a still scene the noise averages out: the per-pixel
+mean lowers it by about sqrt(N), the per-pixel median by a little less
+but also rejects outliers (a flickering light, a hand in one frame).
+
+Frames are first aligned to the first one by phase correlation on a
+downscaled grey copy, in case the camera was knocked; shifts below
+MIN_SHIFT px are left alone (a fixed rig never moves). cv2.phaseCorrelate
+has a constant sub-pixel bias on some image sizes (up to half a pixel, so
+a full pixel after scaling back up), which is measured by correlating the
+first frame with itself and subtracted. A weak correlation peak (a flat
+or featureless scene, where the peak is noise) counts as no shift.
+
+The median is taken with an odd-even transposition sorting network of
+np.minimum / np.maximum over row strips of the frames, which is many
+times faster than np.median over a stacked axis. Noise is measured
+before and after with Immerkaer's fast noise estimate.
+"""
+import collections
+import time
+
+import cv2
+import numpy as np
+
+MERGE_METHODS = ("median", "mean")
+MIN_SHIFT = 0.5  # px, smaller shifts are not corrected
+ALIGN_SCALE = 0.5  # phase correlation runs at this scale (coarser scales misjudge the shift)
+MIN_RESPONSE = 0.2  # weaker phase correlation peaks are noise, not a shift
+STRIP_ROWS = 64  # rows merged at a time, so the strips of all frames stay in cache
+
+# image: merged frame; frames: frames merged; method: "median" or "mean";
+# noise_before / noise_after: estimated noise sigma of the first frame and
+# of the result (grey levels); shifts: (dx, dy) of each frame against the
+# first, in px; seconds: time to align and merge.
+BurstResult = collections.namedtuple("BurstResult", ["image", "frames", "method", "noise_before", "noise_after",
+                                                     "shifts", "seconds"])
+
+
+def _grey(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+
+
+def estimate_noise(image):
+    """Noise sigma of an image in grey levels (Immerkaer 1996, fast noise variance estimation)."""
+    grey = _grey(image).astype(np.float32)
+    kernel = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+    response = cv2.filter2D(grey, -1, kernel)[1:-1, 1:-1]
+    h, w = grey.shape
+    return float(np.sqrt(np.pi / 2) * np.abs(response).sum() / (6 * (w - 2) * (h - 2)))
+
+
+def frame_shifts(frames, scale=ALIGN_SCALE):
+    """(dx, dy) in px of every frame against the first one, (0, 0) where the correlation is too weak to tell."""
+    def small(frame):
+        return cv2.resize(_grey(frame), None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    reference = small(frames[0])
+    window = cv2.createHanningWindow(reference.shape[::-1], cv2.CV_32F)
+    (bias_x, bias_y), _ = cv2.phaseCorrelate(reference, reference, window)
+    shifts = [(0.0, 0.0)]
+    for frame in frames[1:]:
+        (dx, dy), response = cv2.phaseCorrelate(reference, small(frame), window)
+        if response < MIN_RESPONSE:
+            shifts.append((0.0, 0.0))
+        else:
+            shifts.append(((dx - bias_x) / scale, (dy - bias_y) / scale))
+    return shifts
+
+
+def align_frames(frames, shifts, min_shift=MIN_SHIFT):
+    """Frames moved back onto the first one, where they moved by more than min_shift px."""
+    aligned = []
+    for frame, (dx, dy) in zip(frames, shifts):
+        if max(abs(dx), abs(dy)) < min_shift:
+            aligned.append(frame)
+            continue
+        matrix = np.float32([[1, 0, -dx], [0, 1, -dy]])
+        aligned.append(cv2.warpAffine(frame, matrix, frame.shape[1::-1], flags=cv2.INTER_LINEAR,
+                                      borderMode=cv2.BORDER_REPLICATE))
+    return aligned
+
+
+def _median_strip(strips):
+    values = list(strips)
+    n = len(values)
+    # Odd-even transposition sort, n rounds of compare-exchange between neighbours
+    for round_index in range(n):
+        for i in range(round_index % 2, n - 1, 2):
+            low = np.minimum(values[i], values[i + 1])
+            values[i + 1] = np.maximum(values[i], values[i + 1])
+            values[i] = low
+    if n % 2:
+        return values[n // 2]
+    return ((values[n // 2 - 1].astype(np.uint16) + values[n // 2] + 1) >> 1).astype(values[0].dtype)
+
+
+def merge_frames(frames, method="median"):
+    """Per-pixel median or mean of equally sized uint8 frames."""
+    if method not in MERGE_METHODS:
+        raise ValueError(f"Unknown merge method {method!r}, expected one of {MERGE_METHODS}")
+    if len(frames) == 1:
+        return frames[0].copy()
+    merged = np.empty_like(frames[0])
+    count = len(frames)
+    for row in range(0, merged.shape[0], STRIP_ROWS):
+        strips = [frame[row:row + STRIP_ROWS] for frame in frames]
+        if method == "median":
+            merged[row:row + STRIP_ROWS] = _median_strip(strips)
+        else:
+            total = np.zeros(strips[0].shape, dtype=np.uint16)  # up to 257 frames of uint8
+            for strip in strips:
+                total += strip
+            merged[row:row + STRIP_ROWS] = (total + count // 2) // count
+    return merged
+
+
+def denoise_burst(frames, method="median", align=True):
+    """Align and merge a burst of frames into one BurstResult."""
+    start = time.perf_counter()
+    shifts = frame_shifts(frames) if align and len(frames) > 1 else [(0.0, 0.0)] * len(frames)
+    merged = merge_frames(align_frames(frames, shifts), method)
+    seconds = time.perf_counter() - start
+    return BurstResult(merged, len(frames), method, estimate_noise(frames[0]), estimate_noise(merged), shifts, seconds)
@@ -6,33 +6,22 @@ import time
 import numpy as np
 from PyQt5 import QtWidgets, QtGui, QtCore
 from capture_image_ui import Ui_Dialog
+from undistortion import Undistorter
+from frame_grabber import FrameGrabber
+from image_io import SaveQueue, ENCODERS, IMAGE_EXTENSIONS
+from burst import denoise_burst, MERGE_METHODS, MIN_SHIFT
 import subprocess
 import threading
+import traceback
 import contextlib
+import concurrent.futures
 
 PROJECT_ROOT = os.path.dirname(os.path.dirname(__file__))
 CALIBRATION_FILE = os.path.join(PROJECT_ROOT, 'raw photos', 'calibration_files', 'calibration_data.pkl')
+STALL_TIMEOUT = 2.0  # s without a frame before the watchdog switches camera
+MAX_CAMERAS = 5  # camera indices probed
 SETTINGS_CACHE = os.path.join(PROJECT_ROOT, "camera_settings_cache.pkl")
 
-def load_calibration_data(calibration_file):
-    if not os.path.exists(calibration_file):
-        print(f"Calibration file not found: {calibration_file}")
-        return None, None
-    with open(calibration_file, 'rb') as f:
-        data = pickle.load(f)
-    return data['camera_matrix'], data['distortion_coefficients']
-
-def undistort_image(img, mtx, dist):
-    # If calibration data is missing, return the raw image
-    if mtx is None or dist is None:
-        return img
-    h, w = img.shape[:2]
-    newcameramtx, roi = cv2.getOptimalNewCameraMatrix(mtx, dist, (w, h), 1, (w, h))
-    dst = cv2.undistort(img, mtx, dist, None, newcameramtx)
-    x, y, w, h = roi
-    dst = dst[y:y+h, x:x+w]
-    return dst
-
 @contextlib.contextmanager
 def suppress_stderr():
     """Context manager to suppress stderr (for OpenCV warnings)."""
@@ -58,50 +47,101 @@ def try_read_frame(cap, timeout=2.0):
         return False, None
     return result['ret'], result['frame']
 
-def find_available_cameras(max_test=5, open_timeout=2.0, read_timeout=1.5):
+def probe_camera(i, open_timeout=2.0, read_timeout=1.5):
+    """True if camera index i opens and delivers a frame within the timeouts."""
+    cap = None
+    try:
+        start_time = time.time()
+        cap = cv2.VideoCapture(i)
+        while not cap.isOpened() and (time.time() - start_time) < open_timeout:
+            time.sleep(0.1)
+        if not cap.isOpened():
+            return False
+        # Try to read a frame with a timeout using a thread
+        ret, _ = try_read_frame(cap, timeout=read_timeout)
+        if ret:
+            print(f"Found camera at index {i}")
+        return ret
+    except Exception as e:
+        print(f"Camera index {i} caused an exception: {e}")
+        return False
+    finally:
+        if cap is not None:
+            cap.release()
+
+def find_available_cameras(max_test=MAX_CAMERAS, open_timeout=2.0, read_timeout=1.5, skip=()):
     """
-    Try to open each camera index up to max_test.
+    Try to open each camera index up to max_test, all at once.
     Skip indices that hang or error by using timeouts.
+    Indices in skip are already open (a camera cannot be opened twice) and count as available.
     Suppress OpenCV warnings during detection.
     """
-    available = []
+    with suppress_stderr(), concurrent.futures.ThreadPoolExecutor(max_workers=max_test) as executor:
+        found = list(executor.map(lambda i: i in skip or probe_camera(i, open_timeout, read_timeout), range(max_test)))
+    return [i for i, ok in enumerate(found) if ok]
+
+def camera_identity(idx):
+    """
+    Name of camera idx that survives re-enumeration: on Linux the V4L2
+    device name and the USB port it is plugged into, elsewhere the index.
+    """
+    sys_path = f"/sys/class/video4linux/video{idx}"
+    try:
+        with open(os.path.join(sys_path, "name")) as f:
+            name = f.read().strip()
+        return f"{name}@{os.path.basename(os.path.realpath(os.path.join(sys_path, 'device')))}"
+    except OSError:
+        return f"index {idx}"
+
+def find_camera_index(identity, max_test=MAX_CAMERAS):
     for i in range(max_test):
-        cap = None
+        if camera_identity(i) == identity:
+            return i
+    return None
+
+def _load_settings_cache():
+    """{"last": identity, "cameras": {identity: {"idx", "width", "height"}}}"""
+    data = None
+    if os.path.exists(SETTINGS_CACHE):
         try:
-            with suppress_stderr():
-                start_time = time.time()
-                cap = cv2.VideoCapture(i)
-                while not cap.isOpened() and (time.time() - start_time) < open_timeout:
-                    time.sleep(0.1)
-                if not cap.isOpened():
-                    continue
-                # Try to read a frame with a timeout using a thread
-                ret, _ = try_read_frame(cap, timeout=read_timeout)
-                if ret:
-                    print(f"Found camera at index {i}")
-                    available.append(i)
-        except Exception as e:
-            print(f"Camera index {i} caused an exception: {e}")
-        finally:
-            if cap is not None:
-                cap.release()
-    return available
+            with open(SETTINGS_CACHE, "rb") as f:
+                data = pickle.load(f)
+        except Exception:
+            pass
+    if not isinstance(data, dict):
+        return {"last": None, "cameras": {}}
+    if "cameras" not in data and "idx" in data:
+        # Single camera cache of older versions, keyed by index only
+        identity = camera_identity(data["idx"])
+        return {"last": identity, "cameras": {identity: data}}
+    return data
 
 def cache_camera_settings(idx, width, height):
     try:
+        data = _load_settings_cache()
+        identity = camera_identity(idx)
+        data["cameras"][identity] = {"idx": idx, "width": width, "height": height}
+        data["last"] = identity
         with open(SETTINGS_CACHE, "wb") as f:
-            pickle.dump({"idx": idx, "width": width, "height": height}, f)
+            pickle.dump(data, f)
     except Exception as e:
         print(f"Could not cache camera settings: {e}")
 
+def cached_resolution(idx):
+    """Cached (width, height) of camera idx, (None, None) if it has none."""
+    settings = _load_settings_cache()["cameras"].get(camera_identity(idx))
+    return (settings["width"], settings["height"]) if settings else (None, None)
+
 def load_cached_camera_settings():
-    if os.path.exists(SETTINGS_CACHE):
-        try:
-            with open(SETTINGS_CACHE, "rb") as f:
-                return pickle.load(f)
-        except Exception:
-            pass
-    return None
+    """Settings of the last used camera with its current index, or None if it is not connected."""
+    data = _load_settings_cache()
+    settings = data["cameras"].get(data["last"])
+    if settings is None:
+        return None
+    idx = find_camera_index(data["last"])
+    if idx is None:
+        return None
+    return dict(settings, idx=idx, identity=data["last"])
 
 def open_camera(idx, width=None, height=None):
     cap = cv2.VideoCapture(idx)
@@ -115,6 +155,7 @@ def open_camera(idx, width=None, height=None):
         actual_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         actual_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         print(f"Camera {idx} set to cached resolution: {actual_width}x{actual_height}")
+        cache_camera_settings(idx, actual_width, actual_height)  # now the last used camera
         return cap
 
     preferred_resolutions = [
@@ -155,7 +196,7 @@ def get_save_folder(project_folder):
     return save_folder
 
 def find_photos(folder):
-    return [f for f in os.listdir(folder) if f.lower().endswith(('.jpg', '.jpeg', '.png')) and f.startswith('_')]
+    return [f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS) and f.startswith('_')]
 
 def open_in_paint(filepath):
     try:
@@ -163,6 +204,15 @@ def open_in_paint(filepath):
     except Exception as e:
         QtWidgets.QMessageBox.critical(None, "Error", f"Could not open image in Paint: {e}")
 
+class CameraListSignals(QtCore.QObject):
+    found = QtCore.pyqtSignal(list)  # camera indices, emitted from the discovery thread
+
+class SaveSignals(QtCore.QObject):
+    saved = QtCore.pyqtSignal(object, object)  # SaveResult, exception; emitted from the save thread
+
+class BurstSignals(QtCore.QObject):
+    done = QtCore.pyqtSignal(object, object)  # BurstResult, error message; emitted from the burst thread
+
 class CaptureImageDialog(QtWidgets.QDialog):
     def __init__(self, save_folder, parent=None):
         super().__init__(parent)
@@ -170,18 +220,49 @@ class CaptureImageDialog(QtWidgets.QDialog):
         self.ui.setupUi(self)
         self.save_folder = save_folder
         self.img_counter = 0
-        self.cameras = find_available_cameras()
-        self.cam_pos = len(self.cameras) - 1 if self.cameras else 0
-        self.current_cam_idx = self.cameras[self.cam_pos] if self.cameras else 0
-        self.cap = None
+        # The last used camera opens right away at its cached resolution, the full
+        # probe of every index runs in the background and fills in the camera list
+        self.cached = load_cached_camera_settings()
+        self.cameras = [self.cached["idx"]] if self.cached else []
+        self.cam_pos = 0
+        self.current_cam_idx = self.cameras[0] if self.cameras else 0
+        self.camera_signals = CameraListSignals(self)
+        self.camera_signals.found.connect(self.on_cameras_found)
+        self.grabber = None  # FrameGrabber reading the open camera on its own thread
+        self.last_seq = 0  # newest frame shown
         self.timer = QtCore.QTimer(self)
         self.timer.timeout.connect(self.update_frame)
-        self.mtx, self.dist = load_calibration_data(CALIBRATION_FILE)
-        self.cached = load_cached_camera_settings()
+        # Remap tables are built once per resolution and saved next to the calibration
+        self.undistorter = Undistorter.load(CALIBRATION_FILE)
         self.setWindowTitle("Capture Image")
         self.running = True
-        self.failed_frame_count = 0  # Track consecutive frame failures
-        self.max_failed_frames = 1   # Switch camera after this many failures
+
+        # Photos are undistorted, encoded and written on a background thread
+        self.encoder = QtWidgets.QComboBox(self)
+        self.encoder.addItems(list(ENCODERS))
+        self.encoder.setToolTip("jpeg: fast and small, lossy. png: lossless. npy: raw pixels, no encoding at all.")
+        self.ui.gridLayout.addWidget(self.encoder, 2, 1, 1, 1)
+        self.save_signals = SaveSignals(self)
+        self.save_signals.saved.connect(self.on_image_saved)
+        self.save_queue = SaveQueue(on_saved=self.emit_saved)
+
+        # Burst mode: N frames merged into one low-noise photo on a background thread
+        self.burst_frames = QtWidgets.QSpinBox(self)
+        self.burst_frames.setRange(1, 16)
+        self.burst_frames.setSpecialValueText("Burst off")
+        self.burst_frames.setSuffix(" frame burst")
+        self.burst_frames.setToolTip("Merge this many frames into one photo for less sensor noise. Hold the camera still.")
+        self.burst_method = QtWidgets.QComboBox(self)
+        self.burst_method.addItems(list(MERGE_METHODS))
+        self.burst_method.setToolTip("median: rejects outliers such as a hand in one frame. mean: lowest noise.")
+        burst_layout = QtWidgets.QHBoxLayout()
+        burst_layout.addWidget(self.burst_frames)
+        burst_layout.addWidget(self.burst_method)
+        self.ui.gridLayout.addLayout(burst_layout, 4, 1, 1, 1)
+        self.burst_signals = BurstSignals(self)
+        self.burst_signals.done.connect(self.on_burst_done)
+        self.burst_running = False
+        self.burst_thread = None
 
         # Connect UI signals
         self.ui.buttonCaptureImage.clicked.connect(self.capture_image)
@@ -200,44 +281,98 @@ class CaptureImageDialog(QtWidgets.QDialog):
         self.shortcut_capture.activated.connect(self.capture_image)
 
         self.toggle_capture_button()  # Initial state
-        self.open_camera_and_start()
+        if self.cameras and self.start_grabber():
+            self.timer.start(30)
+        else:
+            self.cameras = []
+            self.ui.labelConsole.setText("Looking for cameras...")
+        self.discover_cameras()
         self.reload_image_list()
 
+    def discover_cameras(self):
+        # The open camera cannot be probed again while the grabber holds it
+        skip = (self.current_cam_idx,) if self.grabber is not None else ()
+
+        def discover():
+            cameras = find_available_cameras(skip=skip)
+            try:
+                self.camera_signals.found.emit(cameras)
+            except RuntimeError:
+                pass  # The dialog was closed first
+
+        threading.Thread(target=discover, name="camera-discovery", daemon=True).start()
+
+    def on_cameras_found(self, cameras):
+        if not self.running:
+            return
+        print(f"Cameras found: {cameras}")
+        if self.grabber is not None:
+            if self.current_cam_idx not in cameras:
+                cameras = sorted(cameras + [self.current_cam_idx])
+            self.cameras = cameras
+            self.cam_pos = cameras.index(self.current_cam_idx)
+            return
+        self.cameras = cameras
+        self.cam_pos = len(self.cameras) - 1 if self.cameras else 0
+        self.current_cam_idx = self.cameras[self.cam_pos] if self.cameras else 0
+        self.ui.labelConsole.setText("")
+        self.open_camera_and_start()
+
     def toggle_capture_button(self):
         self.ui.buttonCaptureImage.setEnabled(bool(self.ui.lineeditImageName.text().strip()))
 
+    def start_grabber(self):
+        """Open the current camera and start its grabber thread; False if it would not open."""
+        self.stop_grabber()
+        cap = open_camera(self.current_cam_idx, *cached_resolution(self.current_cam_idx))
+        if cap is None:
+            return False
+        self.grabber = FrameGrabber(cap, stall_timeout=STALL_TIMEOUT).start()
+        self.last_seq = 0
+        return True
+
+    def stop_grabber(self):
+        if self.grabber is not None:
+            print(f"Camera {self.current_cam_idx}: {self.grabber.frame_count} frames at {self.grabber.fps():.1f} fps, "
+                  f"{self.grabber.dropped} dropped, {self.grabber.failed_reads} failed reads")
+            self.grabber.stop()
+            self.grabber = None
+
     def open_camera_and_start(self):
-        if self.cap:
-            self.cap.release()
         if not self.cameras:
             QtWidgets.QMessageBox.critical(self, "Error", "No cameras available.")
             self.reject()
             return
-        self.cap = open_camera(self.current_cam_idx)
-        if self.cap is None:
+        if not self.start_grabber():
             QtWidgets.QMessageBox.critical(self, "Error", "Failed to open camera.")
             self.reject()
             return
         self.timer.start(30)
 
     def update_frame(self):
-        # Try to read a frame with a timeout
-        ret, frame = try_read_frame(self.cap, timeout=2.0)
-        if not ret:
-            self.failed_frame_count += 1
-            if self.failed_frame_count >= self.max_failed_frames:
-                print("Frame grab failed or timed out, switching camera.")
-                self.switch_camera()
-                self.failed_frame_count = 0
+        if self.grabber is None:
             return
-        self.failed_frame_count = 0
-        undistorted = undistort_image(frame, self.mtx, self.dist)
+        # Watchdog: the grabber thread has not delivered a frame for a while
+        if self.grabber.stalled():
+            print(f"No frame from camera {self.current_cam_idx} for {STALL_TIMEOUT:.0f} s, switching camera.")
+            self.switch_camera()
+            return
+        # Only the newest frame is shown, the tick never waits on the camera
+        latest = self.grabber.latest(self.last_seq)
+        if latest is None:
+            return
+        self.last_seq = latest.seq
+        frame = latest.frame
         # Resize for display
         display_size = (self.ui.canvasCamera.width(), self.ui.canvasCamera.height())
-        h, w = undistorted.shape[:2]
-        scale = min(display_size[0] / w, display_size[1] / h)
-        disp_w, disp_h = int(w * scale), int(h * scale)
-        undistorted_disp = cv2.resize(undistorted, (disp_w, disp_h), interpolation=cv2.INTER_AREA)
+        if self.undistorter is not None:
+            # Shrinks first, so only display pixels are remapped
+            undistorted_disp = self.undistorter.fit(frame, display_size)
+        else:
+            h, w = frame.shape[:2]
+            scale = min(display_size[0] / w, display_size[1] / h)
+            disp_w, disp_h = int(w * scale), int(h * scale)
+            undistorted_disp = cv2.resize(frame, (disp_w, disp_h), interpolation=cv2.INTER_AREA)
         # Convert to QImage and display
         rgb_image = cv2.cvtColor(undistorted_disp, cv2.COLOR_BGR2RGB)
         qimg = QtGui.QImage(rgb_image.data, rgb_image.shape[1], rgb_image.shape[0], rgb_image.strides[0], QtGui.QImage.Format_RGB888)
@@ -248,42 +383,114 @@ class CaptureImageDialog(QtWidgets.QDialog):
         self.ui.canvasCamera.fitInView(scene.itemsBoundingRect(), QtCore.Qt.KeepAspectRatio)
 
     def capture_image(self):
-        if not self.cap or not self.cap.isOpened():
+        if self.grabber is None:
             return
-        ret, frame = self.cap.read()
-        if not ret:
+        latest = self.grabber.latest()
+        if latest is None or self.grabber.stalled():
             QtWidgets.QMessageBox.warning(self, "Error", "Failed to capture image.")
             return
-        undistorted = undistort_image(frame, self.mtx, self.dist)
+        if self.burst_running:
+            self.ui.labelConsole.setText("Still capturing the last burst...")
+            return
         image_name = self.ui.lineeditImageName.text().strip()
         if not image_name:
             timestamp = time.strftime("%Y%m%d_%H%M%S")
-            filename = f"_capture_{timestamp}_{self.img_counter}.jpg"
+            filename = f"_capture_{timestamp}_{self.img_counter}"
         else:
-            filename = f"_{image_name}.jpg"
-        save_path = os.path.join(self.save_folder, filename)
-        cv2.imwrite(save_path, undistorted)
-        # Use labelConsole instead of popup
-        self.ui.labelConsole.setText(f"Saved image: {save_path}")
+            filename = f"_{image_name}"
+        path_stem = os.path.join(self.save_folder, filename)
+        frames = self.burst_frames.value()
+        if frames > 1:
+            self.start_burst(path_stem, frames)
+            # Use labelConsole instead of popup
+            self.ui.labelConsole.setText(f"Hold still... capturing {frames} frames for {filename}")
+        else:
+            # Returns at once, on_image_saved reports when the file is written
+            self.save_queue.submit(latest.frame, path_stem, self.encoder.currentText(), self.undistorter)
+            # Use labelConsole instead of popup
+            self.ui.labelConsole.setText(f"Saving {filename}... ({self.save_queue.pending} in the queue)")
         self.img_counter += 1
         # Clear and disable after capture
         self.ui.lineeditImageName.clear()
         self.ui.buttonCaptureImage.setEnabled(False)
+
+    def start_burst(self, path_stem, frames):
+        """Collect and merge a burst on a background thread, then queue the merged photo for saving."""
+        grabber, method, encoder = self.grabber, self.burst_method.currentText(), self.encoder.currentText()
+        self.burst_running = True
+
+        def run():
+            result, error = None, None
+            try:
+                burst = grabber.burst(frames)
+                if burst is None:
+                    error = "The camera stopped during the burst."
+                else:
+                    result = denoise_burst(burst, method)
+            except Exception as e:
+                traceback.print_exc()
+                error = str(e)
+            try:
+                self.burst_signals.done.emit(result, error)
+            except RuntimeError:
+                pass  # The dialog is gone
+            # Queued after the report above, so on_image_saved comes after it
+            if result is not None:
+                self.save_queue.submit(result.image, path_stem, encoder, self.undistorter)
+
+        self.burst_thread = threading.Thread(target=run, name="burst", daemon=True)
+        self.burst_thread.start()
+
+    def on_burst_done(self, result, error):
+        self.burst_running = False
+        if error is not None:
+            self.ui.labelConsole.setText(f"Burst capture failed: {error}")
+            return
+        reduction = result.noise_before / result.noise_after if result.noise_after > 0 else float("inf")
+        moved = max(max(abs(dx), abs(dy)) for dx, dy in result.shifts)
+        message = (f"Burst of {result.frames} frames merged ({result.method}) in {result.seconds * 1000:.0f} ms, "
+                   f"noise {result.noise_before:.2f} -> {result.noise_after:.2f} ({reduction:.1f}x lower)")
+        if moved >= MIN_SHIFT:
+            message += f", aligned frames that moved up to {moved:.1f} px"
+        print(message)
+        self.ui.labelConsole.setText(message + "\nSaving...")
+
+    def emit_saved(self, result, error):
+        try:
+            self.save_signals.saved.emit(result, error)
+        except RuntimeError:
+            pass  # The dialog is gone
+
+    def on_image_saved(self, result, error):
+        if error is not None:
+            self.ui.labelConsole.setText(f"Failed to save image: {error}")
+            return
+        message = (f"Saved image: {result.path}\n{result.size / 1e6:.1f} MB, queued {result.queued * 1000:.0f} ms, "
+                   f"encode {result.encode * 1000:.0f} ms, write {result.write * 1000:.0f} ms")
+        if self.save_queue.pending:
+            message += f", {self.save_queue.pending} more in the queue"
+        print(message.replace("\n", " - "))
+        self.ui.labelConsole.setText(message)
         self.reload_image_list()  # Reload the image list after saving
 
     def switch_camera(self):
         if not self.cameras:
             return
-        self.cap.release()
+        self.stop_grabber()
         self.cam_pos = (self.cam_pos + 1) % len(self.cameras)
         self.current_cam_idx = self.cameras[self.cam_pos]
-        self.cap = open_camera(self.current_cam_idx)
+        if not self.start_grabber():
+            self.ui.labelConsole.setText(f"Failed to open camera {self.current_cam_idx}.")
 
     def quit_app(self):
         self.running = False
         self.timer.stop()
-        if self.cap:
-            self.cap.release()
+        self.stop_grabber()
+        if self.burst_thread is not None:
+            self.burst_thread.join()  # A burst that was already merging still gets queued
+        if self.save_queue.pending:
+            print(f"Writing {self.save_queue.pending} queued photos...")
+        self.save_queue.close(wait=True)
         self.accept()
 
     def reload_image_list(self):
@@ -301,6 +508,9 @@ class CaptureImageDialog(QtWidgets.QDialog):
             QtWidgets.QMessageBox.warning(self, "No Selection", "Please select a photo to edit.")
             return
         filename = self.photo_list[index.row()]
+        if filename.lower().endswith(".npy"):
+            QtWidgets.QMessageBox.warning(self, "Raw Capture", "Raw .npy captures cannot be edited in Paint.")
+            return
         filepath = os.path.join(self.save_folder, filename)
         new_filename = filename[1:] if filename.startswith('_') else filename
         new_filepath = os.path.join(self.save_folder, new_filename)
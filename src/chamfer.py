@@ -0,0 +1,88 @@
+"""
+Precomputed chamfer slices for the Step 2 template.
+
+The template's original chamfer is a minkowski() of the imported outline
+with a rotate_extrude cone, whose cost grows with outline vertices times
+cone facets and dominates the render. The chamfer is the outline grown by
+t mm at t mm below the top of the cut, so it can just as well be stacked
+from a few flat slices: slice i of n is the outline grown by
+(i - 0.5) * height / n, extruded over its 1/n of the chamfer height. The
+stacked surface is never more than height / (2 n) away from the 45 degree
+cone; n is picked so that this plus the arc tolerance of the round joins
+stays within CHAMFER_TOLERANCE.
+
+With chamfer_method "layers" each DXF gets a `<name>_chamfer.dxf` next to
+it with slice i on layer `chamfer_i`, in the same inch units and centring
+as the outline file. The default "minkowski" writes no slices and leaves
+the template's chamfer as it was. Needs pyclipper; without it no slices
+are written and the template keeps the minkowski chamfer.
+"""
+import math
+
+import numpy as np
+
+from src.dxf_writer import write_dxf  # type: ignore
+
+try:
+    import pyclipper
+except ImportError:
+    pyclipper = None
+
+CHAMFER_METHODS = ("minkowski", "layers")
+CHAMFER_HEIGHT = 5.0  # mm, chamfer_height in the Step 2 template
+CHAMFER_TOLERANCE = 0.25  # mm, max distance of the stacked chamfer from the true cone
+CLIPPER_UNITS = 100000  # clipper integer units per inch (0.25 um)
+
+
+def chamfer_spec(method="layers", height=CHAMFER_HEIGHT, tolerance=CHAMFER_TOLERANCE):
+    """
+    What the chamfer files hold ({"height", "layers", "tolerance"}, mm), as
+    recorded in the manifest and the .scad file, or None when no slices are
+    written (the minkowski method, or no pyclipper).
+    """
+    if method != "layers" or pyclipper is None or height <= 0:
+        return None
+    return {"height": height, "layers": max(1, math.ceil(height / tolerance)), "tolerance": tolerance}
+
+
+def chamfer_offsets(spec):
+    """Outward offset of every slice in mm, bottom slice first."""
+    step = spec["height"] / spec["layers"]
+    return [(i + 0.5) * step for i in range(spec["layers"])]
+
+
+def chamfer_file_name(name):
+    return name + "_chamfer"
+
+
+def grow_polylines(polylines, distance_mm, arc_tolerance_mm):
+    """
+    Grow closed (n, 2) outlines in inches by `distance_mm` with round
+    joins. Holes (traced with the opposite orientation) shrink and outlines
+    that grow into each other merge, like the minkowski sum they replace.
+    """
+    clipper = pyclipper.PyclipperOffset(arc_tolerance=arc_tolerance_mm / 25.4 * CLIPPER_UNITS)
+    for points in polylines:
+        path = np.round(points * CLIPPER_UNITS).astype(np.int64).tolist()
+        if len(path) >= 3:
+            clipper.AddPath(path, pyclipper.JT_ROUND, pyclipper.ET_CLOSEDPOLYGON)
+    grown = clipper.Execute(distance_mm / 25.4 * CLIPPER_UNITS)
+    # Closed like the outline polylines: first point repeated at the end
+    return [np.vstack([path, path[:1]]) / CLIPPER_UNITS for path in map(np.asarray, grown)]
+
+
+def chamfer_layers(polylines, spec):
+    """[(layer name, polylines)] for the slices of one DXF file."""
+    # Stacking is off by at most height / (2 * layers) <= tolerance / 2, the joins get the other half.
+    # Where a flattened arc meets a neighbouring edge the chord is cut off up to ~2.2x its arc
+    # tolerance from the true arc (measured on the examples), hence / 6 rather than / 2.
+    arc_tolerance = spec["tolerance"] / 6
+    return [(f"chamfer_{i + 1}", grow_polylines(polylines, offset, arc_tolerance))
+            for i, offset in enumerate(chamfer_offsets(spec))]
+
+
+def write_chamfer_dxf(path, polylines, spec):
+    """Write the chamfer slices of one outline file as a layered DXF."""
+    layers = chamfer_layers(polylines, spec)
+    return write_dxf(path, [points for _, grown in layers for points in grown],
+                     [name for name, grown in layers for _ in grown])
@@ -0,0 +1,180 @@
+"""
+Error-bounded line / circular arc fitting for the tool outlines.
+
+approxPolyDP works to a px tolerance and can only keep vertices, so
+smooth tool curves come out as dense polylines. Here a closed outline is
+covered greedily with the longest lines and arcs that stay within a
+given distance of every outline point: from the current vertex the end
+point is pushed out (doubling, then bisecting) while a line or an arc
+through the start, end and the point farthest from the chord still fits.
+Lines are preferred, arcs are limited to half a turn.
+
+The result is a list of vertices with AutoCAD bulges (tan of a quarter of
+the included angle, positive counter-clockwise) from which DXF LINE / ARC
+entities are written. Units are whatever the points are in; the pipeline
+fits in inches, the DXF unit.
+"""
+import collections
+import math
+
+import numpy as np
+
+# vertices: (m, 2) start points of the m segments of the closed outline,
+# bulges: (m,) bulge of each segment (0 for a line), max_error: largest
+# distance of an outline point from the fitted curve, point_count: outline
+# points that were fitted.
+CurveFit = collections.namedtuple("CurveFit", ["vertices", "bulges", "max_error", "point_count"])
+MAX_SWEEP = math.pi  # longest arc, half a turn keeps the 3 point circle well conditioned
+
+
+def _ring(points):
+    """(n, 2) float64 points of a closed outline, without a repeated end point."""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) > 1 and np.array_equal(points[0], points[-1]):
+        points = points[:-1]
+    return points
+
+
+def line_error(points):
+    """Largest distance of `points` from the segment between the first and last one."""
+    a, b = points[0], points[-1]
+    ab = b - a
+    length_sq = ab @ ab
+    if length_sq == 0:
+        return float(np.linalg.norm(points - a, axis=1).max())
+    t = np.clip((points - a) @ ab / length_sq, 0, 1)
+    return float(np.linalg.norm(points - (a + t[:, None] * ab), axis=1).max())
+
+
+def circle_through(a, b, c):
+    """Centre and radius of the circle through three points, None if they are collinear."""
+    d = 2 * (a[0] * (b[1] - c[1]) + b[0] * (c[1] - a[1]) + c[0] * (a[1] - b[1]))
+    if abs(d) < 1e-12:
+        return None
+    a2, b2, c2 = a @ a, b @ b, c @ c
+    centre = np.array([(a2 * (b[1] - c[1]) + b2 * (c[1] - a[1]) + c2 * (a[1] - b[1])) / d,
+                       (a2 * (c[0] - b[0]) + b2 * (a[0] - c[0]) + c2 * (b[0] - a[0])) / d])
+    return centre, float(np.linalg.norm(a - centre))
+
+
+def arc_fit(points):
+    """
+    (bulge, max error) of the arc from the first to the last of `points`
+    through the point farthest from their chord, or None if there is no
+    such arc (collinear points, more than MAX_SWEEP, or points past its ends).
+    """
+    a, b = points[0], points[-1]
+    chord = b - a
+    side = chord[0] * (points[:, 1] - a[1]) - chord[1] * (points[:, 0] - a[0])
+    far = int(np.abs(side).argmax())
+    circle = circle_through(a, points[far], b)
+    if circle is None:
+        return None
+    centre, radius = circle
+    # An arc bulging to the right of a -> b runs counter-clockwise
+    ccw = side[far] < 0
+    direction = 1 if ccw else -1
+    start = math.atan2(a[1] - centre[1], a[0] - centre[0])
+    end = math.atan2(b[1] - centre[1], b[0] - centre[0])
+    sweep = (direction * (end - start)) % (2 * math.pi)
+    if sweep == 0 or sweep > MAX_SWEEP:
+        return None
+    offsets = points - centre
+    angles = (direction * (np.arctan2(offsets[:, 1], offsets[:, 0]) - start)) % (2 * math.pi)
+    # Every point must project onto the arc, not onto the rest of the circle
+    if np.any((angles > sweep + 1e-9) & (angles < 2 * math.pi - 1e-9)):
+        return None
+    error = float(np.abs(np.linalg.norm(offsets, axis=1) - radius).max())
+    return direction * math.tan(sweep / 4), error
+
+
+def segment_fit(points, tolerance):
+    """(bulge, error) of the best primitive for `points` within tolerance, or None."""
+    error = line_error(points)
+    if error <= tolerance:
+        return 0.0, error
+    if len(points) < 3:
+        return None
+    arc = arc_fit(points)
+    if arc is not None and arc[1] <= tolerance:
+        return arc
+    return None
+
+
+def fit_outline(points, tolerance):
+    """Cover a closed outline with lines and arcs within `tolerance` (see module docstring)."""
+    ring = _ring(points)
+    n = len(ring)
+    if n < 3:
+        return CurveFit(ring, np.zeros(n), 0.0, n)
+    closed = np.vstack([ring, ring[:1]])
+    vertices, bulges, max_error = [], [], 0.0
+    i = 0
+    while i < n:
+        # Two points always fit as a line
+        best_end, best = i + 1, (0.0, 0.0)
+        step = 1
+        bad = None
+        while best_end < n:
+            end = min(best_end + step, n)
+            fit = segment_fit(closed[i:end + 1], tolerance)
+            if fit is None:
+                bad = end
+                break
+            best_end, best = end, fit
+            step *= 2
+        if bad is not None:
+            low, high = best_end, bad
+            while high - low > 1:
+                middle = (low + high) // 2
+                fit = segment_fit(closed[i:middle + 1], tolerance)
+                if fit is None:
+                    high = middle
+                else:
+                    low, best = middle, fit
+            best_end = low
+        vertices.append(closed[i])
+        bulges.append(best[0])
+        max_error = max(max_error, best[1])
+        i = best_end
+    return CurveFit(np.array(vertices), np.array(bulges), max_error, n)
+
+
+def bulge_arc(p0, p1, bulge):
+    """(centre, radius, start angle, end angle) in radians, counter-clockwise from start to end."""
+    chord = p1 - p0
+    length = float(np.linalg.norm(chord))
+    sweep = 4 * math.atan(abs(bulge))
+    radius = length / (2 * math.sin(sweep / 2))
+    # The centre sits on the chord bisector, left of p0 -> p1 for a counter-clockwise arc
+    normal = np.array([-chord[1], chord[0]]) / length
+    distance = radius * math.cos(sweep / 2)
+    centre = (p0 + p1) / 2 + (normal if bulge > 0 else -normal) * distance
+    start = math.atan2(p0[1] - centre[1], p0[0] - centre[0])
+    end = math.atan2(p1[1] - centre[1], p1[0] - centre[0])
+    return (centre, radius, start, end) if bulge > 0 else (centre, radius, end, start)
+
+
+def fit_points(fit, tolerance):
+    """
+    Closed (n, 2) polyline of a CurveFit with every arc flattened to chords
+    within `tolerance`, first point repeated at the end.
+    """
+    points = []
+    count = len(fit.vertices)
+    for index in range(count):
+        p0, p1 = fit.vertices[index], fit.vertices[(index + 1) % count]
+        bulge = fit.bulges[index]
+        points.append(p0)
+        if bulge == 0:
+            continue
+        centre, radius, start, end = bulge_arc(p0, p1, bulge)
+        sweep = 4 * math.atan(abs(bulge))
+        step = 2 * math.acos(max(-1.0, 1 - tolerance / radius)) if radius > tolerance else sweep
+        chords = max(1, math.ceil(sweep / step))
+        angles = np.linspace(0, sweep, chords + 1)[1:-1]
+        first = math.atan2(p0[1] - centre[1], p0[0] - centre[0])
+        angles = first + angles * (1 if bulge > 0 else -1)
+        points.extend(centre + radius * np.column_stack([np.cos(angles), np.sin(angles)]))
+    points.append(fit.vertices[0])
+    return np.array(points)
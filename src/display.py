@@ -0,0 +1,116 @@
+"""
+numpy -> canvas display path.
+
+Each pane shows the photo at about a third of the canvas width, so panes
+are drawn from a display sized copy: the photo is downscaled once with
+INTER_AREA into a small per-photo pyramid, overlays are drawn on a copy of
+that level with the contours scaled to it, and the QImage wraps the numpy
+buffer directly (no PIL round trip). The only full copy of the pane left
+is QPixmap.fromImage.
+"""
+import cv2
+import numpy as np
+from PyQt5 import QtGui
+
+MAX_LEVELS = 4  # display sized copies kept per photo
+MAX_PHOTOS = 2  # photos with a cached pyramid (the loaded one and the last one)
+
+
+def fit_scale(shape, width, height):
+    """Scale that fits an image of `shape` into width x height, keeping the aspect ratio."""
+    return min(width / shape[1], height / shape[0])
+
+
+def numpy_to_qimage(array):
+    """
+    QImage viewing a uint8 BGR, BGRA or grayscale array without copying it
+    (rows may be padded, the stride is passed on). The array must stay
+    alive while the QImage is in use; QPixmap.fromImage makes its own copy.
+    """
+    if array.dtype != np.uint8:
+        array = np.clip(array, 0, 255).astype(np.uint8)
+    channels = 1 if array.ndim == 2 else array.shape[2]
+    if array.strides[-1] != 1 or (array.ndim == 3 and array.strides[1] != channels):
+        array = np.ascontiguousarray(array)
+    height, width = array.shape[:2]
+    if channels == 1:
+        image_format = QtGui.QImage.Format_Grayscale8
+    elif channels == 4:
+        image_format = QtGui.QImage.Format_ARGB32  # BGRA in memory on little endian
+    elif hasattr(QtGui.QImage, "Format_BGR888"):  # Qt 5.14+
+        image_format = QtGui.QImage.Format_BGR888
+    else:
+        array = cv2.cvtColor(array, cv2.COLOR_BGR2RGB)
+        image_format = QtGui.QImage.Format_RGB888
+    qimage = QtGui.QImage(array.data, width, height, array.strides[0], image_format)
+    qimage.ndarray = array  # keep the buffer alive as long as the QImage
+    return qimage
+
+
+class ImagePyramid:
+    """
+    Display sized copies of one photo. Each size is made once, downscaled
+    with INTER_AREA from the smallest cached copy still larger than it.
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self.levels = {}  # (width, height) -> array, in insertion order
+
+    def at(self, scale):
+        height, width = self.image.shape[:2]
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        if size == (width, height):
+            return self.image
+        level = self.levels.get(size)
+        if level is None:
+            if scale > 1:
+                # Small photos are enlarged to fill the pane
+                level = cv2.resize(self.image, size, interpolation=cv2.INTER_LINEAR)
+            else:
+                larger = [lvl for (w, h), lvl in self.levels.items() if w >= size[0] and h >= size[1]]
+                source = min(larger, key=lambda lvl: lvl.shape[1]) if larger else self.image
+                level = cv2.resize(source, size, interpolation=cv2.INTER_AREA)
+            if len(self.levels) >= MAX_LEVELS:
+                self.levels.pop(next(iter(self.levels)))
+            self.levels[size] = level
+        return level
+
+
+_pyramids = []
+
+
+def pyramid_for(image):
+    """The cached pyramid of this photo (by identity), creating it if needed."""
+    for pyramid in _pyramids:
+        if pyramid.image is image:
+            return pyramid
+    pyramid = ImagePyramid(image)
+    _pyramids.insert(0, pyramid)
+    del _pyramids[MAX_PHOTOS:]
+    return pyramid
+
+
+def draw_overlay(display, contours, scale, color):
+    """Draw contours given in full resolution px onto a display copy scaled by `scale`."""
+    thickness = max(1, round(min(display.shape[:2]) / 200))
+    points = [np.round(contour.reshape(-1, 2) * scale).astype(np.int32) for contour in contours if len(contour)]
+    cv2.polylines(display, points, True, color, thickness)
+
+
+def render_pixmap(image, width, height, overlays=()):
+    """
+    Pixmap of `image` fitted into width x height with overlays drawn at
+    display resolution. `overlays` holds (contours, color, source_scale)
+    where source_scale is the size of the image the contours were traced
+    on relative to `image` (1.0, or the preview proxy scale).
+    """
+    scale = fit_scale(image.shape, width, height)
+    display = pyramid_for(image).at(scale)
+    if overlays:
+        display = display.copy() if display.ndim == 3 else cv2.cvtColor(display, cv2.COLOR_GRAY2BGR)
+        # Scale from the actual level size, which is rounded to whole px
+        scale = display.shape[1] / image.shape[1]
+        for contours, color, source_scale in overlays:
+            draw_overlay(display, contours, scale / source_scale, color)
+    return QtGui.QPixmap.fromImage(numpy_to_qimage(display))
@@ -0,0 +1,127 @@
+"""
+Minimal DXF writer for the tool outlines.
+
+Writes AutoCAD R12 (AC1009) ASCII DXF: a header with the version and an
+ENTITIES section holding one POLYLINE per outline, which OpenSCAD, ezdxf
+and CAD programs all read. R12 needs no handles, tables or objects, so a
+whole file is one formatted string: every point of a contour is
+transformed in a single numpy operation and all its vertices are
+formatted with one % operation, with no per-point Python loop and no
+document object model. Outlines fitted with lines and arcs
+(src/curve_fit.py) are written as LINE and ARC entities, which OpenSCAD
+joins back into closed outlines. ezdxf stays available as the fallback
+writer and to validate files (validate_dxf); it is only imported there,
+so the fast writer works without it.
+"""
+import math
+
+import numpy as np
+
+from src.curve_fit import bulge_arc  # type: ignore
+
+DXF_WRITERS = ("fast", "ezdxf")
+HEADER = "0\nSECTION\n2\nHEADER\n9\n$ACADVER\n1\nAC1009\n0\nENDSEC\n0\nSECTION\n2\nENTITIES\n"
+FOOTER = "0\nENDSEC\n0\nEOF\n"
+# 66=1: vertices follow; 70=0: open, the first point is repeated at the end like the ezdxf path does.
+# The layer name (group 8) is filled in per polyline, "0" unless the caller names layers.
+POLYLINE = "0\nPOLYLINE\n8\n{layer}\n66\n1\n10\n0.0\n20\n0.0\n30\n0.0\n70\n0\n"
+VERTEX = "0\nVERTEX\n8\n{layer}\n10\n%.6f\n20\n%.6f\n30\n0.0\n"
+SEQEND = "0\nSEQEND\n8\n{layer}\n"
+LINE = "0\nLINE\n8\n0\n10\n%.6f\n20\n%.6f\n30\n0.0\n11\n%.6f\n21\n%.6f\n31\n0.0\n"
+# Angles in degrees, counter-clockwise from 50 to 51
+ARC = "0\nARC\n8\n0\n10\n%.6f\n20\n%.6f\n30\n0.0\n40\n%.6f\n50\n%.9f\n51\n%.9f\n"
+
+
+def polyline_points(contour, scale_factor, center_row, center_col):
+    """
+    (n, 2) DXF points of one contour in `scale_factor` units (inches for
+    the DXFs), transposed and centred on (center_row, center_col) px,
+    closed by repeating the first point.
+    """
+    pts = np.asarray(contour, dtype=np.float64).reshape(-1, 2)
+    points = np.empty_like(pts)
+    points[:, 0] = (pts[:, 1] - center_row) * scale_factor
+    points[:, 1] = (pts[:, 0] - center_col) * scale_factor
+    if len(points) and not np.array_equal(points[0], points[-1]):
+        points = np.vstack([points, points[:1]])
+    return points
+
+
+def polyline_text(points, layer="0"):
+    vertex = VERTEX.format(layer=layer)
+    return (POLYLINE.format(layer=layer) + (vertex * len(points)) % tuple(points.ravel().tolist())
+            + SEQEND.format(layer=layer))
+
+
+def write_dxf(path, polylines, layers=None):
+    """
+    Write a list of (n, 2) point arrays as one R12 DXF file, on layer "0"
+    or on the matching entry of `layers`.
+    """
+    layers = layers if layers is not None else ["0"] * len(polylines)
+    with open(path, "w", newline="\n") as f:
+        f.write(HEADER + "".join(polyline_text(points, layer) for points, layer in zip(polylines, layers)) + FOOTER)
+    return path
+
+
+def curve_text(fit):
+    """LINE / ARC entities of one closed CurveFit."""
+    parts = []
+    count = len(fit.vertices)
+    for index in range(count):
+        p0, p1 = fit.vertices[index], fit.vertices[(index + 1) % count]
+        bulge = fit.bulges[index]
+        if bulge == 0:
+            parts.append(LINE % (p0[0], p0[1], p1[0], p1[1]))
+        else:
+            centre, radius, start, end = bulge_arc(p0, p1, bulge)
+            parts.append(ARC % (centre[0], centre[1], radius, math.degrees(start) % 360, math.degrees(end) % 360))
+    return "".join(parts)
+
+
+def write_curves_dxf(path, fits):
+    """Write a list of CurveFit outlines as one R12 DXF file of LINE and ARC entities."""
+    with open(path, "w", newline="\n") as f:
+        f.write(HEADER + "".join(curve_text(fit) for fit in fits) + FOOTER)
+    return path
+
+
+def write_dxf_ezdxf(path, polylines):
+    """Same output through the ezdxf document model (the original writer)."""
+    import ezdxf
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    for points in polylines:
+        msp.add_lwpolyline(points.tolist())
+    doc.saveas(path)
+    return path
+
+
+def validate_dxf(path, polylines=None, fits=None):
+    """
+    Read a DXF back with ezdxf and audit it. When `polylines` is given
+    the outline and vertex counts must match, when `fits` (CurveFits) is
+    given the LINE / ARC entity count. Returns a list of problems, empty
+    when the file is fine.
+    """
+    import ezdxf
+    try:
+        doc = ezdxf.readfile(path)
+    except Exception as e:
+        return [f"{path}: unreadable ({e})"]
+    problems = [f"{path}: {error.message}" for error in doc.audit().errors]
+    entities = doc.modelspace().query("POLYLINE LWPOLYLINE")
+    if polylines is not None:
+        if len(entities) != len(polylines):
+            problems.append(f"{path}: {len(entities)} outlines, expected {len(polylines)}")
+        else:
+            for index, (entity, points) in enumerate(zip(entities, polylines)):
+                count = len(entity) if entity.dxftype() == "LWPOLYLINE" else len(entity.vertices)
+                if count != len(points):
+                    problems.append(f"{path}: outline {index + 1} has {count} points, expected {len(points)}")
+    if fits is not None:
+        segments = len(doc.modelspace().query("LINE ARC"))
+        expected = sum(len(fit.vertices) for fit in fits)
+        if segments != expected:
+            problems.append(f"{path}: {segments} lines and arcs, expected {expected}")
+    return problems
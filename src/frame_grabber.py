@@ -0,0 +1,131 @@
+"""
+Background frame grabbing for the capture window.
+
+One long-lived thread per open camera calls cap.read() in a loop and
+keeps only the newest few frames in a ring buffer, so the GUI thread
+never waits on the camera: the preview and Capture take the newest frame
+that is already there. Frames that were overwritten before anyone took
+them are counted as dropped.
+
+A camera that stops delivering frames is detected by a watchdog check
+(no frame for `stall_timeout` seconds) instead of a timeout on every
+read; a read that hangs forever only blocks the grabber thread, which is
+a daemon and releases the camera when the read returns.
+
+burst() collects the next N frames for multi-frame denoising
+(src/burst.py); it waits on the grabber, so call it off the GUI thread.
+"""
+import collections
+import threading
+import time
+
+# frame: BGR image; seq: number of the frame since the grabber started
+# (from 1); timestamp: time.monotonic() when it was read.
+Frame = collections.namedtuple("Frame", ["frame", "seq", "timestamp"])
+BUFFER_SIZE = 2  # frames kept
+FAILED_READ_PAUSE = 0.05  # s between retries after a failed read
+
+
+class FrameGrabber:
+    def __init__(self, cap, buffer_size=BUFFER_SIZE, stall_timeout=2.0):
+        self.cap = cap
+        self.stall_timeout = stall_timeout
+        self._buffer = collections.deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._new_frame = threading.Condition(self._lock)
+        self._stop = threading.Event()
+        self._thread = None
+        self._seq = 0
+        self._taken = 0  # seq of the newest frame handed out
+        self.failed_reads = 0
+        self.dropped = 0
+        self._started = None
+        self._last_frame_time = None
+        self._release_pending = False
+        self._finished = False
+
+    def start(self):
+        self._started = self._last_frame_time = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="frame-grabber", daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.is_set():
+            ret, frame = self.cap.read()
+            if not ret or frame is None:
+                self.failed_reads += 1
+                time.sleep(FAILED_READ_PAUSE)
+                continue
+            now = time.monotonic()
+            with self._lock:
+                self._seq += 1
+                self._buffer.append(Frame(frame, self._seq, now))
+                self._last_frame_time = now
+                self._new_frame.notify_all()
+        with self._lock:
+            self._finished = True
+            release = self._release_pending
+        if release:
+            self.cap.release()
+
+    def latest(self, newer_than=0):
+        """The newest Frame, or None if there is none newer than seq `newer_than`. Never blocks on the camera."""
+        with self._lock:
+            if not self._buffer or self._buffer[-1].seq <= newer_than:
+                return None
+            newest = self._buffer[-1]
+            if newest.seq > self._taken:
+                # Frames between the last one handed out and this one were never seen
+                self.dropped += newest.seq - self._taken - 1
+                self._taken = newest.seq
+            return newest
+
+    def burst(self, count, timeout=None):
+        """
+        The next `count` consecutive frames read after the call (images
+        only). Blocks until they are in; None if the camera stalls or stops
+        first. `timeout` (s) defaults to the stall timeout per frame.
+        """
+        timeout = timeout if timeout is not None else self.stall_timeout * count
+        deadline = time.monotonic() + timeout
+        frames = []
+        with self._lock:
+            seq = self._seq
+            while len(frames) < count:
+                remaining = deadline - time.monotonic()
+                if self._stop.is_set() or remaining <= 0:
+                    return None
+                self._new_frame.wait(remaining)
+                # The ring buffer is small, take every new frame before it is overwritten
+                frames += [item.frame for item in self._buffer if item.seq > seq]
+                seq = self._seq
+            self._taken = max(self._taken, seq)
+        return frames[:count]
+
+    @property
+    def frame_count(self):
+        return self._seq
+
+    def stalled(self):
+        """True when no frame has arrived for stall_timeout seconds (the watchdog)."""
+        with self._lock:
+            last = self._last_frame_time
+        return last is not None and time.monotonic() - last > self.stall_timeout
+
+    def fps(self):
+        elapsed = time.monotonic() - self._started if self._started else 0
+        return self._seq / elapsed if elapsed > 0 else 0.0
+
+    def stop(self, timeout=1.0):
+        """Stop grabbing and release the camera (once a hanging read returns, if one does)."""
+        self._stop.set()
+        with self._lock:
+            self._new_frame.notify_all()  # Wake burst() callers
+        if self._thread is not None:
+            self._thread.join(timeout)
+            with self._lock:
+                if not self._finished:
+                    self._release_pending = True
+                    return
+        self.cap.release()
@@ -0,0 +1,122 @@
+"""
+Capture image encoding and the background save queue.
+
+Saving a full resolution photo (undistort + encode + write) takes long
+enough to stall the capture preview on every shot, so the capture window
+hands frames to a SaveQueue and carries on. One worker thread undistorts,
+encodes and writes them in order; every save reports how long it waited
+in the queue and how long the work took.
+
+Encoders:
+    jpeg  libjpeg(-turbo) JPEG at quality 95, fast and small but lossy
+    png   lossless PNG at compression level 1, fast for a lossless format
+    npy   the raw BGR array as a numpy .npy file, no encoding at all
+
+Files are written under a temporary name and renamed when complete, so
+the image list never shows a half written photo. read_image() loads any
+of the three formats.
+"""
+import collections
+import concurrent.futures
+import io
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+ENCODERS = {
+    "jpeg": (".jpg", [cv2.IMWRITE_JPEG_QUALITY, 95]),
+    "png": (".png", [cv2.IMWRITE_PNG_COMPRESSION, 1]),
+    "npy": (".npy", None),
+}
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".npy")
+
+# path: written file; queued: s waiting for the worker; encode: s to undistort and
+# encode; write: s to write the file; size: bytes written.
+SaveResult = collections.namedtuple("SaveResult", ["path", "queued", "encode", "write", "size"])
+
+
+def read_image(path):
+    """BGR image from a photo file or a .npy capture, None if it cannot be read."""
+    if path.lower().endswith(".npy"):
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            return None
+    return cv2.imread(path)
+
+
+def encode_image(image, encoder="jpeg"):
+    """(file extension, encoded bytes) of an image."""
+    extension, params = ENCODERS[encoder]
+    if params is None:
+        buffer = io.BytesIO()
+        np.save(buffer, np.ascontiguousarray(image))
+        return extension, buffer.getvalue()
+    ok, data = cv2.imencode(extension, image, params)
+    if not ok:
+        raise ValueError(f"Could not encode the image as {encoder}")
+    return extension, data.tobytes()
+
+
+def save_image(image, path_stem, encoder="jpeg", transform=None, queued_at=None):
+    """
+    Encode and write one image as `path_stem` + the encoder's extension,
+    after applying `transform` (e.g. an Undistorter). Returns a SaveResult.
+    """
+    start = time.perf_counter()
+    if transform is not None:
+        image = transform(image)
+    extension, data = encode_image(image, encoder)
+    encoded = time.perf_counter()
+    path = path_stem + extension
+    tmp_path = f"{path}.{os.getpid()}.partial"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    queued = start - queued_at if queued_at is not None else 0.0
+    return SaveResult(path, queued, encoded - start, time.perf_counter() - encoded, len(data))
+
+
+class SaveQueue:
+    """
+    Saves images on one background thread, in the order they were
+    submitted. `on_saved(result, error)` is called on that thread after
+    every save; error is None or the exception.
+    """
+
+    def __init__(self, on_saved=None):
+        self.on_saved = on_saved
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="save-queue")
+        self._lock = threading.Lock()
+        self.pending = 0
+
+    def submit(self, image, path_stem, encoder="jpeg", transform=None):
+        """Queue one save and return its Future at once; the caller must not modify `image` afterwards."""
+        with self._lock:
+            self.pending += 1
+        return self._executor.submit(self._save, image, path_stem, encoder, transform, time.perf_counter())
+
+    def _save(self, image, path_stem, encoder, transform, queued_at):
+        result, error = None, None
+        try:
+            result = save_image(image, path_stem, encoder, transform, queued_at)
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            with self._lock:
+                self.pending -= 1
+            if self.on_saved is not None:
+                self.on_saved(result, error)
+
+    def close(self, wait=True):
+        """Stop taking saves; with `wait` block until every queued save is written."""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,85 @@
+"""
+Per-job manifest written next to the design files.
+
+Every processed image gets `<file_name>_manifest.json` in its project
+folder with everything later steps need: the parameters it ran with, the
+token diameter and scale, grid size, the DXF / SCAD paths and the contour
+positions the SCAD template is filled from. The tool contours themselves
+(in px) go into `<file_name>_contours.npz`. Files are replaced atomically,
+so several jobs can run at once and readers never see half a file.
+"""
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from src.contour_set import ContourSet  # type: ignore
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path(folder, file_name):
+    return os.path.join(folder, f"{file_name}_manifest.json")
+
+
+def contours_path(folder, file_name):
+    return os.path.join(folder, f"{file_name}_contours.npz")
+
+
+def _replace(path, write):
+    # Write to a temporary name in the same folder, then swap it in
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def write_manifest(folder, file_name, manifest, contours=None):
+    """
+    Write the manifest dict (and the tool contours, a ContourSet, if given)
+    for one job. Returns the manifest path.
+    """
+    manifest = dict(manifest, version=MANIFEST_VERSION, file_name=file_name,
+                    updated=time.strftime("%Y-%m-%d %H:%M:%S"))
+    if contours is not None:
+        def save_contours(path):
+            with open(path, "wb") as f:
+                np.savez_compressed(f, points=contours.points, offsets=contours.offsets)
+        _replace(contours_path(folder, file_name), save_contours)
+        manifest["contours_file"] = os.path.basename(contours_path(folder, file_name))
+
+    def save_manifest(path):
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=2)
+    path = manifest_path(folder, file_name)
+    _replace(path, save_manifest)
+    return path
+
+
+def load_manifest(folder, file_name):
+    """The manifest dict of one job, or None if it has not been processed."""
+    path = manifest_path(folder, file_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def update_manifest(folder, file_name, **fields):
+    manifest = load_manifest(folder, file_name) or {}
+    manifest.update(fields)
+    return write_manifest(folder, file_name, manifest)
+
+
+def load_contours(folder, file_name):
+    """The tool contours of one job as a ContourSet, or None."""
+    path = contours_path(folder, file_name)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return ContourSet(data["points"], data["offsets"])
@@ -0,0 +1,106 @@
+"""
+2D union of overlapping tool outlines.
+
+Tools laid close together on the lightbox can end up with offset outlines
+that overlap or touch, and every traced hole of a tool (the eye of a
+wrench) is an outline inside its tool's outline. In split mode each of
+those is its own DXF import and its own subtraction in the SCAD loop, and
+the overlapping cuts leave coplanar faces that slow the Manifold backend
+down. Here outlines that overlap or touch are merged into one polygon
+before export.
+
+Outlines may carry a cut depth. Outlines of the same depth are unioned;
+where outlines of different depths overlap the deeper cut keeps its whole
+outline and the shallower ones are cut back to where they do not overlap
+it, so every region is cut once at the deepest depth over it. A deeper
+outline entirely inside a shallower one leaves it whole (a pocket with a
+deeper pocket in it), since one outline cannot carry a hole.
+
+Outlines that overlap nothing are passed through untouched. Needs
+pyclipper.
+"""
+import numpy as np
+
+try:
+    import pyclipper
+except ImportError:
+    pyclipper = None
+
+CLIPPER_SCALE = 256  # clipper integer units per px, as for the polygon offset
+
+
+def _path(contour):
+    """Clipper path of one contour, counter-clockwise so holes fill instead of cancelling."""
+    path = np.round(np.asarray(contour, dtype=np.float64).reshape(-1, 2) * CLIPPER_SCALE).astype(np.int64).tolist()
+    return path if pyclipper.Orientation(path) else path[::-1]
+
+
+def _outers(subject, clip=()):
+    """Outer outlines of the union of `subject` paths, minus the `clip` paths."""
+    clipper = pyclipper.Pyclipper()
+    clipper.AddPaths(subject, pyclipper.PT_SUBJECT, True)
+    if clip:
+        clipper.AddPaths(clip, pyclipper.PT_CLIP, True)
+    tree = clipper.Execute2(pyclipper.CT_DIFFERENCE if clip else pyclipper.CT_UNION,
+                            pyclipper.PFT_NONZERO, pyclipper.PFT_NONZERO)
+    return [node.Contour for node in tree.Childs]
+
+
+def _overlapping_groups(paths, bbox):
+    """Indices of outlines that overlap or touch, grouped (union-find over bounding box pairs)."""
+    parent = list(range(len(paths)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(len(paths)):
+        near = np.flatnonzero((bbox[i + 1:, 0] <= bbox[i, 2]) & (bbox[i + 1:, 2] >= bbox[i, 0]) &
+                              (bbox[i + 1:, 1] <= bbox[i, 3]) & (bbox[i + 1:, 3] >= bbox[i, 1])) + i + 1
+        for j in near:
+            if root(i) != root(j) and len(_outers([paths[i], paths[j]])) == 1:
+                parent[root(j)] = root(i)
+    groups = {}
+    for i in range(len(paths)):
+        groups.setdefault(root(i), []).append(i)
+    return sorted(groups.values())
+
+
+def merge_outlines(contours, depths, min_area=0.0):
+    """
+    Merge overlapping / touching outlines (see the module docstring).
+
+    `contours` are OpenCV style contours in px and `depths` their cut
+    depths. Returns (contours, depths); merged outlines take the place of
+    the first outline of their group and pieces smaller than `min_area`
+    px^2 are dropped. All contours come back float32 if any were merged.
+    """
+    if pyclipper is None:
+        raise RuntimeError("Merging outlines needs pyclipper (pip install pyclipper)")
+    contours = [np.asarray(contour) for contour in contours]
+    if len(contours) < 2:
+        return contours, list(depths)
+    paths = [_path(contour) for contour in contours]
+    points = [contour.reshape(-1, 2) for contour in contours]
+    bbox = np.array([[p[:, 0].min(), p[:, 1].min(), p[:, 0].max(), p[:, 1].max()] for p in points], dtype=np.float64)
+    merged_contours, merged_depths, merged = [], [], False
+    for group in _overlapping_groups(paths, bbox):
+        if len(group) == 1:
+            merged_contours.append(contours[group[0]])
+            merged_depths.append(depths[group[0]])
+            continue
+        merged = True
+        levels = sorted({depths[i] for i in group}, reverse=True)
+        for level, depth in enumerate(levels):
+            deeper = [paths[i] for i in group if depths[i] in levels[:level]]
+            for outer in _outers([paths[i] for i in group if depths[i] == depth], deeper):
+                contour = (np.asarray(outer, dtype=np.float32) / CLIPPER_SCALE).reshape(-1, 1, 2)
+                if abs(pyclipper.Area(outer)) / CLIPPER_SCALE ** 2 >= min_area:
+                    merged_contours.append(contour)
+                    merged_depths.append(depth)
+    if merged:
+        # One dtype for the packed ContourSet
+        merged_contours = [contour.astype(np.float32) for contour in merged_contours]
+    return merged_contours, merged_depths
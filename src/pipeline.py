@@ -0,0 +1,836 @@
+"""
+Qt-free image -> DXF -> SCAD pipeline.
+
+Everything in here works on plain numpy arrays and file paths so it can be
+shared by the Step 1 GUI (through src/processing.py) and by the headless
+batch tool (src/batch_process.py). Nothing in this module may import Qt or
+touch the clipboard.
+"""
+import collections
+import math
+import os
+import re
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from src.chamfer import chamfer_spec, chamfer_file_name, write_chamfer_dxf, CHAMFER_HEIGHT  # type: ignore
+from src.contour_set import ContourSet  # type: ignore
+from src.curve_fit import fit_outline, fit_points  # type: ignore
+from src.image_io import read_image  # type: ignore
+from src.dxf_writer import polyline_points, write_dxf, write_dxf_ezdxf, write_curves_dxf, validate_dxf  # type: ignore
+from src.manifest import write_manifest  # type: ignore
+from src.outline_merge import merge_outlines  # type: ignore
+from src.preflight import check_outlines, problem_dict, error_count  # type: ignore
+from src.primitives import classify_contour, shape_data_row  # type: ignore
+from src.token_detector import TokenDetector  # type: ignore
+
+try:
+    import pyclipper
+except ImportError:  # only needed for the "polygon" offset method
+    pyclipper = None
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+SCAD_TEMPLATE_PATH = os.path.join(PROJECT_ROOT, "Step 2 DXF to STL.scad")
+MIN_CONTOUR_AREA = 1000  # px^2, anything smaller is treated as noise
+# "raster" dilates the threshold mask with an elliptical kernel, "distance"
+# gets the same mask from a separable distance transform in the kernel's
+# own shape (cost independent of the offset), and "polygon" traces the
+# mask first and offsets the outlines geometrically.
+OFFSET_METHODS = ("raster", "distance", "polygon")
+DILATE_CROSSOVER = 1700  # kernel pixels at which cv2.dilate costs as much as the "distance" passes
+CLIPPER_SCALE = 256  # pyclipper works on integers, so outlines are offset at 1/256 px
+ARC_TOLERANCE_PX = 0.1  # max deviation of the round joins from a true arc
+OPEN_KERNEL_SIZE = 5  # px, speckle removal after thresholding
+PREVIEW_MAX_SIDE = 1024  # px, longest side of the live preview proxy image
+MIN_OFFSET = 0.01  # inches, one step of the GUI offset slider
+CUT_DEPTH = 10  # mm, starting cut depth of every tool in the SCAD file
+
+# Everything one run depends on besides the image, carried with the job
+# instead of in module globals so runs can overlap. curve_tolerance (mm)
+# switches simplification from approxPolyDP at `resolution` to line / arc
+# fitting within that distance of the offset outline; 0 keeps approxPolyDP.
+# shape_tolerance (mm) turns outlines that are that close to a circle or a
+# rectangle into shape_data primitives instead of DXFs; 0 keeps every DXF.
+# merge_outlines unions tool outlines that overlap or touch before export.
+# chamfer_method "layers" writes the chamfer slices (src/chamfer.py) and
+# sets the template to stack them; "minkowski" keeps the template's cone.
+# offset and token are in inches and must be positive, the offset kernel
+# size divides by both.
+class ProcessParams(collections.namedtuple(
+        "ProcessParams", ["threshold", "offset", "token", "resolution", "offset_method", "splitDXF", "dxf_writer",
+                          "curve_tolerance", "shape_tolerance", "merge_outlines", "chamfer_method"],
+        defaults=("raster", True, "fast", 0.0, 0.0, False, "minkowski"))):
+    __slots__ = ()
+
+    def __new__(cls, *args, **kwargs):
+        self = super().__new__(cls, *args, **kwargs)
+        if not self.offset > 0:
+            raise ValueError(f"offset must be greater than 0 inches, got {self.offset}")
+        if not self.token > 0:
+            raise ValueError(f"token size must be greater than 0 inches, got {self.token}")
+        return self
+# What export_dxf returns; curve_fit is None unless the outlines were fitted
+# with lines and arcs, then {tolerance_mm, vertices_before, vertices_after, max_error_mm}.
+# shape_data holds the [x, y, width, height, depth, angle] rows of the
+# outlines cut as primitives, which have no DXF.
+ExportResult = collections.namedtuple(
+    "ExportResult", ["dxf_path", "gridx_size", "gridy_size", "offset_pos_xy", "curve_fit", "shape_data"])
+
+
+def resolve_output_folder(folder_name):
+    """Project folders are relative to the repository root unless absolute."""
+    folder = os.path.join(PROJECT_ROOT, folder_name)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def to_grayscale(image):
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def threshold_mask(imgray, threshold_input, open_size=OPEN_KERNEL_SIZE):
+    ret, thresh = cv2.threshold(imgray, threshold_input, 255, cv2.THRESH_BINARY)
+    thresh = cv2.bitwise_not(thresh)
+    if open_size < 2:
+        return thresh
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (open_size, open_size))
+    return cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
+
+
+def make_proxy(image, max_side=PREVIEW_MAX_SIDE):
+    """
+    Downscale `image` so its longest side is at most `max_side` px.
+    Returns (proxy, scale) with scale = proxy px / full resolution px.
+    """
+    longest = max(image.shape[:2])
+    if longest <= max_side:
+        return image, 1.0
+    scale = max_side / longest
+    size = (max(1, round(image.shape[1] * scale)), max(1, round(image.shape[0] * scale)))
+    # Use the real ratio after rounding so px measurements map back exactly
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA), size[0] / image.shape[1]
+
+
+def preprocess_image(image, threshold_input):
+    if isinstance(image, str):
+        image = read_image(image)
+    return image, threshold_mask(to_grayscale(image), threshold_input)
+
+
+def as_contour_set(contours):
+    return contours if isinstance(contours, ContourSet) else ContourSet.from_contours(contours)
+
+
+def trace_contours(thresh):
+    return ContourSet.from_contours(cv2.findContours(thresh, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)[-2])
+
+
+def find_token(thresh, detector=None):
+    """
+    Locate the scale token in a threshold mask.
+
+    Returns a TokenMatch (contour, center, diameter, ratio, confidence,
+    bbox, source) or None. Pass a long-lived TokenDetector to search the
+    last known token position first.
+    """
+    if detector is None:
+        detector = TokenDetector()
+    return detector.detect(thresh)
+
+
+def offset_kernel_size(diameter, token, offset):
+    if offset <= 0:
+        raise ValueError(f"offset must be greater than 0 inches, got {offset}")
+    return math.ceil(diameter / (token / offset) * 2)
+
+
+def offset_distance_px(diameter, token, offset):
+    return diameter / token * offset
+
+
+def dilate_contours(thresh, diameter, token, offset):
+    """Dilate the mask by `offset` inches and trace the raw outlines."""
+    kernel_size = offset_kernel_size(diameter, token, offset)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+    dilated = cv2.dilate(thresh, kernel)
+    return cv2.findContours(dilated, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)[-2]
+
+
+def _kernel_row_ranges(kernel):
+    """
+    Lookup tables for distance_offset_contours: for a pixel whose row has
+    mask h px to its left (right), the kernel rows v it satisfies are
+    -above..below with above = up[side][h] - 1 and below = down[side][h] - 1
+    (0 in both: none). Side 0 is left, 1 is right.
+    """
+    anchor_y, anchor_x = kernel.shape[0] // 2, kernel.shape[1] // 2
+    up = np.zeros((2, 256), dtype=np.uint8)
+    down = np.zeros((2, 256), dtype=np.uint8)
+    for i, row in enumerate(kernel):
+        columns = np.flatnonzero(row)
+        if not len(columns):
+            continue
+        v = i - anchor_y
+        for side, reach in ((0, anchor_x - columns[0]), (1, columns[-1] - anchor_x)):
+            if v <= 0:
+                up[side, :reach + 1] = np.maximum(up[side, :reach + 1], 1 - v)
+            if v >= 0:
+                down[side, :reach + 1] = np.maximum(down[side, :reach + 1], 1 + v)
+    return up, down
+
+
+def distance_offset_contours(thresh, diameter, token, offset):
+    """
+    Raster offset from a separable distance transform, pixel for pixel the
+    same mask as dilate_contours at a cost that does not grow with the
+    offset.
+
+    The elliptical kernel is a stack of horizontal runs, row v reaching a
+    few px left and right of the anchor, so a pixel is set if the mask in
+    row y + v lies within the reach of run v for some v. One pass along
+    every row gives each pixel its distance to the mask on its left and
+    on its right (a 1D distance transform), which a lookup turns into the
+    range of kernel rows it satisfies; since the runs shrink away from the
+    middle row that range always holds v = 0. One pass down every column
+    then sets every pixel that some pixel in its column reaches.
+
+    cv2.dilate costs about DILATE_CROSSOVER kernel pixels' worth of these
+    passes, so smaller kernels are dilated directly (same result).
+    """
+    kernel_size = offset_kernel_size(diameter, token, offset)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (kernel_size, kernel_size))
+    x, y, w, h = cv2.boundingRect(thresh)
+    # Nothing outside the mask's box grown by the kernel can be set
+    x0, y0 = max(x - kernel_size, 0), max(y - kernel_size, 0)
+    x1, y1 = min(x + w + kernel_size, thresh.shape[1]), min(y + h + kernel_size, thresh.shape[0])
+    area = (x1 - x0) * (y1 - y0)
+    # The row ranges are uint8 lookups, enough for kernels up to 509 px
+    if w == 0 or kernel_size > 509 or np.count_nonzero(kernel) * thresh.size <= DILATE_CROSSOVER * area:
+        return dilate_contours(thresh, diameter, token, offset)
+    up, down = _kernel_row_ranges(kernel)
+
+    mask = thresh[y0:y1, x0:x1] > 0
+    rows, cols = mask.shape
+    dtype = np.int16 if max(rows, cols) < 1 << 14 else np.int32
+    far = 1 << 14 if dtype == np.int16 else 1 << 30
+    column = np.arange(cols, dtype=dtype)
+    nearest = np.full(mask.shape, -far, dtype=dtype)
+    np.copyto(nearest, column, where=mask)
+    np.maximum.accumulate(nearest, axis=1, out=nearest)
+    left = np.minimum(column - nearest, 255).astype(np.uint8)
+    nearest.fill(far)
+    np.copyto(nearest, column, where=mask)
+    nearest = np.minimum.accumulate(nearest[:, ::-1], axis=1)[:, ::-1]
+    right = np.minimum(nearest - column, 255).astype(np.uint8)
+    reach_up = cv2.max(cv2.LUT(left, up[0]), cv2.LUT(right, up[1]))
+    reach_down = cv2.max(cv2.LUT(left, down[0]), cv2.LUT(right, down[1]))
+
+    # Pixel y' sets rows y' - below .. y' + above; a code of 0 sets nothing
+    row = np.arange(rows, dtype=dtype)[:, None]
+    from_below = np.minimum.accumulate((row - reach_down)[::-1], axis=0)[::-1] < row
+    from_above = np.maximum.accumulate(row + reach_up, axis=0) > row
+    grown = np.zeros_like(thresh)
+    grown[y0:y1, x0:x1] = (from_below | from_above).view(np.uint8) * 255
+    return cv2.findContours(grown, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)[-2]
+
+
+def polygon_offset_contours(thresh, diameter, token, offset):
+    """
+    Trace the mask, then grow the outlines by `offset` inches with round joins.
+
+    The offset is exact to 1/CLIPPER_SCALE px and its cost depends on the
+    number of outline vertices rather than on the offset radius. Holes are
+    traced with the opposite orientation by OpenCV, so clipper shrinks them
+    and merges outlines that grow into each other. Returns float32 contours.
+    """
+    if pyclipper is None:
+        raise RuntimeError("The polygon offset method needs pyclipper (pip install pyclipper)")
+    distance = offset_distance_px(diameter, token, offset)
+    clipper = pyclipper.PyclipperOffset(arc_tolerance=ARC_TOLERANCE_PX * CLIPPER_SCALE)
+    for contour in cv2.findContours(thresh, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)[-2]:
+        path = (contour.reshape(-1, 2).astype(np.int64) * CLIPPER_SCALE).tolist()
+        if len(path) >= 3:
+            clipper.AddPath(path, pyclipper.JT_ROUND, pyclipper.ET_CLOSEDPOLYGON)
+        else:
+            # Single pixels and 1 px wide lines still get a round offset
+            clipper.AddPath(path, pyclipper.JT_ROUND, pyclipper.ET_OPENROUND)
+    paths = clipper.Execute(distance * CLIPPER_SCALE)
+    return [(np.asarray(path, dtype=np.float32) / CLIPPER_SCALE).reshape(-1, 1, 2) for path in paths]
+
+
+def grow_contours(thresh, diameter, token, offset, offset_method="raster"):
+    if offset_method == "polygon":
+        return polygon_offset_contours(thresh, diameter, token, offset)
+    if offset_method == "raster":
+        return dilate_contours(thresh, diameter, token, offset)
+    if offset_method == "distance":
+        return distance_offset_contours(thresh, diameter, token, offset)
+    raise ValueError(f"Unknown offset method {offset_method!r}, expected one of {OFFSET_METHODS}")
+
+
+def simplify_contours(contours, diameter, token, offset, resolution, curve_tolerance=0.0):
+    if curve_tolerance > 0:
+        # The outline is fitted with lines and arcs at export, from every traced point
+        return ContourSet.from_contours(contours)
+    epsilon = offset_kernel_size(diameter, token, offset) / resolution
+    return ContourSet.from_contours([cv2.approxPolyDP(contour, epsilon, True) for contour in contours])
+
+
+def filter_tool_contours(contours, min_area=MIN_CONTOUR_AREA, merge=False):
+    """
+    Drop the scale token and small noise, leaving the tool outlines as a
+    ContourSet; with `merge` outlines that overlap or touch are unioned
+    (src/outline_merge.py). Every tool starts at the same CUT_DEPTH, so
+    merging here is a plain union.
+    """
+    contour_set = as_contour_set(contours)
+    token_index, _ = contour_set.max_p2d_index()
+    if token_index is None:
+        return None
+    keep = contour_set.area >= min_area
+    keep[token_index] = False
+    tools = contour_set.subset(keep)
+    if merge and len(tools) > 1:
+        merged, _ = merge_outlines(tools.contours, [CUT_DEPTH] * len(tools), min_area)
+        tools = ContourSet.from_contours(merged)
+    return tools
+
+
+def contour_positions(contours, scale_factor):
+    """
+    Per-contour bounding box centers.
+
+    Returns (pos_xy, offset_pos_xy, abs_center): pos_xy is in pixels and is
+    used to centre each split DXF; offset_pos_xy is in mm relative to the
+    centre of all contours and is what the SCAD template positions by.
+    Both are stored (row, col) because the DXFs are written transposed.
+    """
+    contour_set = as_contour_set(contours)
+    centers = contour_set.bbox_centers()[:, ::-1]  # (row, col)
+    min_x, min_y, max_x, max_y = contour_set.bounds()
+    abs_center = ((min_x + max_x) / 2, (min_y + max_y) / 2)
+    pos_xy = np.round(centers, 1).tolist()
+    offset_pos_xy = np.round((centers - (abs_center[1], abs_center[0])) * scale_factor * 25.4, 1).tolist()
+    return pos_xy, offset_pos_xy, abs_center
+
+
+def calculate_grid_size(contours, scale_factor):
+    min_x, min_y, max_x, max_y = as_contour_set(contours).bounds()
+    x_size = max_x - min_x
+    y_size = max_y - min_y
+    gridy_size = math.ceil(x_size / 42 * scale_factor * 25.4)
+    gridx_size = math.ceil(y_size / 42 * scale_factor * 25.4)
+    return gridx_size, gridy_size
+
+
+def preflight_check(contours, scale_factor, gridx_size, gridy_size):
+    """
+    Geometry problems of the tool outlines in the bin they were exported
+    for (src/preflight.py), as problem dicts for the manifest.
+    """
+    _, _, abs_center = contour_positions(contours, scale_factor)
+    # The same frame as the combined DXF and shape_data, in mm
+    polylines = [polyline_points(contour, scale_factor * 25.4, abs_center[1], abs_center[0])
+                 for contour in as_contour_set(contours)]
+    return [problem_dict(problem) for problem in check_outlines(polylines, gridx_size, gridy_size, CHAMFER_HEIGHT)]
+
+
+def save_dxf_polylines(polylines, file_name, folder_name, dxf_writer="fast"):
+    """Write one DXF file, falling back to ezdxf if the fast writer fails."""
+    output_path = os.path.join(resolve_output_folder(folder_name), file_name + ".dxf")
+    if dxf_writer == "fast":
+        try:
+            write_dxf(output_path, polylines)
+            return file_name + ".dxf"
+        except Exception as e:
+            print(f"Fast DXF writer failed for {file_name} ({e}), writing it with ezdxf")
+    write_dxf_ezdxf(output_path, polylines)
+    return file_name + ".dxf"
+
+
+def dxf_files(contours, scale_factor, file_name, splitDXF=True, indices=None):
+    """
+    The files export_dxf writes: a list of (file name, polylines) with each
+    split file centred on its contour and the combined file on all of them,
+    plus offset_pos_xy of the split files for the SCAD template. Only the
+    contours at `indices` (default all) are written, positioned relative to
+    all of them.
+    """
+    pos_xy, offset_pos_xy, abs_center = contour_positions(contours, scale_factor)
+    indices = range(len(contours)) if indices is None else indices
+    if splitDXF:
+        files = [(f"{file_name}_contour_{idx+1}", [polyline_points(contours[idx], scale_factor, *pos_xy[idx])])
+                 for idx in indices]
+        offset_pos_xy = [offset_pos_xy[idx] for idx in indices]
+    else:
+        files = [(file_name, [polyline_points(contours[idx], scale_factor, abs_center[1], abs_center[0])
+                              for idx in indices])] if len(indices) else []
+    return files, offset_pos_xy
+
+
+def detect_shapes(contours, scale_factor, tolerance_mm, corner_radius=0.0):
+    """
+    shape_data rows of the outlines that are circles or rectangles within
+    `tolerance_mm` (src/primitives.py), and the indices of the freeform
+    rest. `corner_radius` is the offset in inches, the radius the offset
+    rounds rectangle corners to.
+    """
+    _, _, abs_center = contour_positions(contours, scale_factor)
+    tolerance = tolerance_mm / 25.4 / scale_factor
+    rows, freeform = [], []
+    for index, contour in enumerate(contours):
+        shape = classify_contour(contour, tolerance, corner_radius / scale_factor)
+        if shape is None:
+            freeform.append(index)
+        else:
+            rows.append(shape_data_row(shape, scale_factor, abs_center[1], abs_center[0], CUT_DEPTH / 25.4))
+    return rows, freeform
+
+
+def curve_fit_report(curve_fit):
+    return (f"Arc fit: {curve_fit['vertices_before']} -> {curve_fit['vertices_after']} vertices, "
+            f"max error {curve_fit['max_error_mm']:.3f} mm (tolerance {curve_fit['tolerance_mm']:g} mm)")
+
+
+def export_dxf(contours, scale_factor, file_name, folder_name, splitDXF=True, dxf_writer="fast", validate=False,
+               curve_tolerance=0.0, shape_tolerance=0.0, corner_radius=0.0, chamfer_method="minkowski"):
+    """
+    Write the tool outlines as DXF.
+
+    Returns an ExportResult where dxf_path is a list of per-tool files in
+    split mode. With `shape_tolerance` (mm) circles and rectangles go into
+    shape_data instead (see detect_shapes). With `curve_tolerance` (mm)
+    every outline is fitted with lines and arcs (src/curve_fit.py) and
+    written as LINE / ARC entities instead of a polyline. With
+    chamfer_method "layers" every file also gets its chamfer slices
+    (src/chamfer.py) when pyclipper is available.
+    With `validate` every file is read back with ezdxf and a ValueError is
+    raised if any is wrong.
+    """
+    shape_data, freeform = [], None
+    if shape_tolerance > 0:
+        shape_data, freeform = detect_shapes(contours, scale_factor, shape_tolerance, corner_radius)
+    files, offset_pos_xy = dxf_files(contours, scale_factor, file_name, splitDXF, freeform)
+    folder = resolve_output_folder(folder_name)
+    fits = curve_fit = None
+    if curve_tolerance > 0:
+        tolerance = curve_tolerance / 25.4  # the DXF is in inches
+        fits = [[fit_outline(points, tolerance) for points in polylines] for _, polylines in files]
+        names = [os.path.basename(write_curves_dxf(os.path.join(folder, name + ".dxf"), file_fits))
+                 for (name, _), file_fits in zip(files, fits)]
+        all_fits = [fit for file_fits in fits for fit in file_fits]
+        curve_fit = {
+            "tolerance_mm": curve_tolerance,
+            "vertices_before": sum(fit.point_count for fit in all_fits),
+            "vertices_after": sum(len(fit.vertices) for fit in all_fits),
+            "max_error_mm": round(max((fit.max_error for fit in all_fits), default=0.0) * 25.4, 4),
+        }
+        # The chamfer slices follow the fitted outline, flattened well inside the tolerance
+        files = [(name, [fit_points(fit, tolerance / 4) for fit in file_fits])
+                 for (name, _), file_fits in zip(files, fits)]
+    else:
+        names = [save_dxf_polylines(polylines, name, folder_name, dxf_writer) for name, polylines in files]
+    spec = chamfer_spec(chamfer_method)
+    chamfer_paths = []
+    if spec is not None:
+        for name, polylines in files:
+            chamfer_paths.append(write_chamfer_dxf(
+                os.path.join(folder, chamfer_file_name(name) + ".dxf"), polylines, spec))
+    if validate:
+        if fits is not None:
+            problems = [problem for file_fits, path in zip(fits, names)
+                        for problem in validate_dxf(os.path.join(folder, path), fits=file_fits)]
+        else:
+            problems = [problem for (name, polylines), path in zip(files, names)
+                        for problem in validate_dxf(os.path.join(folder, path), polylines)]
+        problems += [problem for path in chamfer_paths for problem in validate_dxf(path)]
+        if problems:
+            raise ValueError("DXF validation failed: " + "; ".join(problems))
+    # Without freeform outlines the combined mode has no DXF at all
+    dxf_path = names if splitDXF else (names[0] if names else "")
+    gridx_size, gridy_size = calculate_grid_size(contours, scale_factor)
+    return ExportResult(dxf_path, gridx_size, gridy_size, offset_pos_xy, curve_fit, shape_data)
+
+
+def contours_digest(contours):
+    """Cheap content key for a list of contours."""
+    return as_contour_set(contours).digest()
+
+
+class PipelineCache:
+    """
+    Memoises every pipeline stage on the parameters it depends on.
+
+    Stages and their keys:
+        grayscale  - image
+        threshold  - image, threshold
+        traced     - image, threshold (display only)
+        token      - image, threshold
+        offset     - image, threshold, token diameter, token size, offset, method
+        simplify   - offset key + resolution
+        tools      - simplified contours, merge
+        dxf        - tool contours, scale, file name, folder, split mode, writer,
+                     curve and shape tolerance, offset
+
+    With a trusted rig scale (`rig`) the token stage is skipped and the
+    diameter comes from the saved px/inch instead, scaled to the size of
+    the source image (ValueError if the rig scale does not fit it).
+
+    With `max_side` set the cache works on a proxy downscaled to at most
+    that many px (the live preview). Every stage then measures in proxy px:
+    the opening kernel and the noise / token area limits are scaled with
+    it, and token / diameter is inches per proxy px, so grid sizes come out
+    the same as at full resolution. Divide by `scale` for full resolution px.
+
+    So changing only `resolution` reruns approxPolyDP (and what follows),
+    changing only `offset` reruns the dilation onwards, and pressing
+    Process twice with nothing changed reruns nothing. Stage names that
+    actually ran are collected in `ran` until take_ran() is called.
+
+    The cache itself is not thread safe; callers that share one between
+    the GUI thread and a worker hold `lock` while using it.
+    """
+
+    def __init__(self, token_detector=None, max_side=None):
+        self.source = None  # image as passed to set_image
+        self.image = None  # the image the stages run on (the proxy in preview mode)
+        self.max_side = max_side
+        self.scale = 1.0
+        self._image_version = 0
+        self._stages = {}
+        self.ran = []
+        self.token_detector = token_detector if token_detector is not None else TokenDetector()
+        self.rig = None  # RigScale; when set the token pass is skipped
+        self.lock = threading.RLock()
+
+    def set_image(self, image):
+        if image is not self.source:
+            self.source = image
+            if self.max_side:
+                self.image, self.scale = make_proxy(image, self.max_side)
+            else:
+                self.image, self.scale = image, 1.0
+            self._image_version += 1
+            self._stages.clear()
+
+    def take_ran(self):
+        ran, self.ran = self.ran, []
+        return ran
+
+    def _stage(self, name, key, compute):
+        cached = self._stages.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        value = compute()
+        self._stages[name] = (key, value)
+        self.ran.append(name)
+        return value
+
+    def grayscale(self):
+        return self._stage("grayscale", (self._image_version,), lambda: to_grayscale(self.image))
+
+    def threshold(self, threshold):
+        key = (self._image_version, threshold)
+        open_size = max(1, round(OPEN_KERNEL_SIZE * self.scale))
+        return self._stage("threshold", key, lambda: threshold_mask(self.grayscale(), threshold, open_size))
+
+    def traced(self, threshold):
+        """Every outline in the threshold mask, for display."""
+        key = (self._image_version, threshold)
+        return self._stage("traced", key, lambda: trace_contours(self.threshold(threshold)))
+
+    def token(self, threshold):
+        """TokenMatch for the token in this threshold mask, or None."""
+        key = (self._image_version, threshold)
+        return self._stage("token", key, lambda: find_token(self.threshold(threshold), self.token_detector))
+
+    def token_diameter(self, threshold, token):
+        """Token diameter in px, from the trusted rig scale when one is set."""
+        if self.rig is not None:
+            key = (self._image_version, threshold)
+            if self.scale == 1.0 and self._stages.get("rig_check", (None,))[0] != key:
+                # Only full resolution passes count towards the periodic token check
+                self._stages["rig_check"] = (key, None)
+                self.rig.maybe_verify(self.threshold(threshold), token)
+            return self.rig.token_diameter(token, self.source.shape) * self.scale
+        match = self.token(threshold)
+        return match.diameter if match is not None else None
+
+    def _offset_key(self, threshold, token, offset, offset_method):
+        return (self._image_version, threshold, self.token_diameter(threshold, token), token, offset, offset_method)
+
+    def offset(self, threshold, token, offset, offset_method="raster"):
+        diameter = self.token_diameter(threshold, token)
+        key = self._offset_key(threshold, token, offset, offset_method)
+        return self._stage("offset", key, lambda: grow_contours(
+            self.threshold(threshold), diameter, token, offset, offset_method))
+
+    def simplify(self, threshold, token, offset, resolution, offset_method="raster", curve_tolerance=0.0):
+        diameter = self.token_diameter(threshold, token)
+        key = self._offset_key(threshold, token, offset, offset_method) + (resolution, curve_tolerance > 0)
+        return self._stage("simplify", key, lambda: simplify_contours(
+            self.offset(threshold, token, offset, offset_method), diameter, token, offset, resolution, curve_tolerance))
+
+    def tools(self, contours, merge=False):
+        return self._stage("tools", (contours_digest(contours), merge), lambda: filter_tool_contours(
+            contours, MIN_CONTOUR_AREA * self.scale ** 2, merge))
+
+    def export(self, contours, scale_factor, file_name, folder_name, splitDXF=True, dxf_writer="fast", validate=False,
+               curve_tolerance=0.0, shape_tolerance=0.0, corner_radius=0.0, chamfer_method="minkowski"):
+        key = (contours_digest(contours), scale_factor, file_name, folder_name, splitDXF, dxf_writer, curve_tolerance,
+               shape_tolerance, corner_radius, chamfer_method)
+        cached = self._stages.get("dxf")
+        if cached is not None and cached[0] == key and not _outputs_missing(cached[1][0], folder_name):
+            return cached[1]
+        value = export_dxf(contours, scale_factor, file_name, folder_name, splitDXF, dxf_writer, validate,
+                           curve_tolerance, shape_tolerance, corner_radius, chamfer_method)
+        self._stages["dxf"] = (key, value)
+        self.ran.append("dxf")
+        return value
+
+
+def _outputs_missing(dxf_path, folder_name):
+    folder = os.path.join(PROJECT_ROOT, folder_name)
+    paths = dxf_path if isinstance(dxf_path, list) else [dxf_path]
+    return any(not os.path.exists(os.path.join(folder, p)) for p in paths)
+
+
+def build_scad_content(dxf_path, gridx_size, gridy_size, splitDXF=False, pos_xy=None, scad_template_path=SCAD_TEMPLATE_PATH,
+                       chamfer=None, shape_data=None):
+    """
+    Fill the Step 2 template for one DXF (or a list of split DXFs). `chamfer`
+    is the chamfer_spec the DXFs were exported with, which switches the
+    template to the layered chamfer; without it the template keeps the
+    minkowski chamfer. `shape_data` rows (see detect_shapes) are
+    cut with shape_cutouts().
+    """
+    with open(scad_template_path, 'r') as file:
+        scad_content = file.read()
+
+    # Use forward slashes for the file path(s)
+    if splitDXF and isinstance(dxf_path, list):
+        dxf_file_paths = [p.replace("\\", "/") for p in dxf_path]
+        # Sort dxf_file_paths by contour index in filename (e.g., *_contour_1.dxf, *_contour_2.dxf, ...)
+        def contour_index(path):
+            # Match _contour_N.dxf at the end of the filename, regardless of path separator
+            m = re.search(r'_contour_(\d+)\.dxf$', os.path.basename(path))
+            return int(m.group(1)) if m else 0
+        dxf_file_paths.sort(key=contour_index)
+        count = len(dxf_file_paths)
+        dxf_paths_scad = 'dxf_file_paths = [\n' + ',\n'.join([f'"{p}"' for p in dxf_file_paths]) + '\n];\n'
+        # Split dxf_cut_depths into arrays of max size 4
+        cut_depths = [str(CUT_DEPTH)] * count
+        cut_depth_arrays = [cut_depths[i:i+4] for i in range(0, len(cut_depths), 4)]
+        dxf_cut_depths_scad = ""
+        concat_line = ""
+        if len(cut_depth_arrays) == 1:
+            dxf_cut_depths_scad = f'dxf_cut_depths = [{", ".join(cut_depth_arrays[0])}];\n'
+        else:
+            array_names = []
+            for idx, arr in enumerate(cut_depth_arrays):
+                name = f'dxf_cut_depths_{idx+1}'
+                array_names.append(name)
+                dxf_cut_depths_scad += f'{name} = [{", ".join(arr)}];\n'
+            concat_line = f'dxf_cut_depths = concat({", ".join(array_names)});\n'
+
+        # Generate section_cut_depth_N and section_parameters_N arrays, then concatenate
+        section_cut_depth_names = [f'section_cut_depth_{idx+1}' for idx in range(count)]
+        section_param_names = [f'section_parameters_{idx+1}' for idx in range(count)]
+        section_blocks = [f'{cut_name} = [20, 15, 10];\n{param_name} = [40, 0, 0];'
+                          for cut_name, param_name in zip(section_cut_depth_names, section_param_names)]
+        section_cut_depth_concat = f'section_cut_depth = [{", ".join(section_cut_depth_names)}];\n'
+        section_parameters_concat = f'section_parameters = [{", ".join(section_param_names)}];\n'
+
+        if not pos_xy or len(pos_xy) != count:
+            # fallback: zeros
+            pos_xy = [[0, 0] for _ in range(count)]
+        position_lines = [f'position_{idx+1} = [{pos_xy[idx][0]:.6f},{pos_xy[idx][1]:.6f},0]; // .1' for idx in range(count)]
+        position_array = f'position = [{", ".join([f"position_{i+1}" for i in range(count)])}];\n'
+        # Replace the position = [[0, 0, 0]]; // .1 line
+        updated_scad_content = scad_content.replace('position = [[0, 0, 0]]; // .1', '\n'.join(position_lines) + '\n' + position_array)
+
+        # --- FINGER SLOT OPTIONS ---
+        # Interleave slot_shape_N, slot_params_N, slot_pos_N for each slot
+        slot_lines = []
+        for idx in range(count):
+            slot_lines.append(f'slot_shape_{idx+1} = "scoop"; // [none, rectangle, oval, scoop, triangle, keyhole, teardrop]')
+            slot_lines.append(f'slot_params_{idx+1} = [80, 40, 9, 0]; // length (mm), width (mm), height (mm), rotation (deg)')
+            slot_lines.append(f'slot_pos_{idx+1} = [{pos_xy[idx][0]:.6f},{pos_xy[idx][1]:.6f}]; // Translation position [x, y] in mm')
+        slot_shape_array = f'slot_shape = [{", ".join([f"slot_shape_{i+1}" for i in range(count)])}];\n'
+        slot_params_array = f'slot_params = [{", ".join([f"slot_params_{i+1}" for i in range(count)])}];\n'
+        slot_pos_array = f'slot_pos = [{", ".join([f"slot_pos_{i+1}" for i in range(count)])}];\n'
+        # Always start the block with use_finger_slots = true;
+        finger_slot_block = 'use_finger_slots = true; // true or false\n' + '\n'.join(slot_lines + [slot_shape_array, slot_params_array, slot_pos_array])
+        # Replace the finger slot options block
+        updated_scad_content = re.sub(
+            r'/\* \[Finger Slot Options\] \*/.*?slot_pos = \[.*?\];',
+            lambda _: '/* [Finger Slot Options] */\n' + finger_slot_block,
+            updated_scad_content,
+            flags=re.DOTALL
+        )
+
+        # Insert all blocks inside /* [Section Adjustments] */ in the requested order
+        scad_block = dxf_paths_scad + dxf_cut_depths_scad + concat_line + '// dxf_file_path replaced by dxf_file_paths'
+        updated_scad_content = updated_scad_content.replace(
+            'dxf_file_path = "examples/example.dxf";',
+            scad_block
+        )
+
+        section_marker = '/* [Section Adjustments] */'
+        if section_marker in updated_scad_content:
+            parts = updated_scad_content.split(section_marker, 1)
+            new_block = '\nuse_section_cut = false; // true or false\n'
+            for block in section_blocks:
+                new_block += block + '\n'
+            new_block += section_cut_depth_concat + section_parameters_concat
+            updated_scad_content = parts[0] + section_marker + new_block + parts[1]
+    else:
+        dxf_path = dxf_path.replace("\\", "/")
+        updated_scad_content = scad_content.replace('dxf_file_path = "examples/example.dxf";', f'dxf_file_path = "{dxf_path}";')
+
+    updated_scad_content = updated_scad_content.replace('size = [5, 2, 6];', f'size = [{gridx_size}, {gridy_size}, 6];')
+    updated_scad_content = updated_scad_content.replace('multiple_dxf = false;', f'multiple_dxf = {str(splitDXF).lower()};')
+    if shape_data:
+        rows = ",".join("[" + ",".join(f"{value:g}" for value in row) + "]" for row in shape_data)
+        updated_scad_content = re.sub(r'^shape_data = .*;$', lambda _: f'shape_data = [{rows}];',
+                                      updated_scad_content, count=1, flags=re.MULTILINE)
+        updated_scad_content = updated_scad_content.replace('add_shape_data = false;', 'add_shape_data = true;')
+    if chamfer:
+        updated_scad_content = updated_scad_content.replace(
+            'chamfer_method = "minkowski";', 'chamfer_method = "layers";').replace(
+            'chamfer_layer_count = 0;', f'chamfer_layer_count = {chamfer["layers"]};').replace(
+            'chamfer_layer_height = 0;', f'chamfer_layer_height = {chamfer["height"]:g};')
+    return updated_scad_content
+
+
+def write_scad_file(scad_content, file_name, folder_name):
+    scad_file_path = os.path.join(resolve_output_folder(folder_name), f"{file_name}.scad")
+    with open(scad_file_path, 'w') as scad_file:
+        scad_file.write(scad_content)
+    return scad_file_path
+
+
+def write_job_manifest(folder_name, file_name, params, diameter, tool_contours, export_result, image_path=None,
+                       scad_path=None, problems=None):
+    """
+    Record one run (see src/manifest.py); export_result is what export_dxf
+    returned, problems what preflight_check found.
+    """
+    dxf_path, gridx_size, gridy_size, offset_pos_xy, curve_fit, shape_data = export_result
+    return write_manifest(resolve_output_folder(folder_name), file_name, {
+        "image": image_path,
+        "params": params._asdict(),
+        "token_diameter_px": float(diameter),
+        "scale_factor": params.token / diameter,  # inches per px
+        "gridx_size": gridx_size,
+        "gridy_size": gridy_size,
+        "splitDXF": params.splitDXF,
+        "dxf_path": dxf_path,
+        "offset_pos_xy": offset_pos_xy,
+        "contour_count": len(tool_contours),
+        "scad_path": scad_path,
+        "chamfer": chamfer_spec(params.chamfer_method),
+        "curve_fit": curve_fit,
+        "shape_data": shape_data,
+        "problems": problems or [],
+    }, tool_contours)
+
+
+def process_image_file(image_path, folder_name, params, file_name=None, token_detector=None, rig=None, validate=False):
+    """
+    Run one photo through token detect -> dilate -> approxPolyDP -> DXF -> SCAD
+    with the given ProcessParams, and write its manifest.
+
+    Returns a summary dict (grid size, contour count, token confidence,
+    per-stage timings in seconds and output paths). Failures are reported in summary['error']
+    rather than raised so a batch keeps going.
+    """
+    if file_name is None:
+        file_name = os.path.splitext(os.path.basename(image_path))[0]
+    summary = {"image": image_path, "file_name": file_name, "error": None, "timings": {}}
+    timings = summary["timings"]
+    try:
+        start = time.perf_counter()
+        image = read_image(image_path)
+        if image is None:
+            summary["error"] = "could not read image"
+            return summary
+        timings["load"] = time.perf_counter() - start
+
+        cache = PipelineCache(token_detector)
+        cache.set_image(image)
+
+        start = time.perf_counter()
+        cache.threshold(params.threshold)
+        timings["threshold"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if rig is not None:
+            cache.rig = rig
+            diameter = cache.token_diameter(params.threshold, params.token)
+            summary["token_source"] = "rig"
+        else:
+            match = cache.token(params.threshold)
+            if match is None or not match.diameter:
+                summary["error"] = "no scale token found"
+                return summary
+            diameter = match.diameter
+            summary["token_confidence"] = match.confidence
+            summary["token_source"] = match.source
+        timings["token"] = time.perf_counter() - start
+        scale_factor = params.token / diameter
+        summary["token_diameter_px"] = diameter
+        summary["scale_factor"] = scale_factor
+
+        start = time.perf_counter()
+        cache.offset(params.threshold, params.token, params.offset, params.offset_method)
+        timings["offset"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        contours = cache.simplify(params.threshold, params.token, params.offset, params.resolution, params.offset_method,
+                                  params.curve_tolerance)
+        timings["simplify"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        filtered_contours = cache.tools(contours, params.merge_outlines)
+        if not filtered_contours:
+            summary["error"] = "no tool contours found"
+            return summary
+        export_result = cache.export(filtered_contours, scale_factor, file_name, folder_name, params.splitDXF,
+                                     params.dxf_writer, validate, params.curve_tolerance, params.shape_tolerance,
+                                     params.offset, params.chamfer_method)
+        dxf_path, gridx_size, gridy_size, offset_pos_xy, curve_fit, shape_data = export_result
+        timings["dxf"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        problems = preflight_check(filtered_contours, scale_factor, gridx_size, gridy_size)
+        timings["check"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        scad_content = build_scad_content(dxf_path, gridx_size, gridy_size, params.splitDXF, offset_pos_xy,
+                                          chamfer=chamfer_spec(params.chamfer_method), shape_data=shape_data)
+        summary["scad_path"] = write_scad_file(scad_content, file_name, folder_name)
+        summary["manifest_path"] = write_job_manifest(folder_name, file_name, params, diameter, filtered_contours,
+                                                      export_result, image_path, summary["scad_path"], problems)
+        timings["scad"] = time.perf_counter() - start
+
+        summary["dxf_path"] = dxf_path
+        summary["contour_count"] = len(filtered_contours)
+        summary["gridx_size"] = gridx_size
+        summary["gridy_size"] = gridy_size
+        if curve_fit is not None:
+            summary.update(curve_fit)
+        if params.shape_tolerance > 0:
+            summary.update(shape_data=shape_data, shapes=len(shape_data))
+        summary["problems"] = problems
+        summary["geometry_errors"] = error_count(problems)
+        summary["geometry_warnings"] = len(problems) - summary["geometry_errors"]
+        if rig is not None:
+            summary["warnings"] = rig.take_warnings()
+    except Exception as e:
+        summary["error"] = str(e)
+    summary["total_time"] = sum(timings.values())
+    return summary
@@ -0,0 +1,344 @@
+"""
+Pre-flight geometry checks of the tool outlines.
+
+Bad outlines otherwise only show up after a long OpenSCAD render or in the
+slicer. These checks run when the DXFs are written and report every
+problem with its position in mm, in the SCAD frame (relative to the centre
+of the layout, x = image row, y = image column):
+
+    self-intersection   an outline crosses or touches itself
+    overlap             two tool outlines cross
+    nested              one outline lies inside another (a hole traced inside
+                        a tool), a redundant cut but not a defect
+    outside-bin         an outline reaches past the outside of the bin
+    in-bin-wall         an outline leaves less than MIN_BIN_WALL of bin wall
+    chamfer-in-wall     the chamfer around an outline reaches into the bin wall
+    thin-feature        part of a pocket is narrower than the minimum width
+    thin-wall           material between two pockets (or two parts of one)
+                        is thinner than the minimum width
+
+The first three are errors, which the render queue refuses to render; the
+others are warnings.
+
+All segments go into a uniform grid (a spatial hash) with cells about the
+size of a segment, and only segments / vertices that share a cell are
+compared, so a check costs about O(n log n) (the sort of the cell keys)
+instead of O(n^2). Nested outlines are found with a sweep over the
+outline bounding boxes, which only pairs outlines whose boxes overlap.
+"""
+import collections
+
+import numpy as np
+
+# tool: number (from 1) of the outline it is on, the later one of two tools;
+# x / y: position in mm; detail: text for the report.
+Problem = collections.namedtuple("Problem", ["kind", "tool", "x", "y", "detail"])
+ERRORS = ("self-intersection", "overlap", "outside-bin")
+MIN_WIDTH = 0.4  # mm, nozzle width; narrower pockets and walls do not print
+BIN_PITCH = 42  # mm per grid unit
+BIN_CLEARANCE = 0.25  # mm, a bin is this much smaller than its grid cells on each side
+MIN_BIN_WALL = 1.2  # mm, material to keep between a pocket and the outside of the bin
+CELL_KEY = 1 << 32
+
+
+def _rings(polylines):
+    """Closed (n, 2) outlines without repeated points, first point not repeated at the end."""
+    rings = []
+    for points in polylines:
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        keep = np.ones(len(points), dtype=bool)
+        keep[1:] = np.any(points[1:] != points[:-1], axis=1)
+        points = points[keep]
+        if len(points) > 1 and np.array_equal(points[0], points[-1]):
+            points = points[:-1]
+        rings.append(points)
+    return rings
+
+
+def _cell_items(lo, hi, cell):
+    """(cell keys, item ids) of every grid cell the boxes lo..hi touch."""
+    first = np.floor(lo / cell).astype(np.int64)
+    last = np.floor(hi / cell).astype(np.int64)
+    span = last - first + 1
+    counts = span[:, 0] * span[:, 1]
+    ids = np.repeat(np.arange(len(lo)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cx = first[ids, 0] + local % span[ids, 0]
+    cy = first[ids, 1] + local // span[ids, 0]
+    return cx * CELL_KEY + cy, ids
+
+
+def _join(keys_a, ids_a, keys_b, ids_b, unique=True):
+    """
+    (a, b) id pairs of items that share a cell, made unique unless every a
+    item is in a single cell (points), which cannot repeat a pair.
+    """
+    order = np.argsort(keys_b, kind="stable")
+    keys_b, ids_b = keys_b[order], ids_b[order]
+    left = np.searchsorted(keys_b, keys_a, "left")
+    counts = np.searchsorted(keys_b, keys_a, "right") - left
+    a = np.repeat(ids_a, counts)
+    position = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(left, counts)
+    if not unique:
+        return a, ids_b[position]
+    pairs = np.unique(a * (len(ids_b) + 1) + ids_b[position])
+    return pairs // (len(ids_b) + 1), pairs % (len(ids_b) + 1)
+
+
+def _cross(u, v):
+    return u[:, 0] * v[:, 1] - u[:, 1] * v[:, 0]
+
+
+class Outlines:
+    """The segments of a set of closed outlines, with their spatial hash."""
+
+    def __init__(self, rings):
+        self.rings = rings
+        self.ring = np.concatenate([np.full(len(r), i) for i, r in enumerate(rings)]).astype(np.int64)
+        self.index = np.concatenate([np.arange(len(r)) for r in rings]).astype(np.int64)
+        self.size = np.array([len(r) for r in rings])[self.ring]
+        self.start = np.concatenate(rings)
+        self.end = np.concatenate([np.roll(r, -1, axis=0) for r in rings])
+        lengths = np.linalg.norm(self.end - self.start, axis=1)
+        # Arc length of every vertex along its outline, and the outline lengths
+        self.arc = np.concatenate([np.concatenate([[0.0], np.cumsum(np.linalg.norm(np.diff(r, axis=0), axis=1))])
+                                   for r in rings])
+        self.perimeter = np.array([self.arc[self.ring == i][-1] + np.linalg.norm(r[0] - r[-1])
+                                   for i, r in enumerate(rings)])[self.ring]
+        self.cell = max(float(np.median(lengths)) * 2, 1e-6)
+        self.keys, self.ids = _cell_items(np.minimum(self.start, self.end), np.maximum(self.start, self.end), self.cell)
+
+    def crossings(self):
+        """(segment i, segment j, crossing point) of every pair of non-adjacent segments that meet."""
+        i, j = _join(self.keys, self.ids, self.keys, self.ids)
+        keep = i < j
+        same = self.ring[i] == self.ring[j]
+        gap = np.abs(self.index[i] - self.index[j])
+        keep &= ~(same & ((gap == 1) | (gap == self.size[i] - 1)))
+        i, j = i[keep], j[keep]
+        a, b, c, d = self.start[i], self.end[i], self.start[j], self.end[j]
+        o1, o2 = _cross(b - a, c - a), _cross(b - a, d - a)
+        o3, o4 = _cross(d - c, a - c), _cross(d - c, b - c)
+        meet = (o1 * o2 <= 0) & (o3 * o4 <= 0)
+        collinear = (o1 == 0) & (o2 == 0)
+        # Collinear segments only meet if they overlap along their line
+        direction = b - a
+        t_c = np.einsum("ij,ij->i", c - a, direction)
+        t_d = np.einsum("ij,ij->i", d - a, direction)
+        length_sq = np.einsum("ij,ij->i", direction, direction)
+        overlap = (np.maximum(t_c, t_d) >= 0) & (np.minimum(t_c, t_d) <= length_sq)
+        meet &= ~collinear | overlap
+        i, j, a, b, o1, o2, c = i[meet], j[meet], a[meet], b[meet], o1[meet], o2[meet], c[meet]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = np.where(o1 != o2, o1 / (o1 - o2), 0.0)
+        points = c + t[:, None] * (self.end[j] - c)
+        return i, j, points
+
+    def samples(self, spacing):
+        """
+        Points along the outlines no more than `spacing` apart, in outline
+        order: (points, segment of each, arc length of each).
+        """
+        lengths = np.linalg.norm(self.end - self.start, axis=1)
+        counts = np.maximum(1, np.ceil(lengths / spacing)).astype(np.int64)
+        segment = np.repeat(np.arange(len(counts)), counts)
+        t = (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)) / counts[segment]
+        points = self.start[segment] + t[:, None] * (self.end[segment] - self.start[segment])
+        return points, segment, self.arc[segment] + t * lengths[segment]
+
+    def near(self, points, radius):
+        """(point, segment, distance, closest point, segment parameter) of every point closer than radius to a segment."""
+        # Cells of at least 2 * radius keep the grown segment boxes to a few cells each
+        cell = max(self.cell, 2 * radius)
+        point_keys, point_ids = _cell_items(points, points, cell)
+        lo = np.minimum(self.start, self.end) - radius
+        hi = np.maximum(self.start, self.end) + radius
+        segment_keys, segment_ids = _cell_items(lo, hi, cell)
+        v, s = _join(point_keys, point_ids, segment_keys, segment_ids, unique=False)
+        a, b, p = self.start[s], self.end[s], points[v]
+        ab = b - a
+        t = np.clip(np.einsum("ij,ij->i", p - a, ab) / np.maximum(np.einsum("ij,ij->i", ab, ab), 1e-18), 0, 1)
+        closest = a + t[:, None] * ab
+        distance = np.linalg.norm(p - closest, axis=1)
+        keep = distance < radius
+        return v[keep], s[keep], distance[keep], closest[keep], t[keep]
+
+
+def _inside(point, ring):
+    """Even-odd point in polygon test."""
+    x, y = point
+    a, b = ring, np.roll(ring, -1, axis=0)
+    crosses = (a[:, 1] > y) != (b[:, 1] > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_at = a[:, 0] + (y - a[:, 1]) * (b[:, 0] - a[:, 0]) / (b[:, 1] - a[:, 1])
+    return bool(np.count_nonzero(crosses & (x < x_at)) % 2)
+
+
+def _runs(flags):
+    """[start, end) runs of True in a closed boolean ring, as index arrays."""
+    if flags.all():
+        return [np.arange(len(flags))]
+    # Rotate so that the ring starts outside a run
+    shift = int(np.argmin(flags))
+    rolled = np.roll(flags, -shift)
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], rolled.astype(np.int8), [0]])))
+    return [(np.arange(start, end) + shift) % len(flags) for start, end in zip(edges[::2], edges[1::2])]
+
+
+def _box_pairs(boxes):
+    """(a, b) index pairs of boxes (lo, hi) that overlap, by a sweep along x."""
+    pairs, active = [], []
+    for a in sorted(range(len(boxes)), key=lambda k: boxes[k][0][0]):
+        lo, hi = boxes[a]
+        # Boxes that end left of this one cannot overlap it or any later one
+        active = [b for b in active if boxes[b][1][0] >= lo[0]]
+        pairs += [(a, b) for b in active if boxes[b][0][1] <= hi[1] and boxes[b][1][1] >= lo[1]]
+        active.append(a)
+    return pairs
+
+
+def intersection_problems(outlines):
+    """Crossings and nested outlines, and the set of (tool, tool) index pairs that overlap."""
+    problems, seen = [], set()
+    i, j, points = outlines.crossings()
+    for a, b, (x, y) in zip(outlines.ring[i].tolist(), outlines.ring[j].tolist(), points):
+        # Crossings through a vertex are found for both segments at it
+        if (a, b, round(x, 2), round(y, 2)) in seen:
+            continue
+        seen.add((a, b, round(x, 2), round(y, 2)))
+        if a == b:
+            problems.append(Problem("self-intersection", a + 1, x, y, f"tool {a + 1} crosses itself"))
+        else:
+            problems.append(Problem("overlap", max(a, b) + 1, x, y, f"tools {min(a, b) + 1} and {max(a, b) + 1} overlap"))
+    # Outlines that lie inside another one without crossing it: a hole traced inside a tool is cut away
+    # with the tool anyway, so it is only a redundant cut
+    crossed = {(min(a, b), max(a, b)) for a, b, _, _ in seen}
+    rings = outlines.rings
+    boxes = [(r.min(axis=0), r.max(axis=0)) for r in rings]
+    for pair in _box_pairs(boxes):
+        if (min(pair), max(pair)) in crossed:
+            continue
+        for a, b in (pair, pair[::-1]):
+            ring, outer = rings[a], rings[b]
+            if len(outer) >= 3 and np.all(boxes[a][0] >= boxes[b][0]) and np.all(boxes[a][1] <= boxes[b][1]) \
+                    and _inside(ring[0], outer):
+                x, y = ring[0]
+                problems.append(Problem("nested", a + 1, x, y, f"tool {a + 1} lies inside tool {b + 1} (a redundant cut)"))
+                crossed.add((min(a, b), max(a, b)))
+                break
+    return problems, crossed
+
+
+def width_problems(outlines, min_width=MIN_WIDTH, overlapping=()):
+    """
+    Pockets and walls narrower than min_width, one problem per narrow
+    stretch of outline. Outlines that cross themselves or each other (the
+    `overlapping` (tool, tool) index pairs) are left out, the crossing is
+    the problem.
+    """
+    # Vertices alone would miss long narrow slots with points only at their ends
+    points, segment, arc = outlines.samples(min_width / 2)
+    ring = outlines.ring[segment]
+    v, s, distance, closest, t = outlines.near(points, min_width)
+    same = ring[v] == outlines.ring[s]
+    # Along one outline every point is close to its neighbours; a narrow spot needs the two sides to be
+    # at least 2 * min_width apart along the outline (tips sharper than ~50 degrees count as narrow)
+    forward = (outlines.arc[s] + t * np.linalg.norm(outlines.end[s] - outlines.start[s], axis=1) - arc[v]) \
+        % outlines.perimeter[s]
+    along = np.minimum(forward, outlines.perimeter[s] - forward)
+    # Both sides of a narrow spot see each other, keep the side the other one follows within half the outline
+    keep = (distance > 0) & (~same | ((along >= 2 * min_width) & (forward <= outlines.perimeter[s] / 2)))
+    v, s, distance, closest, same = v[keep], s[keep], distance[keep], closest[keep], same[keep]
+
+    # Which side the other segment is on: inside the pocket is a narrow pocket, outside a wall
+    signs = np.array([np.sign(_cross(r, np.roll(r, -1, axis=0)).sum()) for r in outlines.rings])
+    direction = outlines.end[segment[v]] - outlines.start[segment[v]]
+    inward = np.column_stack([-direction[:, 1], direction[:, 0]]) * signs[ring[v]][:, None]
+    pocket = same & (np.einsum("ij,ij->i", closest - points[v], inward) > 0)
+
+    problems = []
+    for kind, selection in (("thin-feature", pocket), ("thin-wall", ~pocket)):
+        reported = []
+        # Narrowest spot of every flagged sample
+        order = np.lexsort((distance[selection], v[selection]))
+        flagged, first = np.unique(v[selection][order], return_index=True)
+        width = np.full(len(points), np.inf)
+        width[flagged] = distance[selection][order][first]
+        other = np.full(len(points), -1)
+        other[flagged] = outlines.ring[s[selection][order][first]]
+        for ring_index in np.unique(ring[flagged]):
+            indices = np.flatnonzero(ring == ring_index)
+            for run in _runs(np.isfinite(width[indices])):
+                sample = indices[run][np.argmin(width[indices[run]])]
+                other_ring = other[sample]
+                if (min(other_ring, ring_index), max(other_ring, ring_index)) in overlapping:
+                    continue
+                if kind == "thin-wall" and other_ring != ring_index:
+                    if other_ring > ring_index:
+                        continue  # Reported once, from the later of the two tools
+                    detail = f"wall between tools {other_ring + 1} and {ring_index + 1} is {width[sample]:.2f} mm thick"
+                elif kind == "thin-wall":
+                    detail = f"wall inside tool {ring_index + 1} is {width[sample]:.2f} mm thick"
+                else:
+                    detail = f"tool {ring_index + 1} is {width[sample]:.2f} mm wide here"
+                x, y = points[sample]
+                # A symmetric narrow spot is seen from both of its sides
+                if any(np.hypot(x - rx, y - ry) <= min_width for rx, ry in reported):
+                    continue
+                reported.append((x, y))
+                problems.append(Problem(kind, int(ring_index) + 1, x, y, detail + f" (minimum {min_width:g} mm)"))
+    return problems
+
+
+def bin_problems(rings, gridx_size, gridy_size, chamfer_mm=0.0):
+    """Outlines (and their chamfers) that reach into the wall of a gridx x gridy bin centred on the layout."""
+    limit = np.array([gridx_size, gridy_size]) * BIN_PITCH / 2 - BIN_CLEARANCE - MIN_BIN_WALL
+    problems = []
+    for index, ring in enumerate(rings):
+        excess = np.abs(ring) - limit
+        worst = np.unravel_index(np.argmax(excess), excess.shape)
+        depth = excess[worst]
+        x, y = ring[worst[0]]
+        if depth > MIN_BIN_WALL:
+            problems.append(Problem("outside-bin", index + 1, x, y,
+                                    f"tool {index + 1} reaches {depth - MIN_BIN_WALL:.2f} mm past the outside of the bin"))
+        elif depth > 0:
+            problems.append(Problem("in-bin-wall", index + 1, x, y,
+                                    f"tool {index + 1} leaves {MIN_BIN_WALL - depth:.2f} mm of bin wall "
+                                    f"(minimum {MIN_BIN_WALL} mm)"))
+        elif depth + chamfer_mm > 0:
+            problems.append(Problem("chamfer-in-wall", index + 1, x, y,
+                                    f"the chamfer of tool {index + 1} reaches {depth + chamfer_mm:.2f} mm into the bin wall"))
+    return problems
+
+
+def check_outlines(polylines, gridx_size, gridy_size, chamfer_mm=0.0, min_width=MIN_WIDTH):
+    """
+    All problems of closed outlines in mm (see the module docstring),
+    errors first.
+    """
+    rings = _rings(polylines)
+    if not rings or min(len(ring) for ring in rings) == 0:
+        return []
+    outlines = Outlines(rings)
+    problems, overlapping = intersection_problems(outlines)
+    problems += bin_problems(rings, gridx_size, gridy_size, chamfer_mm)
+    problems += width_problems(outlines, min_width, overlapping)
+    return sorted(problems, key=lambda p: (p.kind not in ERRORS, p.tool, p.kind))
+
+
+def problem_dict(problem):
+    return {"kind": problem.kind, "tool": problem.tool, "x": round(float(problem.x), 2),
+            "y": round(float(problem.y), 2), "detail": problem.detail}
+
+
+def format_problem(problem):
+    """One report line from a Problem or a problem_dict."""
+    problem = problem._asdict() if isinstance(problem, Problem) else problem
+    level = "ERROR" if problem["kind"] in ERRORS else "warning"
+    return f"{level}: {problem['detail']} at ({problem['x']:.2f}, {problem['y']:.2f}) mm"
+
+
+def error_count(problems):
+    return sum(1 for problem in problems if
+               (problem.kind if isinstance(problem, Problem) else problem["kind"]) in ERRORS)
@@ -0,0 +1,95 @@
+"""
+Circle / rectangle detection for the tool outlines.
+
+Round and rectangular pockets cut far faster as the native cylinders and
+boxes of gridfinity_shape_cutter.scad's shape_cutouts() than as imported
+DXF polygons. Every outline is tested against the circle through it (least
+squares centre, enclosing radius) and then against its minimum area
+rectangle; it becomes that primitive when no outline point is further
+than the tolerance from it, otherwise it stays a freeform DXF outline.
+
+The offset rounds the corners of a rectangular outline with the offset
+radius, so rectangles are compared with a box with corners of that
+radius; the emitted box has sharp corners and cuts those corners out.
+
+Shapes are measured in the DXF frame (x = image row, y = image column,
+see dxf_writer.polyline_points), so shape_data lines up with the DXFs.
+"""
+import collections
+
+import cv2
+import numpy as np
+
+# kind: "circle" or "rectangle"; center (x, y), size (width, height; the
+# diameter and 0 for a circle), angle of the width axis in degrees and
+# error, the largest distance of an outline point from the shape, all in
+# the units of the points.
+Shape = collections.namedtuple("Shape", ["kind", "center", "size", "angle", "error"])
+
+
+def _dxf_frame(contour):
+    return np.asarray(contour, dtype=np.float64).reshape(-1, 2)[:, ::-1]
+
+
+def fit_circle(points):
+    """Least squares (Kasa) circle centre of (n, 2) points."""
+    x, y = points[:, 0], points[:, 1]
+    a = np.column_stack([x, y, np.ones(len(points))])
+    b = x * x + y * y
+    (cx2, cy2, _), *_ = np.linalg.lstsq(a, b, rcond=None)
+    return np.array([cx2 / 2, cy2 / 2])
+
+
+def circle_shape(points):
+    centre = fit_circle(points)
+    radii = np.linalg.norm(points - centre, axis=1)
+    # The enclosing radius, so the pocket never cuts into the outline
+    return Shape("circle", tuple(centre), (2 * radii.max(), 0.0), 0.0, float(radii.max() - radii.min()))
+
+
+def rectangle_shape(points, corner_radius=0.0):
+    box = cv2.boxPoints(cv2.minAreaRect(points.astype(np.float32))).astype(np.float64)
+    width_axis, height_axis = box[1] - box[0], box[2] - box[1]
+    width, height = np.linalg.norm(width_axis), np.linalg.norm(height_axis)
+    if width == 0 or height == 0:
+        return None
+    centre = box.mean(axis=0)
+    u = width_axis / width
+    local = np.column_stack([(points - centre) @ u, (points - centre) @ np.array([-u[1], u[0]])])
+    # Signed distance to the box with rounded corners
+    radius = min(corner_radius, width / 2, height / 2)
+    q = np.abs(local) - (width / 2 - radius, height / 2 - radius)
+    distance = np.linalg.norm(np.maximum(q, 0), axis=1) + np.minimum(q.max(axis=1), 0) - radius
+    angle = float(np.degrees(np.arctan2(u[1], u[0])))
+    return Shape("rectangle", tuple(centre), (width, height), angle, float(np.abs(distance).max()))
+
+
+def classify_contour(contour, tolerance, corner_radius=0.0):
+    """The circle or rectangle Shape of one outline (in px), or None for a freeform outline."""
+    points = _dxf_frame(contour)
+    if len(points) < 3:
+        return None
+    circle = circle_shape(points)
+    if circle.error <= tolerance:
+        return circle
+    rectangle = rectangle_shape(points, corner_radius)
+    if rectangle is not None and rectangle.error <= tolerance:
+        return rectangle
+    return None
+
+
+def shape_data_row(shape, scale_factor, center_row, center_col, depth):
+    """
+    One shape_data entry, [x, y, width, height, depth, angle] in inches and
+    degrees, relative to the same centre as the DXFs.
+    """
+    x = (shape.center[0] - center_row) * scale_factor
+    y = (shape.center[1] - center_col) * scale_factor
+    width, height = (size * scale_factor for size in shape.size)
+    return [round(float(value), 4) for value in (x, y, width, height, depth)] + [round(shape.angle, 2)]
+
+
+def shape_summary(shape_data, freeform_count):
+    circles = sum(1 for row in shape_data if row[3] == 0)
+    return (f"Shapes: {circles} circles and {len(shape_data) - circles} rectangles cut as shape_data, "
+            f"{freeform_count} freeform outlines")
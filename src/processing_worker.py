@@ -0,0 +1,169 @@
+"""
+Background processing for the Step 1 window.
+
+Process runs the pipeline stages on a QThreadPool worker so the window
+stays responsive while large photos are thresholded, offset and written
+to DXF. Every request gets a generation number: submitting a new one
+cancels the request in flight (it stops at the next stage boundary) and
+progress or results from anything but the newest generation are dropped,
+so only the latest settings ever reach the canvas. supersede() drops the
+request in flight the same way without a new one, for the live preview.
+"""
+import threading
+import traceback
+
+from PyQt5 import QtCore
+
+from src.processing import pipeline_cache, measure_token, offset_tool_contours, export_tool_contours  # type: ignore
+
+STAGES = ("Thresholding", "Finding token", "Offsetting contours", "Writing DXF")
+
+
+class ProcessingCancelled(Exception):
+    pass
+
+
+def run_processing(image, params, file_name, folder_name, progress, cancelled):
+    """
+    Every Qt-free step of Process for one image with the job's own
+    ProcessParams. Returns a result dict with the contours to display and
+    the DXF output (also recorded in the job's manifest); raises
+    ProcessingCancelled when `cancelled()` turns true between stages.
+    """
+    def stage(index):
+        if cancelled():
+            raise ProcessingCancelled()
+        progress(f"{STAGES[index]} ({index + 1}/{len(STAGES)})")
+
+    with pipeline_cache.lock:
+        stage(0)
+        pipeline_cache.set_image(image)
+        pipeline_cache.threshold(params.threshold)
+
+        stage(1)
+        diameter, token_message, traced_contours = measure_token(params.threshold, params.token)
+        result = {"diameter": diameter, "token_message": token_message, "dxf_path": None,
+                  "file_name": file_name, "folder_name": folder_name}
+        if diameter is None:
+            result["stages"] = pipeline_cache.take_ran()
+            return result
+        result["traced_contours"] = traced_contours
+
+        stage(2)
+        contours, filtered_contours, _ = offset_tool_contours(
+            params.threshold, params.token, params.offset, params.resolution, params.offset_method,
+            curve_tolerance=params.curve_tolerance)
+        result["offset_contours"] = filtered_contours.contours
+
+        stage(3)
+        dxf_path, gridx_size, gridy_size, export_report, message = export_tool_contours(
+            contours, file_name, folder_name, params, diameter)
+        result.update(dxf_path=dxf_path, gridx_size=gridx_size, gridy_size=gridy_size, export_report=export_report,
+                      dxf_message=message)
+        result["stages"] = pipeline_cache.take_ran()
+        if cancelled():
+            raise ProcessingCancelled()
+        return result
+
+
+class ProcessingSignals(QtCore.QObject):
+    progress = QtCore.pyqtSignal(int, str)
+    finished = QtCore.pyqtSignal(int, object)
+    failed = QtCore.pyqtSignal(int, str)
+    cancelled = QtCore.pyqtSignal(int)
+
+
+class ProcessingJob(QtCore.QRunnable):
+    def __init__(self, generation, image, params, file_name, folder_name):
+        super().__init__()
+        self.generation = generation
+        self.image = image
+        self.params = params
+        self.file_name = file_name
+        self.folder_name = folder_name
+        self.cancel_event = threading.Event()
+        self.signals = ProcessingSignals()
+
+    def run(self):
+        try:
+            result = run_processing(self.image, self.params, self.file_name, self.folder_name,
+                                    lambda message: self.signals.progress.emit(self.generation, message),
+                                    self.cancel_event.is_set)
+            self.signals.finished.emit(self.generation, result)
+        except ProcessingCancelled:
+            self.signals.cancelled.emit(self.generation)
+        except Exception as e:
+            print(traceback.format_exc())
+            self.signals.failed.emit(self.generation, str(e))
+
+
+class ProcessingRunner(QtCore.QObject):
+    """
+    Runs one ProcessingJob at a time and forwards progress, results,
+    errors and cancellation of the newest one to the given callbacks on the
+    GUI thread.
+    """
+
+    def __init__(self, on_progress, on_finished, on_failed, on_cancelled, parent=None):
+        super().__init__(parent)
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.on_failed = on_failed
+        self.on_cancelled = on_cancelled
+        self.generation = 0
+        self.jobs = {}  # generation -> job, kept referenced until it reports back
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+
+    def submit(self, image, params, file_name, folder_name):
+        """Start processing `image`, superseding anything in flight."""
+        self.cancel()
+        self.generation += 1
+        job = ProcessingJob(self.generation, image, params, file_name, folder_name)
+        job.signals.progress.connect(self._progress)
+        job.signals.finished.connect(self._finished)
+        job.signals.failed.connect(self._failed)
+        job.signals.cancelled.connect(self._cancelled)
+        self.jobs[self.generation] = job
+        self.pool.start(job)
+        return self.generation
+
+    def cancel(self):
+        for job in self.jobs.values():
+            job.cancel_event.set()
+
+    def supersede(self):
+        """
+        Cancel anything in flight without reporting it: the generation moves
+        on, so its progress, result and cancellation are all dropped.
+        """
+        self.cancel()
+        self.generation += 1
+
+    @QtCore.pyqtSlot(int, str)
+    def _progress(self, generation, message):
+        job = self.jobs.get(generation)
+        if generation == self.generation and job is not None and not job.cancel_event.is_set():
+            self.on_progress(message)
+
+    @QtCore.pyqtSlot(int, object)
+    def _finished(self, generation, result):
+        job = self.jobs.pop(generation, None)
+        if generation != self.generation or job is None:
+            return
+        if job.cancel_event.is_set():
+            self.on_cancelled()  # Cancelled after its last stage check
+        else:
+            self.on_finished(result)
+
+    @QtCore.pyqtSlot(int, str)
+    def _failed(self, generation, message):
+        self.jobs.pop(generation, None)
+        if generation == self.generation:
+            self.on_failed(message)
+
+    @QtCore.pyqtSlot(int)
+    def _cancelled(self, generation):
+        self.jobs.pop(generation, None)
+        if generation == self.generation:
+            self.on_cancelled()
@@ -0,0 +1,328 @@
+"""
+Content-addressed cache for rendered STLs.
+
+A render is keyed by digests of everything that can change its output:
+the .scad text, every DXF/SVG it imports, every library file reached
+through include <...> / use <...> (resolved like OpenSCAD does, relative to
+the including file and then the repository root), the OpenSCAD version and
+the geometry backend. STLs are stored under that key; a hit is a file copy.
+
+The cache is trimmed to a size limit by evicting the least recently used
+entries (a hit touches the entry's mtime). For every .scad path the input
+digests of its last render are remembered in index.json, so a miss can say
+which input changed.
+
+A split-mode board can also be cached tool by tool (see
+src/render_queue.py): the cut body of one tool is keyed by the template
+code, only the customizer settings that body reads (its own entries of
+the per-tool lists and the few shared settings such as the chamfer) and
+only its own DXFs, so editing one tool leaves the other bodies cached.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+CACHE_DIR = os.environ.get("STL_CACHE_DIR", os.path.join(PROJECT_ROOT, ".stl_cache"))
+CACHE_SIZE_MB = 2048
+LIBRARY_REFERENCE = re.compile(r'\b(?:include|use)\s*<([^>]+)>')
+ASSET_REFERENCE = re.compile(r'"([^"]+\.(?:dxf|svg|stl))"', re.IGNORECASE)
+COMMENT = re.compile(r'/\*.*?\*/|//[^\n]*', re.DOTALL)
+ASSIGNMENT = re.compile(r'^(\w+)\s*=\s*([^;]*);', re.MULTILINE)
+IDENTIFIER = re.compile(r'\b[A-Za-z_]\w*\b')
+STRING = re.compile(r'"(?:[^"\\]|\\.)*"')
+CUSTOMIZER_END = "module end_of_customizer_opts() {}"
+# Settings tool_cut() in the Step 2 template reads, and the per-tool lists it indexes
+TOOL_CUT_SETTINGS = ["width", "depth", "height", "chamfer_height", "chamfer_method", "chamfer_layer_count",
+                     "chamfer_layer_height", "use_chamfered_extrude", "use_section_cut", "use_finger_slots",
+                     "include_cutout", "cutout_height", "fa", "fs", "fn"]
+TOOL_CUT_LISTS = ["dxf_file_paths", "dxf_cut_depths", "position", "section_cut_depth", "section_parameters",
+                  "slot_shape", "slot_params", "slot_pos"]
+_versions = {}
+
+
+def file_digest(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_digest(text):
+    return hashlib.blake2b(text.encode(), digest_size=16).hexdigest()
+
+
+def openscad_version(executable):
+    """`openscad --version` output (printed on stderr), asked once per executable."""
+    if executable not in _versions:
+        try:
+            result = subprocess.run([executable, "--version"], capture_output=True, text=True, timeout=30)
+            _versions[executable] = (result.stdout + result.stderr).strip()
+        except (OSError, subprocess.SubprocessError) as e:
+            _versions[executable] = f"unknown ({e})"
+    return _versions[executable]
+
+
+def _references(pattern, text):
+    # References inside comments (library docs quote their own use <...> lines) are not inputs
+    return pattern.findall(COMMENT.sub("", text))
+
+
+def _display_name(path, scad_dir):
+    base = PROJECT_ROOT if path.startswith(PROJECT_ROOT + os.sep) else scad_dir
+    return os.path.relpath(path, base).replace("\\", "/")
+
+
+def _resolve(reference, including_dir):
+    for base in (including_dir, PROJECT_ROOT):
+        path = os.path.normpath(os.path.join(base, reference))
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _asset_inputs(references, scad_dir):
+    inputs = {}
+    for reference in sorted(set(references)):
+        path = _resolve(reference, scad_dir)
+        inputs[f"asset:{reference}"] = file_digest(path) if path else "missing"
+    return inputs
+
+
+def _library_inputs(text, scad_dir):
+    inputs = {}
+    pending = [(reference, scad_dir) for reference in _references(LIBRARY_REFERENCE, text)]
+    seen = set()
+    while pending:
+        reference, including_dir = pending.pop()
+        path = _resolve(reference, including_dir)
+        if path is None:
+            inputs[f"library:{reference}"] = "missing"
+            continue
+        if path in seen:
+            continue
+        seen.add(path)
+        inputs[f"library:{_display_name(path, scad_dir)}"] = file_digest(path)
+        with open(path, "r", errors="replace") as f:
+            pending += [(ref, os.path.dirname(path)) for ref in _references(LIBRARY_REFERENCE, f.read())]
+    return inputs
+
+
+def render_inputs(scad_path, executable=None, backend="manifold"):
+    """
+    {input name: digest} for one render. Asset names are kept as written
+    in the .scad file and library names relative to the repository, so the
+    report is readable.
+    """
+    scad_path = os.path.abspath(scad_path)
+    scad_dir = os.path.dirname(scad_path)
+    with open(scad_path, "r") as f:
+        text = f.read()
+    inputs = {"scad": text_digest(text), "backend": backend or "default"}
+    if executable:
+        inputs["openscad"] = openscad_version(executable)
+    inputs.update(_asset_inputs(_references(ASSET_REFERENCE, text), scad_dir))
+    inputs.update(_library_inputs(text, scad_dir))
+    return inputs
+
+
+def _settings(text):
+    """{name: value text} of the customizer settings (the assignments before end_of_customizer_opts)."""
+    head = text.partition(CUSTOMIZER_END)[0]
+    return {name: " ".join(value.split()) for name, value in ASSIGNMENT.findall(COMMENT.sub("", head))}
+
+
+def _split_items(text):
+    """Top level comma separated items of a list body."""
+    items, depth, start, quoted = [], 0, 0, False
+    for index, char in enumerate(text):
+        if char == '"' and (index == 0 or text[index - 1] != "\\"):
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char in "[(":
+            depth += 1
+        elif char in "])":
+            depth -= 1
+        elif char == "," and depth == 0:
+            items.append(text[start:index].strip())
+            start = index + 1
+    if text[start:].strip():
+        items.append(text[start:].strip())
+    return items
+
+
+def _list_items(value, settings, depth=0):
+    """Items of a list setting through names and concat(), None for any other expression."""
+    value = value.strip()
+    if depth > 10:
+        return None
+    if value in settings:
+        return _list_items(settings[value], settings, depth + 1)
+    concat = re.fullmatch(r'concat\((.*)\)', value, re.DOTALL)
+    if concat:
+        items = []
+        for part in _split_items(concat.group(1)):
+            part_items = _list_items(part, settings, depth + 1)
+            if part_items is None:
+                return None
+            items += part_items
+        return items
+    if value.startswith("[") and value.endswith("]"):
+        return _split_items(value[1:-1])
+    return None
+
+
+def tool_cut_count(text):
+    """Number of split DXFs of a board that can be rendered tool by tool, 0 if it cannot."""
+    settings = _settings(text)
+    if CUSTOMIZER_END not in text or "cut_part" not in settings or settings.get("multiple_dxf") != "true":
+        return 0
+    return len(_list_items(settings.get("dxf_file_paths", ""), settings) or [])
+
+
+def tool_cut_settings(text, index):
+    """
+    {name: value text} of the settings the cut body of split DXF `index`
+    reads: its items of the per-tool lists (e.g. "position[2]") and the
+    shared settings, following the names their values refer to.
+    """
+    settings = _settings(text)
+    values, pending = {}, list(TOOL_CUT_SETTINGS)
+    for name in TOOL_CUT_LISTS:
+        items = _list_items(settings.get(name, ""), settings)
+        if items is None or index >= len(items):
+            pending.append(name)  # Not a plain list, the body depends on all of it
+        else:
+            values[f"{name}[{index}]"] = items[index]
+            pending += IDENTIFIER.findall(STRING.sub("", items[index]))
+    while pending:
+        name = pending.pop()
+        if name in values or name not in settings:
+            continue
+        values[name] = settings[name]
+        pending += IDENTIFIER.findall(STRING.sub("", settings[name]))
+    return values
+
+
+def tool_cut_inputs(scad_path, index, executable=None, backend="manifold"):
+    """
+    render_inputs for the cut body of split DXF `index`: the template code
+    after the customizer settings, the settings of tool_cut_settings and
+    only this tool's DXF and chamfer slices.
+    """
+    scad_path = os.path.abspath(scad_path)
+    scad_dir = os.path.dirname(scad_path)
+    with open(scad_path, "r") as f:
+        text = f.read()
+    inputs = {"template": text_digest(text.partition(CUSTOMIZER_END)[2]), "backend": backend or "default"}
+    if executable:
+        inputs["openscad"] = openscad_version(executable)
+    settings = tool_cut_settings(text, index)
+    inputs.update({f"setting:{name}": value for name, value in settings.items()})
+    dxf = settings.get(f"dxf_file_paths[{index}]", "").strip('"')
+    if dxf:
+        # chamfer_dxf_path() in the template
+        inputs.update(_asset_inputs([dxf, dxf[:-4] + "_chamfer.dxf"], scad_dir))
+    inputs.update(_library_inputs(text, scad_dir))
+    return inputs
+
+
+def render_key(inputs):
+    return text_digest(json.dumps(inputs, sort_keys=True))
+
+
+def explain_miss(previous, inputs):
+    """Human readable reason why these inputs miss, given the last render's inputs."""
+    if previous is None:
+        return "first render of this file"
+    changed = [name for name in inputs if previous.get(name) != inputs[name]]
+    removed = [name for name in previous if name not in inputs]
+    if not changed and not removed:
+        return "evicted from the cache"
+    parts = []
+    if changed:
+        parts.append("changed: " + ", ".join(sorted(changed)))
+    if removed:
+        parts.append("no longer used: " + ", ".join(sorted(removed)))
+    return "; ".join(parts)
+
+
+class RenderCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_size_mb=CACHE_SIZE_MB):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_size_mb * 1024 * 1024
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".stl")
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def lookup(self, scad_path, executable=None, backend="manifold", inputs=None):
+        """
+        Returns (key, inputs, cached STL path or None, miss reason or None).
+        `inputs` replaces the render_inputs of the whole file (see tool_cut_inputs).
+        """
+        inputs = inputs if inputs is not None else render_inputs(scad_path, executable, backend)
+        key = render_key(inputs)
+        entry = self._entry_path(key)
+        try:
+            os.utime(entry)  # most recently used
+            return key, inputs, entry, None
+        except OSError:
+            pass  # not cached, or just evicted by another worker
+        with self._lock:
+            previous = self._load_index().get(os.path.abspath(scad_path))
+        return key, inputs, None, explain_miss(previous and previous.get("inputs"), inputs)
+
+    def store(self, key, inputs, scad_path, stl_path):
+        entry = self._entry_path(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp_path = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(stl_path, tmp_path)
+        os.replace(tmp_path, entry)
+        with self._lock:
+            index = self._load_index()
+            index[os.path.abspath(scad_path)] = {"key": key, "inputs": inputs}
+            tmp_index = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_index, "w") as f:
+                json.dump(index, f, indent=1)
+            os.replace(tmp_index, self.index_path)
+        self.evict()
+        return entry
+
+    def evict(self):
+        """Drop least recently used STLs until the cache fits its size limit."""
+        entries = []
+        for folder, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".stl"):
+                    path = os.path.join(folder, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue  # removed by another worker's evict()
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        return total
@@ -0,0 +1,338 @@
+"""
+Headless OpenSCAD renders.
+
+Renders the generated .scad files to STL with the OpenSCAD command line
+instead of opening each one in the GUI: a bounded number of openscad
+processes run at once, each render has a timeout and is retried on
+failure, its output is captured to `<name>.stl.log`, and a
+`render_summary.csv` with the render times is written next to the STLs.
+Unchanged boards are served from the STL cache (src/render_cache.py) and
+the summary says which input made every other render miss.
+
+Boards whose job manifest records geometry errors from the pre-flight
+check (src/preflight.py: crossing or overlapping outlines, tools outside
+the bin) are not rendered unless --force is given; they would only fail
+or print wrong after the render.
+
+With the cache on, split-mode boards are rendered tool by tool: every
+tool's cut body (`<name>.cut_N.scad`, the template with cut_part = N - 1)
+is rendered and cached as its own STL, then `<name>.board.scad` subtracts
+those meshes from the bin in a single difference. Editing one tool costs
+one small cut body render plus that final subtraction.
+
+The executable is looked up from --openscad, the OPENSCAD environment
+variable, the PATH and the usual install locations, so a stub script can
+stand in for it.
+
+Usage (from the repository root):
+    python -m src.render_queue "Tool Cart 3" --workers 2 --timeout 1800 --retries 1
+"""
+import argparse
+import concurrent.futures
+import csv
+import functools
+import os
+import re
+import shutil
+import subprocess
+import sys
+import time
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.manifest import load_manifest  # type: ignore
+from src.preflight import ERRORS, format_problem  # type: ignore
+from src.render_cache import RenderCache, CACHE_DIR, CACHE_SIZE_MB, tool_cut_count, tool_cut_inputs  # type: ignore
+
+OPENSCAD_PATHS = [
+    "/usr/bin/openscad",
+    "/usr/local/bin/openscad",
+    "/snap/bin/openscad",
+    "/Applications/OpenSCAD.app/Contents/MacOS/OpenSCAD",
+    "C:/Program Files/OpenSCAD/openscad.exe",
+    "C:/Program Files/OpenSCAD (Nightly)/openscad.exe",
+]
+DEFAULT_TIMEOUT = 30 * 60  # s, minkowski chamfers take minutes without manifold
+SUMMARY_FIELDS = ["scad", "stl", "status", "attempts", "render_time", "cache", "tool_cuts", "log", "error"]
+DONE_STATUSES = ("ok", "cached")
+CUT_PART = "cut_part = -1;"
+CUT_BODIES = "cut_bodies = [];"
+PART_FILE = re.compile(r'\.(?:cut_\d+|board)\.scad$', re.IGNORECASE)  # written by render_tools
+
+
+def find_openscad(explicit=None):
+    """Path of the OpenSCAD executable, or None."""
+    candidates = [explicit, os.environ.get("OPENSCAD"), shutil.which("openscad"), shutil.which("openscad-nightly")]
+    for path in candidates + OPENSCAD_PATHS:
+        if path and os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def supports_manifold(executable):
+    """True if this OpenSCAD knows --backend (2024+ builds with manifold)."""
+    try:
+        result = subprocess.run([executable, "--help"], capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.SubprocessError):
+        return False
+    return "--backend" in result.stdout + result.stderr
+
+
+def render_command(executable, scad_path, stl_path, backend="manifold"):
+    command = [executable, "-o", stl_path]
+    if backend and supports_manifold(executable):
+        command.append(f"--backend={backend}")
+    command.append(scad_path)
+    return command
+
+
+def render_one(scad_path, executable, output_dir=None, timeout=DEFAULT_TIMEOUT, retries=1, backend="manifold",
+               cache=None, inputs=None, name=None):
+    """
+    Render one .scad file to STL (`name`.stl, default the file's name), or
+    copy it from `cache` (a RenderCache) when nothing it depends on changed;
+    `inputs` replaces the cache inputs of the whole file. Returns a summary
+    dict; failures are reported in it (status 'failed' or 'timeout')
+    rather than raised.
+    """
+    output_dir = output_dir or os.path.dirname(os.path.abspath(scad_path))
+    name = name or os.path.splitext(os.path.basename(scad_path))[0]
+    stl_path = os.path.join(output_dir, name + ".stl")
+    # OpenSCAD picks the format from the extension, so the partial file still ends in .stl
+    partial_path = os.path.join(output_dir, name + ".partial.stl")
+    log_path = stl_path + ".log"
+    summary = {"scad": scad_path, "stl": None, "status": "failed", "attempts": 0, "render_time": None,
+               "cache": "off", "tool_cuts": "", "log": log_path, "error": None}
+    if cache is not None:
+        key, inputs, cached_stl, miss_reason = cache.lookup(scad_path, executable, backend, inputs)
+        if cached_stl is not None:
+            try:
+                shutil.copyfile(cached_stl, stl_path)
+                summary.update(stl=stl_path, status="cached", render_time=0.0, cache="hit")
+                return summary
+            except OSError:
+                # Another worker's store() evicted it since the lookup
+                miss_reason = "evicted from the cache"
+        summary["cache"] = f"miss ({miss_reason})"
+    command = render_command(executable, scad_path, partial_path, backend)
+    with open(log_path, "w") as log:
+        for attempt in range(1, retries + 2):
+            summary["attempts"] = attempt
+            log.write(f"--- attempt {attempt}: {' '.join(command)}\n")
+            log.flush()
+            start = time.perf_counter()
+            try:
+                result = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+                log.write(result.stdout + result.stderr)
+                if result.returncode == 0 and os.path.exists(partial_path) and os.path.getsize(partial_path) > 0:
+                    os.replace(partial_path, stl_path)
+                    summary.update(stl=stl_path, status="ok", render_time=time.perf_counter() - start, error=None)
+                    break
+                summary.update(status="failed", error=f"exit code {result.returncode}")
+            except subprocess.TimeoutExpired as e:
+                # The partial output comes back as bytes even with text=True
+                for output in (e.stdout, e.stderr):
+                    if output:
+                        log.write(output.decode(errors="replace") if isinstance(output, bytes) else output)
+                log.write(f"\ntimed out after {timeout} s\n")
+                summary.update(status="timeout", error=f"timed out after {timeout} s")
+            except OSError as e:
+                summary.update(status="failed", error=str(e))
+                break  # The executable itself is unusable, retrying will not help
+            finally:
+                log.flush()
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+    if cache is not None and summary["status"] == "ok":
+        cache.store(key, inputs, scad_path, stl_path)
+    return summary
+
+
+def _write_text(path, text):
+    # Rewriting an unchanged file would only touch its mtime
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            if f.read() == text:
+                return
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def render_tools(scad_path, executable, output_dir=None, timeout=DEFAULT_TIMEOUT, retries=1, backend="manifold",
+                 cache=None):
+    """
+    Render a split-mode board tool by tool (see the module docstring).
+    Boards with a single tool, other files and every file without a cache
+    go through render_one.
+    """
+    with open(scad_path, "r") as f:
+        text = f.read()
+    count = tool_cut_count(text) if cache is not None and CUT_PART in text and CUT_BODIES in text else 0
+    if count < 2:
+        return render_one(scad_path, executable, output_dir, timeout, retries, backend, cache)
+    folder = os.path.dirname(os.path.abspath(scad_path))
+    output_dir = output_dir or folder
+    name = os.path.splitext(os.path.basename(scad_path))[0]
+
+    # The cut files sit next to the board so its relative DXF and library paths still resolve
+    parts = []
+    for index in range(count):
+        part_path = os.path.join(folder, f"{name}.cut_{index + 1}.scad")
+        _write_text(part_path, text.replace(CUT_PART, f"cut_part = {index};", 1))
+        inputs = tool_cut_inputs(part_path, index, executable, backend)
+        parts.append(render_one(part_path, executable, output_dir, timeout, retries, backend, cache, inputs))
+    part_time = sum(part["render_time"] or 0 for part in parts)
+    cached = sum(1 for part in parts if part["status"] == "cached")
+    tool_cuts = f"{cached}/{count} cached"
+    failed = [part for part in parts if part["status"] not in DONE_STATUSES]
+    if failed:
+        part = failed[0]
+        return dict(part, scad=scad_path, stl=None, tool_cuts=tool_cuts, parts=parts,
+                    error=f"cut body {os.path.basename(part['scad'])}: {part['error']}")
+
+    bodies = [os.path.relpath(part["stl"], folder).replace("\\", "/") for part in parts]
+    board_path = os.path.join(folder, f"{name}.board.scad")
+    _write_text(board_path, text.replace(CUT_BODIES, "cut_bodies = [" + ", ".join(f'"{b}"' for b in bodies) + "];", 1))
+    summary = render_one(board_path, executable, output_dir, timeout, retries, backend, cache, name=name)
+    summary.update(scad=scad_path, tool_cuts=tool_cuts, parts=parts)
+    if summary["render_time"] is not None:
+        summary["render_time"] += part_time
+    return summary
+
+
+def find_scad_files(folder):
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder)
+                  if f.lower().endswith(".scad") and not PART_FILE.search(f))
+
+
+def geometry_errors(scad_path):
+    """Pre-flight errors recorded in the job manifest next to a .scad file (none without a manifest)."""
+    folder, name = os.path.split(os.path.abspath(scad_path))
+    try:
+        manifest = load_manifest(folder, os.path.splitext(name)[0]) or {}
+    except (OSError, ValueError):
+        return []
+    return [problem for problem in manifest.get("problems", []) if problem["kind"] in ERRORS]
+
+
+def invalid_summary(scad_path, errors):
+    return {"scad": scad_path, "stl": None, "status": "invalid", "attempts": 0, "render_time": None, "cache": "off",
+            "tool_cuts": "", "log": "", "error": "; ".join(format_problem(problem) for problem in errors)}
+
+
+def run_queue(scad_files, executable, workers=2, output_dir=None, timeout=DEFAULT_TIMEOUT, retries=1, backend="manifold",
+              cache=None, per_tool=True, force=False):
+    """
+    Render every file with at most `workers` OpenSCAD processes at once,
+    skipping boards with pre-flight geometry errors unless `force`.
+    """
+    summaries = []
+    render = render_tools if per_tool else render_one
+    # Threads only wait on the openscad processes, so they bound the process count
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for path in scad_files:
+            errors = [] if force else geometry_errors(path)
+            if errors:
+                summary = invalid_summary(path, errors)
+                summaries.append(summary)
+                print(format_summary_line(summary))
+            else:
+                futures.append(executor.submit(render, path, executable, output_dir, timeout, retries, backend, cache))
+        for future in concurrent.futures.as_completed(futures):
+            summary = future.result()
+            summaries.append(summary)
+            print(format_summary_line(summary))
+    summaries.sort(key=lambda s: s["scad"])
+    return summaries
+
+
+def format_summary_line(summary):
+    name = os.path.basename(summary["scad"])
+    tool_cuts = f", tool cuts {summary['tool_cuts']}" if summary.get("tool_cuts") else ""
+    if summary["status"] == "cached":
+        line = f"{name}: cached{tool_cuts}"
+    elif summary["status"] == "invalid":
+        line = f"{name}: INVALID, not rendered (pass --force to render anyway)\n  " + summary["error"].replace("; ", "\n  ")
+    elif summary["status"] != "ok":
+        line = f"{name}: {summary['status'].upper()} after {summary['attempts']} attempt(s) ({summary['error']}), see {summary['log']}"
+    else:
+        cache = f", cache {summary['cache']}" if summary["cache"] != "off" else ""
+        line = f"{name}: {summary['render_time']:.1f} s ({summary['attempts']} attempt(s){cache}{tool_cuts})"
+    for part in summary.get("parts", []):
+        if part["status"] == "ok":
+            line += f"\n  {os.path.basename(part['scad'])}: {part['render_time']:.1f} s, cache {part['cache']}"
+    return line
+
+
+def format_summary_table(summaries):
+    rows = [(os.path.basename(s["scad"]), s["status"], str(s["attempts"]),
+             f"{s['render_time']:.1f}" if s["render_time"] is not None else "-", s["cache"], s.get("tool_cuts") or "-")
+            for s in summaries]
+    header = ("file", "status", "attempts", "time (s)", "cache", "tool cuts")
+    widths = [max(len(row[i]) for row in rows + [header]) for i in range(len(header))]
+    lines = ["  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in [header] + rows]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    return "\n".join(lines)
+
+
+def write_summary(summaries, output_folder):
+    summary_path = os.path.join(output_folder, "render_summary.csv")
+    with open(summary_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(SUMMARY_FIELDS)
+        for summary in summaries:
+            row = dict(summary, render_time=round(summary["render_time"], 3) if summary["render_time"] is not None else "")
+            writer.writerow([row.get(field, "") for field in SUMMARY_FIELDS])
+    return summary_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render the generated .scad files to STL with OpenSCAD.")
+    parser.add_argument("paths", nargs="+", help=".scad files or project folders holding them")
+    parser.add_argument("--output", help="Folder for the STL files (default: next to each .scad file)")
+    parser.add_argument("--openscad", help="OpenSCAD executable (default: $OPENSCAD, the PATH, then the usual install folders)")
+    parser.add_argument("--workers", type=int, default=2, help="OpenSCAD processes to run at once")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="Seconds before a render is killed")
+    parser.add_argument("--retries", type=int, default=1, help="Extra attempts for a failed or timed out render")
+    parser.add_argument("--backend", default="manifold", help="OpenSCAD geometry backend, empty for the default")
+    parser.add_argument("--no-cache", action="store_true", help="Always render, do not use the STL cache")
+    parser.add_argument("--cache-dir", default=CACHE_DIR, help="STL cache folder (default: .stl_cache or $STL_CACHE_DIR)")
+    parser.add_argument("--cache-size-mb", type=float, default=CACHE_SIZE_MB, help="Size limit of the STL cache")
+    parser.add_argument("--whole-board", action="store_true",
+                        help="Render split-mode boards in one piece instead of caching every tool's cut body")
+    parser.add_argument("--force", action="store_true",
+                        help="Render boards even if their pre-flight check found geometry errors")
+    args = parser.parse_args(argv)
+
+    executable = find_openscad(args.openscad)
+    if executable is None:
+        print("OpenSCAD executable not found, pass --openscad or set OPENSCAD.")
+        return 1
+    scad_files = []
+    for path in args.paths:
+        scad_files += find_scad_files(path) if os.path.isdir(path) else [path]
+    if not scad_files:
+        print("No .scad files found.")
+        return 1
+    if args.output:
+        os.makedirs(args.output, exist_ok=True)
+
+    start = time.perf_counter()
+    cache = None if args.no_cache else RenderCache(args.cache_dir, args.cache_size_mb)
+    summaries = run_queue(scad_files, executable, args.workers, args.output, args.timeout, args.retries, args.backend,
+                          cache, per_tool=not args.whole_board, force=args.force)
+    print(format_summary_table(summaries))
+    summary_folder = args.output or os.path.dirname(os.path.abspath(scad_files[0]))
+    summary_path = write_summary(summaries, summary_folder)
+    failed = sum(1 for s in summaries if s["status"] not in DONE_STATUSES)
+    cached = sum(1 for s in summaries if s["status"] == "cached")
+    print(f"Rendered {len(summaries) - failed} of {len(summaries)} files ({cached} from the cache) in {time.perf_counter() - start:.1f} s")
+    print(f"Summary written to {summary_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
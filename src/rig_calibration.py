@@ -0,0 +1,192 @@
+"""
+Per-rig scale calibration.
+
+For a fixed camera over the lightbox the pixels-per-inch at the lightbox
+plane never changes, so it is measured once from the token and stored
+next to calibration_data.pkl together with the camera matrix it was
+measured with. In trusted rig mode the pipeline takes the token diameter
+from this file instead of detecting it, and only re-checks the token on
+every Nth image (in the background in the GUI) to warn about drift.
+
+The scale only holds for photos of the size it was measured on. A photo
+with the same aspect ratio but a different size (the camera set to a
+smaller resolution) gets the px/inch scaled with it; any other size is
+refused, re-save the rig scale for it.
+
+Measure and save the scale (from the repository root):
+    python -m src.rig_calibration "examples/Random Wrenches.jpg" --token 3 --threshold 145
+"""
+import argparse
+import concurrent.futures
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.image_io import read_image  # type: ignore
+from src.token_detector import TokenDetector  # type: ignore
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+CALIBRATION_FILE = os.path.join(PROJECT_ROOT, 'raw photos', 'calibration_files', 'calibration_data.pkl')
+RIG_SCALE_FILE = os.path.join(PROJECT_ROOT, 'raw photos', 'calibration_files', 'rig_scale.pkl')
+VERIFY_EVERY = 10  # images between token checks in trusted rig mode
+DRIFT_TOLERANCE = 0.02  # relative px/inch change that triggers a warning
+ASPECT_TOLERANCE = 0.005  # relative aspect ratio change still taken as the same frame resized
+
+
+def load_camera_matrix(calibration_file=CALIBRATION_FILE):
+    if not os.path.exists(calibration_file):
+        return None
+    with open(calibration_file, 'rb') as f:
+        return pickle.load(f)['camera_matrix']
+
+
+def save_rig_scale(px_per_inch, image_shape, token_size, rig_file=RIG_SCALE_FILE, calibration_file=CALIBRATION_FILE):
+    data = {
+        'px_per_inch': float(px_per_inch),
+        'image_shape': tuple(image_shape[:2]),
+        'token_size': float(token_size),
+        'camera_matrix': load_camera_matrix(calibration_file),
+        'saved': time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    os.makedirs(os.path.dirname(rig_file), exist_ok=True)
+    with open(rig_file, 'wb') as f:
+        pickle.dump(data, f)
+    return data
+
+
+def load_rig_scale(rig_file=RIG_SCALE_FILE, calibration_file=CALIBRATION_FILE):
+    """
+    Load the saved rig scale, or None if there is none or the camera has
+    been recalibrated since it was measured.
+    """
+    if not os.path.exists(rig_file):
+        return None
+    try:
+        with open(rig_file, 'rb') as f:
+            data = pickle.load(f)
+    except Exception as e:
+        print(f"Could not read rig scale: {e}")
+        return None
+    saved_matrix = data.get('camera_matrix')
+    current_matrix = load_camera_matrix(calibration_file)
+    if (saved_matrix is None) != (current_matrix is None) or (
+            saved_matrix is not None and not np.allclose(saved_matrix, current_matrix)):
+        print("Rig scale was measured with a different camera calibration, ignoring it.")
+        return None
+    return data
+
+
+class RigScale:
+    """
+    Trusted px/inch for a fixed rig with periodic token checks.
+
+    maybe_verify() runs the token detector on the first and then every
+    `verify_every`-th image it is given. In the background it runs on a
+    single worker thread; drift warnings are collected for take_warnings().
+    """
+
+    def __init__(self, px_per_inch, image_shape=None, verify_every=VERIFY_EVERY, drift_tolerance=DRIFT_TOLERANCE,
+                 background=True):
+        self.px_per_inch = px_per_inch
+        self.image_shape = tuple(image_shape[:2]) if image_shape is not None else None
+        self.verify_every = verify_every
+        self.drift_tolerance = drift_tolerance
+        self.background = background
+        self.images_seen = 0
+        self.last_measured = None
+        self.warnings = []
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1) if background else None
+
+    @classmethod
+    def load(cls, **kwargs):
+        data = load_rig_scale()
+        return cls(data['px_per_inch'], data.get('image_shape'), **kwargs) if data else None
+
+    def px_per_inch_for(self, image_shape):
+        """
+        px/inch for a photo of `image_shape`, scaled when it is the saved
+        frame resized. Raises ValueError when the aspect ratio differs too.
+        """
+        if self.image_shape is None or image_shape is None:
+            return self.px_per_inch
+        saved_h, saved_w = self.image_shape
+        h, w = image_shape[:2]
+        if (h, w) == (saved_h, saved_w):
+            return self.px_per_inch
+        if abs((w / h) / (saved_w / saved_h) - 1) > ASPECT_TOLERANCE:
+            raise ValueError(f"Trusted rig scale was measured on {saved_w}x{saved_h} photos, this one is {w}x{h}. "
+                             f"Re-save the rig scale for this image size.")
+        return self.px_per_inch * w / saved_w
+
+    def token_diameter(self, token, image_shape=None):
+        return self.px_per_inch_for(image_shape) * token
+
+    def maybe_verify(self, thresh, token):
+        due = self.images_seen % self.verify_every == 0
+        self.images_seen += 1
+        if not due:
+            return
+        if self._executor is not None:
+            self._executor.submit(self._verify, thresh, token)
+        else:
+            self._verify(thresh, token)
+
+    def _verify(self, thresh, token):
+        try:
+            expected = self.px_per_inch_for(thresh.shape)
+            match = TokenDetector(expected_diameter=expected * token).detect(thresh)
+            if match is None:
+                self.warnings.append("Trusted rig check: token not found in this image.")
+                return
+            self.last_measured = match.diameter / token
+            drift = self.last_measured / expected - 1
+            if abs(drift) > self.drift_tolerance:
+                message = (f"Trusted rig check: measured {self.last_measured:.2f} px/in, saved "
+                           f"{expected:.2f} px/in ({drift:+.1%}). Re-save the rig scale.")
+                print(message)
+                self.warnings.append(message)
+        except Exception as e:
+            self.warnings.append(f"Trusted rig check failed: {e}")
+
+    def take_warnings(self):
+        warnings, self.warnings = self.warnings, []
+        return warnings
+
+
+def measure_px_per_inch(image, threshold, token):
+    from src.pipeline import preprocess_image  # type: ignore
+    image, thresh = preprocess_image(image, threshold)
+    match = TokenDetector().detect(thresh)
+    if match is None:
+        return None, image.shape
+    return match.diameter / token, image.shape
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure and save the px/inch scale of a fixed camera rig.")
+    parser.add_argument("image", help="Photo taken on the rig with the token in view (any capture format, .npy too)")
+    parser.add_argument("--token", type=float, default=3.0, help="Token diameter in inches")
+    parser.add_argument("--threshold", type=float, default=110)
+    args = parser.parse_args(argv)
+
+    image = read_image(args.image)
+    if image is None:
+        print(f"Could not read {args.image}")
+        return 1
+    px_per_inch, shape = measure_px_per_inch(image, args.threshold, args.token)
+    if px_per_inch is None:
+        print("No token found, try another threshold.")
+        return 1
+    save_rig_scale(px_per_inch, shape, args.token)
+    print(f"Saved rig scale {px_per_inch:.2f} px/in to {RIG_SCALE_FILE}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+Scale token detection.
+
+The printed token (token 2.0 v4.f3d) is a six armed star: its outline is
+about 8x longer than its enclosing diameter and it fills ~57% of its
+enclosing circle, which nothing else on a lightbox photo does. Candidates
+are prefiltered on those numbers using the per-contour arrays from
+ContourSet, so minEnclosingCircle only runs on a handful of contours.
+
+On a fixed rig the token sits in the same place in every shot, so the
+detector remembers where it last found it and searches that region first,
+falling back to the full frame (and finally to the original greatest
+perimeter/diameter ratio search) only when that fails.
+
+Contours too small to be the token are skipped before any of that. The
+limit follows the photo rather than a fixed px^2 count: a share of the
+token area when the expected token diameter is known (a trusted rig),
+otherwise a share of the frame, so it holds at any camera resolution and
+on the downscaled preview.
+"""
+import collections
+
+import cv2
+import numpy as np
+
+from src.contour_set import ContourSet  # type: ignore
+
+TOKEN_P2D_RATIO = 8.1   # perimeter / enclosing diameter of the printed token
+TOKEN_FILL_RATIO = 0.575  # contour area / enclosing circle area
+MIN_P2D_RATIO = 5.0
+FILL_RANGE = (0.35, 0.8)
+MIN_TOKEN_FRACTION = 1.25e-4  # of the frame area, 1000 px^2 on an 8 MP photo
+MIN_EXPECTED_FRACTION = 0.25  # of the expected token area
+ROI_MARGIN = 0.5  # fraction of the token diameter added around the last ROI
+ROI_SIZE_TOLERANCE = 0.3  # allowed diameter change between shots in the ROI pass
+
+TokenMatch = collections.namedtuple(
+    "TokenMatch", ["contour", "center", "diameter", "ratio", "confidence", "bbox", "source"])
+
+
+def token_confidence(ratio, fill):
+    """0..1 score of how much a contour looks like the printed token."""
+    ratio_score = min(1.0, ratio / TOKEN_P2D_RATIO)
+    fill_score = max(0.0, 1.0 - abs(fill - TOKEN_FILL_RATIO) / TOKEN_FILL_RATIO)
+    return ratio_score * fill_score
+
+
+def token_area(diameter):
+    """Contour area in px^2 of a token with this enclosing diameter."""
+    return TOKEN_FILL_RATIO * np.pi * diameter ** 2 / 4
+
+
+class TokenDetector:
+    def __init__(self, min_area=None, expected_diameter=None):
+        self.min_area = min_area  # px^2, None to derive it from each image
+        self.expected_diameter = expected_diameter  # px, when the scale is already known
+        self.last_roi = None  # (x0, y0, x1, y1) in px
+        self.last_shape = None
+        self.last_diameter = None
+
+    def reset(self):
+        self.last_roi = None
+        self.last_shape = None
+        self.last_diameter = None
+
+    def min_token_area(self, shape):
+        """Smallest contour area in px^2 taken as a token candidate in a mask of `shape`."""
+        if self.min_area is not None:
+            return self.min_area
+        if self.expected_diameter:
+            return MIN_EXPECTED_FRACTION * token_area(self.expected_diameter)
+        return MIN_TOKEN_FRACTION * shape[0] * shape[1]
+
+    def detect(self, thresh):
+        """Return a TokenMatch for the token in a threshold mask, or None."""
+        match = None
+        if self.last_roi is not None and thresh.shape == self.last_shape:
+            match = self._search(thresh, self.last_roi, "roi")
+        if match is None:
+            match = self._search(thresh, None, "full")
+        if match is None:
+            match = self._fallback(thresh)
+        if match is not None:
+            self._remember(match, thresh.shape)
+        return match
+
+    def _remember(self, match, shape):
+        x0, y0, x1, y1 = match.bbox
+        margin = match.diameter * ROI_MARGIN
+        self.last_roi = (int(max(0, x0 - margin)), int(max(0, y0 - margin)),
+                         int(min(shape[1], x1 + margin + 1)), int(min(shape[0], y1 + margin + 1)))
+        self.last_shape = shape
+        self.last_diameter = match.diameter
+
+    def _search(self, thresh, roi, source):
+        if roi is None:
+            x0, y0 = 0, 0
+            region = thresh
+        else:
+            x0, y0, x1, y1 = roi
+            region = np.ascontiguousarray(thresh[y0:y1, x0:x1])
+        contours = cv2.findContours(region, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(x0, y0))[-2]
+        contour_set = ContourSet.from_contours(contours)
+        if not len(contour_set):
+            return None
+
+        # Cheap vectorised prefilter: the enclosing diameter is at least the
+        # longest bbox side, so perimeter / longest side bounds the ratio.
+        width = contour_set.bbox[:, 2] - contour_set.bbox[:, 0]
+        height = contour_set.bbox[:, 3] - contour_set.bbox[:, 1]
+        longest = np.maximum(np.maximum(width, height), 1)
+        aspect = np.minimum(width, height) / longest
+        keep = ((contour_set.area >= self.min_token_area(thresh.shape)) & (aspect > 0.75)
+                & (contour_set.perimeter / longest >= MIN_P2D_RATIO))
+        if source == "roi" and self.last_diameter:
+            keep &= np.abs(longest - self.last_diameter) <= self.last_diameter * ROI_SIZE_TOLERANCE
+        candidates = np.flatnonzero(keep)
+        best = None
+        for i in candidates:
+            (cx, cy), radius = cv2.minEnclosingCircle(contour_set[i])
+            if radius <= 0:
+                continue
+            ratio = contour_set.perimeter[i] / (2 * radius)
+            fill = contour_set.area[i] / (np.pi * radius ** 2)
+            if ratio < MIN_P2D_RATIO or not FILL_RANGE[0] <= fill <= FILL_RANGE[1]:
+                continue
+            confidence = token_confidence(ratio, fill)
+            if best is None or confidence > best.confidence:
+                best = TokenMatch(contour_set[i], (cx, cy), 2 * radius, ratio, confidence,
+                                  tuple(contour_set.bbox[i]), source)
+        return best
+
+    def _fallback(self, thresh):
+        # Original behaviour: greatest perimeter to diameter ratio wins
+        contour_set = ContourSet.from_contours(cv2.findContours(thresh, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)[-2])
+        index, ratio = contour_set.max_p2d_index()
+        if index is None:
+            return None
+        cx, cy, radius = contour_set.enclosing_circles[index]
+        fill = contour_set.area[index] / (np.pi * radius ** 2)
+        return TokenMatch(contour_set[index], (cx, cy), 2 * radius, ratio, token_confidence(ratio, fill),
+                          tuple(contour_set.bbox[index]), "fallback")
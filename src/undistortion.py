@@ -0,0 +1,143 @@
+"""
+Lens undistortion with precomputed remap tables.
+
+cv2.undistort rebuilds the per-pixel rectification map on every call,
+which is most of its cost and too slow for the 30 ms capture preview on
+8 MP sensors. An Undistorter builds the map once per image size with
+initUndistortRectifyMap (fixed-point CV_16SC2, the fastest format for
+cv2.remap) and then only remaps. The result is the same as
+getOptimalNewCameraMatrix(alpha=1) + cv2.undistort + cropping to the
+valid ROI, which is what the capture dialog and the raw photo scripts
+always did.
+
+For a preview, fit() first shrinks the frame to the display size
+(INTER_AREA) and undistorts that with the camera matrix scaled to match,
+so the remap only touches display pixels.
+
+Maps are saved as `undistort_maps_<w>x<h>.npz` next to
+calibration_data.pkl so the next run starts without building them. Each
+file records a digest of the camera matrix and distortion coefficients
+and is rebuilt when the camera has been recalibrated since.
+"""
+import hashlib
+import os
+import pickle
+
+import cv2
+import numpy as np
+
+MAP_FILE = "undistort_maps_{}x{}.npz"
+
+
+def load_calibration_data(calibration_file):
+    """(camera matrix, distortion coefficients) from calibration_data.pkl, (None, None) if it is missing."""
+    if not os.path.exists(calibration_file):
+        print(f"Calibration file not found: {calibration_file}")
+        return None, None
+    with open(calibration_file, 'rb') as f:
+        data = pickle.load(f)
+    return data['camera_matrix'], data['distortion_coefficients']
+
+
+def calibration_digest(mtx, dist):
+    digest = hashlib.blake2b(digest_size=16)
+    for array in (mtx, dist):
+        digest.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+
+def build_maps(mtx, dist, size):
+    """(map1, map2, roi) for images of size (w, h)."""
+    new_mtx, roi = cv2.getOptimalNewCameraMatrix(mtx, dist, size, 1, size)
+    map1, map2 = cv2.initUndistortRectifyMap(mtx, dist, None, new_mtx, size, cv2.CV_16SC2)
+    return map1, map2, tuple(int(v) for v in roi)
+
+
+class Undistorter:
+    """
+    Undistorts images of any size with the maps of that size, built or
+    loaded on first use. `cache_dir` is where the map files go (None: keep
+    them in memory only).
+    """
+
+    def __init__(self, mtx, dist, cache_dir=None):
+        self.mtx = np.asarray(mtx, dtype=np.float64)
+        self.dist = np.asarray(dist, dtype=np.float64)
+        self.cache_dir = cache_dir
+        self.digest = calibration_digest(self.mtx, self.dist)
+        self._maps = {}
+        self._fit_maps = {}
+
+    @classmethod
+    def load(cls, calibration_file):
+        """Undistorter for calibration_data.pkl, saving its maps next to it, or None without calibration."""
+        mtx, dist = load_calibration_data(calibration_file)
+        if mtx is None or dist is None:
+            return None
+        return cls(mtx, dist, os.path.dirname(os.path.abspath(calibration_file)))
+
+    def _map_path(self, size):
+        return os.path.join(self.cache_dir, MAP_FILE.format(*size))
+
+    def _load_maps(self, size):
+        try:
+            with np.load(self._map_path(size)) as data:
+                if str(data["digest"]) != self.digest:
+                    return None
+                return data["map1"], data["map2"], tuple(int(v) for v in data["roi"])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _save_maps(self, size, maps):
+        path = self._map_path(size)
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        try:
+            np.savez(tmp_path, map1=maps[0], map2=maps[1], roi=np.array(maps[2]), digest=self.digest)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not save undistortion maps to {path}: {e}")
+
+    def maps(self, size):
+        """(map1, map2, roi) for images of size (w, h)."""
+        maps = self._maps.get(size)
+        if maps is None:
+            maps = self._load_maps(size) if self.cache_dir else None
+            if maps is None:
+                maps = build_maps(self.mtx, self.dist, size)
+                if self.cache_dir:
+                    self._save_maps(size, maps)
+            self._maps[size] = maps
+        return maps
+
+    def __call__(self, img):
+        h, w = img.shape[:2]
+        return self._remap(img, self.maps((w, h)))
+
+    def fit(self, img, box):
+        """Undistorted image scaled to fit in box (w, h), for display."""
+        h, w = img.shape[:2]
+        scale = min(box[0] / w, box[1] / h, 1.0)
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        key = ((w, h), size)
+        maps = self._fit_maps.get(key)
+        if maps is None:
+            # Pixel centres scale about (-0.5, -0.5)
+            sx, sy = size[0] / w, size[1] / h
+            mtx = self.mtx.copy()
+            mtx[0, 0] *= sx
+            mtx[0, 1] *= sx
+            mtx[0, 2] = (mtx[0, 2] + 0.5) * sx - 0.5
+            mtx[1, 1] *= sy
+            mtx[1, 2] = (mtx[1, 2] + 0.5) * sy - 0.5
+            if len(self._fit_maps) >= 8:
+                self._fit_maps.clear()  # the preview was resized a few times
+            maps = self._fit_maps[key] = build_maps(mtx, self.dist, size)
+        if size != (w, h):
+            img = cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        return self._remap(img, maps)
+
+    @staticmethod
+    def _remap(img, maps):
+        map1, map2, (x, y, roi_w, roi_h) = maps
+        dst = cv2.remap(img, map1, map2, cv2.INTER_LINEAR)
+        return dst[y:y + roi_h, x:x + roi_w]
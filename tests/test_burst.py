@@ -0,0 +1,57 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from src.burst import denoise_burst, frame_shifts, MIN_SHIFT
+
+EXAMPLES = os.path.join(os.path.dirname(__file__), "..", "examples")
+
+
+def example(name):
+    image = cv2.imread(os.path.join(EXAMPLES, name))
+    assert image is not None, name
+    return image
+
+
+def noisy(image, rng, sigma=4.0):
+    return np.clip(image + rng.normal(0, sigma, image.shape), 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize("name", ["Dymo label maker.jpg", "Klein Catapult Stripper.jpg"])
+def test_identical_frames_have_no_shift(name):
+    image = example(name)
+    assert frame_shifts([image, image]) == [(0.0, 0.0), (0.0, 0.0)]
+
+
+@pytest.mark.parametrize("name", ["Dymo label maker.jpg", "Klein Catapult Stripper.jpg"])
+def test_still_noisy_frames_are_not_aligned(name):
+    rng = np.random.default_rng(0)
+    image = example(name)
+    for dx, dy in frame_shifts([noisy(image, rng) for _ in range(3)]):
+        assert max(abs(dx), abs(dy)) < MIN_SHIFT
+
+
+def test_moved_frame_is_found():
+    image = example("Klein Catapult Stripper.jpg")
+    moved = cv2.warpAffine(image, np.float32([[1, 0, 3], [0, 1, -2]]), image.shape[1::-1],
+                           borderMode=cv2.BORDER_REPLICATE)
+    dx, dy = frame_shifts([image, moved])[1]
+    assert dx == pytest.approx(3, abs=0.25) and dy == pytest.approx(-2, abs=0.25)
+
+
+def test_flat_noise_has_no_shift():
+    rng = np.random.default_rng(0)
+    flat = np.full((600, 800, 3), 128, dtype=np.uint8)
+    assert frame_shifts([noisy(flat, rng), noisy(flat, rng)])[1] == (0.0, 0.0)
+
+
+@pytest.mark.parametrize("method", ["median", "mean"])
+def test_burst_lowers_noise(method):
+    rng = np.random.default_rng(0)
+    image = cv2.resize(example("Hex Bits.jpg"), (800, 600), interpolation=cv2.INTER_AREA)
+    result = denoise_burst([noisy(image, rng) for _ in range(8)], method)
+    error = np.abs(result.image.astype(np.float32) - image).mean()
+    assert result.frames == 8 and result.noise_after < result.noise_before
+    assert error < np.abs(noisy(image, rng).astype(np.float32) - image).mean() / 1.5
@@ -0,0 +1,45 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from src.contour_set import ContourSet
+from src.pipeline import filter_tool_contours, preprocess_image, trace_contours
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), "..", "examples", "Random Wrenches.jpg")
+
+
+@pytest.fixture(scope="module")
+def traced():
+    _, thresh = preprocess_image(EXAMPLE, 145)
+    return trace_contours(thresh)
+
+
+def test_geometry_matches_opencv(traced):
+    assert len(traced) > 10
+    for i, contour in enumerate(traced.contours):
+        assert traced.area[i] == pytest.approx(cv2.contourArea(contour), abs=1e-6)
+        assert traced.perimeter[i] == pytest.approx(cv2.arcLength(contour, True), rel=1e-6)  # OpenCV sums in float32
+        x, y, w, h = cv2.boundingRect(contour)
+        # bbox holds the inclusive max corner, boundingRect the size in px
+        assert tuple(traced.bbox[i]) == (x, y, x + w - 1, y + h - 1)
+        (cx, cy), radius = cv2.minEnclosingCircle(contour)
+        assert tuple(traced.enclosing_circles[i]) == pytest.approx((cx, cy, radius))
+
+
+def test_subset_keeps_geometry(traced):
+    keep = traced.area > 1000
+    subset = traced.subset(keep)
+    assert len(subset) == np.count_nonzero(keep)
+    np.testing.assert_array_equal(subset.area, traced.area[keep])
+    np.testing.assert_array_equal(subset.enclosing_circles, traced.enclosing_circles[keep])
+
+
+def test_filter_leaves_the_cached_set_alone(traced):
+    before = traced.digest(), len(traced), set(vars(traced))
+    tools = filter_tool_contours(traced)
+    token_index, _ = traced.max_p2d_index()
+    assert len(tools) < len(traced)
+    assert not any(np.array_equal(contour, traced[token_index]) for contour in tools)
+    assert (traced.digest(), len(traced), set(vars(traced))) == before
@@ -0,0 +1,60 @@
+import cv2
+import numpy as np
+import pytest
+
+from src.curve_fit import fit_outline, fit_points
+
+MM_PER_PX = 0.1
+
+
+def traced(draw):
+    mask = np.zeros((400, 400), np.uint8)
+    draw(mask)
+    contour = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)[-2][0]
+    return contour.reshape(-1, 2) * MM_PER_PX
+
+
+def distance_to_polyline(points, polyline):
+    """Distance of every point to the nearest segment of a closed polyline."""
+    a = polyline
+    b = np.roll(polyline, -1, axis=0)
+    ab = b - a
+    length_sq = np.maximum((ab * ab).sum(axis=1), 1e-12)
+    t = np.clip(((points[:, None] - a) * ab).sum(axis=2) / length_sq, 0, 1)
+    nearest = a + t[..., None] * ab
+    return np.linalg.norm(points[:, None] - nearest, axis=2).min(axis=1)
+
+
+CIRCLE = traced(lambda mask: cv2.circle(mask, (200, 200), 150, 255, -1))
+RECTANGLE = traced(lambda mask: cv2.rectangle(mask, (50, 80), (350, 300), 255, -1))
+
+
+@pytest.mark.parametrize("outline", [CIRCLE, RECTANGLE], ids=["circle", "rectangle"])
+@pytest.mark.parametrize("tolerance", [0.05, 0.2])
+def test_fit_stays_within_tolerance(outline, tolerance):
+    fit = fit_outline(outline, tolerance)
+    assert fit.point_count == len(outline)
+    assert fit.max_error <= tolerance
+    assert len(fit.vertices) < len(outline) / 5
+    # Check the bound independently: every traced point against the flattened fit
+    flat = fit_points(fit, tolerance / 100)
+    assert distance_to_polyline(outline, flat[:-1]).max() <= tolerance * 1.01 + 1e-9
+
+
+def test_rectangle_is_four_lines():
+    fit = fit_outline(RECTANGLE, 0.05)
+    assert len(fit.vertices) == 4 and not np.any(fit.bulges)
+
+
+def test_circle_uses_arcs():
+    fit = fit_outline(CIRCLE, 0.2)
+    assert np.count_nonzero(fit.bulges) >= 2
+
+
+@pytest.mark.parametrize("tolerance", [0.05, 0.2])
+def test_fit_points_stay_within_tolerance(tolerance):
+    fit = fit_outline(CIRCLE, tolerance)
+    flat = fit_points(fit, tolerance)
+    assert np.array_equal(flat[0], flat[-1])
+    # Flattening adds at most its own tolerance on top of the fit's
+    assert distance_to_polyline(flat, CIRCLE).max() <= 2 * tolerance + 1e-9
@@ -0,0 +1,63 @@
+import cv2
+import ezdxf
+import numpy as np
+import pytest
+
+from src.curve_fit import CurveFit, fit_outline
+from src.dxf_writer import polyline_points, validate_dxf, write_curves_dxf, write_dxf
+
+
+def traced_circle(radius=80):
+    mask = np.zeros((200, 200), np.uint8)
+    cv2.circle(mask, (100, 100), radius, 255, -1)
+    return cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2][0]
+
+
+def test_polyline_points_are_transposed_centred_and_closed():
+    contour = np.array([[[10, 20]], [[30, 20]], [[30, 60]]], np.int32)
+    points = polyline_points(contour, 0.5, center_row=20, center_col=10)
+    assert points.tolist() == [[0, 0], [0, 10], [20, 10], [0, 0]]
+
+
+def test_polylines_round_trip(tmp_path):
+    polylines = [polyline_points(traced_circle(), 0.01, 100, 100),
+                 polyline_points(np.array([[[0, 0]], [[40, 0]], [[40, 25]], [[0, 25]]]), 0.01, 100, 100)]
+    path = str(tmp_path / "tools.dxf")
+    write_dxf(path, polylines)
+    assert validate_dxf(path, polylines) == []
+    entities = list(ezdxf.readfile(path).modelspace().query("POLYLINE"))
+    assert len(entities) == 2
+    for entity, points in zip(entities, polylines):
+        read = np.array([(vertex.dxf.location.x, vertex.dxf.location.y) for vertex in entity.vertices])
+        np.testing.assert_allclose(read, points, atol=1e-6)
+
+
+def test_lines_and_arcs_round_trip(tmp_path):
+    # A 2 x 1 rectangle whose right side is a half circle bulging outwards
+    fit = CurveFit(np.array([[0.0, 0.0], [2.0, 0.0], [2.0, 1.0], [0.0, 1.0]]), np.array([0.0, 1.0, 0.0, 0.0]), 0.0, 4)
+    path = str(tmp_path / "curves.dxf")
+    write_curves_dxf(path, [fit])
+    assert validate_dxf(path, fits=[fit]) == []
+    msp = ezdxf.readfile(path).modelspace()
+    lines = [(tuple(line.dxf.start)[:2], tuple(line.dxf.end)[:2]) for line in msp.query("LINE")]
+    assert lines == [((0, 0), (2, 0)), ((2, 1), (0, 1)), ((0, 1), (0, 0))]
+    (arc,) = msp.query("ARC")
+    assert tuple(arc.dxf.center)[:2] == pytest.approx((2.0, 0.5))
+    assert arc.dxf.radius == pytest.approx(0.5)
+    assert arc.dxf.start_angle == pytest.approx(270)
+    assert arc.dxf.end_angle == pytest.approx(90)
+
+
+def test_fitted_outline_round_trips(tmp_path):
+    fit = fit_outline(polyline_points(traced_circle(), 0.01, 100, 100), 0.005)
+    path = str(tmp_path / "circle.dxf")
+    write_curves_dxf(path, [fit])
+    assert validate_dxf(path, fits=[fit]) == []
+    arcs = ezdxf.readfile(path).modelspace().query("ARC")
+    assert len(arcs) == np.count_nonzero(fit.bulges)
+    for arc in arcs:
+        # Both ends of every arc are vertices of the fit
+        for angle in (arc.dxf.start_angle, arc.dxf.end_angle):
+            angle = np.radians(angle)
+            end = np.array(arc.dxf.center)[:2] + arc.dxf.radius * np.array([np.cos(angle), np.sin(angle)])
+            assert np.min(np.linalg.norm(fit.vertices - end, axis=1)) < 1e-5
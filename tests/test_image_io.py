@@ -0,0 +1,39 @@
+import os
+
+import numpy as np
+import pytest
+
+import src.image_io as image_io
+from src.image_io import ENCODERS, read_image, save_image
+
+
+@pytest.fixture
+def image():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (48, 64, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("encoder", sorted(ENCODERS))
+def test_save_and_read(image, encoder, tmp_path):
+    result = save_image(image, str(tmp_path / "photo"), encoder)
+    assert result.path == str(tmp_path / "photo") + ENCODERS[encoder][0]
+    assert os.listdir(tmp_path) == [os.path.basename(result.path)]
+    read = read_image(result.path)
+    assert read.shape == image.shape
+    if encoder != "jpeg":
+        np.testing.assert_array_equal(read, image)
+
+
+def test_failed_write_leaves_no_partial_file(image, tmp_path, monkeypatch):
+    def fail(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(image_io.os, "replace", fail)
+    with pytest.raises(OSError):
+        save_image(image, str(tmp_path / "photo"), "png")
+    assert os.listdir(tmp_path) == []
+
+
+def test_unreadable_npy_is_none(tmp_path):
+    path = tmp_path / "broken.npy"
+    path.write_bytes(b"not an array")
+    assert read_image(str(path)) is None
@@ -0,0 +1,61 @@
+import json
+import os
+
+import numpy as np
+
+from src.contour_set import ContourSet
+from src.manifest import load_contours, load_manifest, manifest_path, update_manifest, write_manifest
+from src.pipeline import ProcessParams, build_scad_content, process_image_file
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), "..", "examples", "Random Wrenches.jpg")
+
+
+def tools():
+    return ContourSet.from_contours([np.array([[[0, 0]], [[40, 0]], [[40, 25]]], np.int32),
+                                     np.array([[[100, 100]], [[130, 100]], [[130, 140]], [[100, 140]]], np.int32)])
+
+
+def test_round_trip(tmp_path):
+    folder = str(tmp_path)
+    path = write_manifest(folder, "board", {"gridx_size": 3, "offset_pos_xy": [[1.5, -2.0]]}, tools())
+    assert path == manifest_path(folder, "board")
+    manifest = load_manifest(folder, "board")
+    assert manifest["gridx_size"] == 3 and manifest["offset_pos_xy"] == [[1.5, -2.0]]
+    assert manifest["file_name"] == "board" and manifest["contours_file"] == "board_contours.npz"
+    contours = load_contours(folder, "board")
+    np.testing.assert_array_equal(contours.points, tools().points)
+    np.testing.assert_array_equal(contours.offsets, tools().offsets)
+    assert contours.area.tolist() == tools().area.tolist()
+    assert sorted(os.listdir(folder)) == ["board_contours.npz", "board_manifest.json"]
+
+
+def test_missing_job(tmp_path):
+    assert load_manifest(str(tmp_path), "board") is None
+    assert load_contours(str(tmp_path), "board") is None
+
+
+def test_update_keeps_existing_fields(tmp_path):
+    folder = str(tmp_path)
+    write_manifest(folder, "board", {"gridx_size": 3, "dxf_path": "board.dxf"}, tools())
+    update_manifest(folder, "board", scad_path="board.scad", gridx_size=4)
+    manifest = load_manifest(folder, "board")
+    assert manifest["dxf_path"] == "board.dxf" and manifest["contours_file"] == "board_contours.npz"
+    assert manifest["scad_path"] == "board.scad" and manifest["gridx_size"] == 4
+    assert load_contours(folder, "board") is not None
+
+
+def test_import_rebuilds_the_scad_from_the_manifest(tmp_path):
+    folder = str(tmp_path)
+    summary = process_image_file(EXAMPLE, folder, ProcessParams(145, 0.1, 3.0, 10))
+    assert summary["error"] is None
+    manifest = load_manifest(folder, "Random Wrenches")
+    with open(summary["manifest_path"]) as f:
+        assert json.load(f) == manifest
+    assert manifest["params"]["threshold"] == 145 and manifest["contour_count"] == summary["contour_count"]
+    assert len(load_contours(folder, "Random Wrenches")) == summary["contour_count"]
+    # What import_to_openscad does
+    scad = build_scad_content(manifest["dxf_path"], manifest["gridx_size"], manifest["gridy_size"],
+                              manifest["splitDXF"], manifest["offset_pos_xy"],
+                              chamfer=manifest.get("chamfer"), shape_data=manifest.get("shape_data"))
+    with open(summary["scad_path"]) as f:
+        assert scad == f.read()
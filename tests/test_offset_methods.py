@@ -0,0 +1,54 @@
+import glob
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import src.pipeline as pipeline
+from src.pipeline import PipelineCache, ProcessParams, dilate_contours, distance_offset_contours, offset_kernel_size
+
+EXAMPLES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "examples", "*.jpg")))
+TOKEN = 3.0
+
+
+@pytest.fixture(scope="module", params=EXAMPLES, ids=os.path.basename)
+def example(request):
+    cache = PipelineCache()
+    cache.set_image(cv2.imread(request.param))
+    return cache
+
+
+def same_contours(a, b):
+    return len(a) == len(b) and all(np.array_equal(x, y) for x, y in zip(a, b))
+
+
+@pytest.mark.parametrize("threshold", [110, 145])
+@pytest.mark.parametrize("offset", [0.05, 0.1, 0.25])
+def test_distance_matches_raster(example, threshold, offset, monkeypatch):
+    # Always take the distance transform path, never the small kernel shortcut
+    monkeypatch.setattr(pipeline, "DILATE_CROSSOVER", 0)
+    thresh = example.threshold(threshold)
+    diameter = example.token_diameter(threshold, TOKEN)
+    assert same_contours(distance_offset_contours(thresh, diameter, TOKEN, offset),
+                         dilate_contours(thresh, diameter, TOKEN, offset))
+
+
+@pytest.mark.parametrize("kernel_diameter", [1, 2, 5, 8, 13, 30])
+def test_distance_matches_raster_on_points(kernel_diameter, monkeypatch):
+    monkeypatch.setattr(pipeline, "DILATE_CROSSOVER", 0)
+    thresh = np.zeros((80, 90), dtype=np.uint8)
+    thresh[[5, 40, 41, 70], [3, 45, 47, 88]] = 255
+    thresh[20:23, 60:75] = 255
+    # offset_kernel_size(diameter=token) == ceil(2 * offset)
+    offset = kernel_diameter / 2
+    assert same_contours(distance_offset_contours(thresh, TOKEN, TOKEN, offset),
+                         dilate_contours(thresh, TOKEN, TOKEN, offset))
+
+
+@pytest.mark.parametrize("offset", [0, -0.1])
+def test_offset_must_be_positive(offset):
+    with pytest.raises(ValueError, match="offset"):
+        ProcessParams(110, offset, 3.0, 10)
+    with pytest.raises(ValueError, match="offset"):
+        offset_kernel_size(100, 3.0, offset)
@@ -0,0 +1,58 @@
+import cv2
+import numpy as np
+import pytest
+
+from src.outline_merge import merge_outlines
+
+pytest.importorskip("pyclipper")  # merging is optional, like the polygon offset
+
+
+def square(x0, y0, x1, y1):
+    return np.array([[[x0, y0]], [[x1, y0]], [[x1, y1]], [[x0, y1]]], np.int32)
+
+
+def areas(contours):
+    return sorted(cv2.contourArea(np.asarray(contour, np.float32)) for contour in contours)
+
+
+def test_overlapping_tools_become_one_outline():
+    contours, depths = merge_outlines([square(0, 0, 20, 20), square(10, 10, 30, 30)], [10, 10])
+    assert len(contours) == 1 and depths == [10]
+    assert areas(contours) == pytest.approx([700])
+
+
+def test_hole_inside_a_tool_is_absorbed():
+    contours, _ = merge_outlines([square(0, 0, 100, 100), square(30, 30, 60, 60)], [10, 10])
+    assert len(contours) == 1
+    assert areas(contours) == pytest.approx([10000])
+
+
+def test_touching_outlines_merge():
+    contours, _ = merge_outlines([square(0, 0, 10, 10), square(10, 0, 20, 10)], [10, 10])
+    assert len(contours) == 1
+    assert areas(contours) == pytest.approx([200])
+
+
+def test_separate_outline_passes_through():
+    separate = square(100, 100, 120, 130)
+    contours, depths = merge_outlines([square(0, 0, 20, 20), square(10, 10, 30, 30), separate], [10, 10, 5])
+    assert len(contours) == 2
+    assert sorted(depths) == [5, 10]
+    kept = contours[depths.index(5)]
+    assert np.array_equal(kept.reshape(-1, 2), separate.reshape(-1, 2))
+
+
+def test_deeper_outline_is_kept_whole():
+    shallow, deep = square(0, 0, 20, 20), square(10, 0, 30, 20)
+    contours, depths = merge_outlines([shallow, deep], [10, 20])
+    assert sorted(depths) == [10, 20]
+    assert cv2.contourArea(contours[depths.index(20)]) == pytest.approx(400)
+    # The shallow cut is cut back to where it does not overlap the deep one
+    cut_back = contours[depths.index(10)].reshape(-1, 2)
+    assert cv2.contourArea(cut_back) == pytest.approx(200)
+    assert cut_back[:, 0].max() == pytest.approx(10)
+
+
+def test_small_pieces_are_dropped():
+    contours, depths = merge_outlines([square(0, 0, 20, 20), square(1, 0, 21, 20)], [10, 20], min_area=50)
+    assert depths == [20]
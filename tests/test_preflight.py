@@ -0,0 +1,51 @@
+import numpy as np
+
+from src.manifest import write_manifest
+from src.preflight import check_outlines, error_count, problem_dict
+from src.render_queue import geometry_errors
+
+
+def square(x, y, r):
+    return np.array([(x - r, y - r), (x + r, y - r), (x + r, y + r), (x - r, y + r)], dtype=np.float64)
+
+
+def kinds(problems):
+    return sorted({problem.kind for problem in problems})
+
+
+def test_clean_layout_has_no_problems():
+    assert check_outlines([square(-20, 0, 10), square(20, 0, 10)], 3, 3) == []
+
+
+def test_crossing_outlines_are_an_error():
+    problems = check_outlines([square(0, 0, 10), square(15, 0, 10)], 3, 3)
+    assert kinds(problems) == ["overlap"] and error_count(problems) > 0
+
+
+def test_self_intersection_is_an_error():
+    bow_tie = np.array([(0, 0), (10, 10), (10, 0), (0, 10)], dtype=np.float64)
+    assert "self-intersection" in kinds(check_outlines([bow_tie], 3, 3))
+
+
+def test_hole_inside_a_tool_is_only_a_warning():
+    problems = check_outlines([square(0, 0, 10), square(2, 2, 3)], 3, 3)
+    assert kinds(problems) == ["nested"] and error_count(problems) == 0
+    assert problems[0].tool == 2 and "inside tool 1" in problems[0].detail
+
+
+def test_nested_found_among_many_outlines():
+    rng = np.random.default_rng(0)
+    rings = [square(x, y, 0.5) for x, y in np.stack(np.meshgrid(np.arange(-50, 50, 4), np.arange(-50, 50, 4)), -1).reshape(-1, 2)]
+    rings.append(square(2.2, 2.2, 0.1))  # inside the square at (2, 2)
+    rng.shuffle(rings)
+    problems = check_outlines(rings, 3, 3)
+    assert [problem.kind for problem in problems] == ["nested"]
+
+
+def test_nested_outline_does_not_block_the_render(tmp_path):
+    problems = check_outlines([square(0, 0, 10), square(2, 2, 3)], 3, 3)
+    write_manifest(str(tmp_path), "board", {"problems": [problem_dict(problem) for problem in problems]})
+    assert geometry_errors(str(tmp_path / "board.scad")) == []
+    problems = check_outlines([square(0, 0, 10), square(15, 0, 10)], 3, 3)
+    write_manifest(str(tmp_path), "board", {"problems": [problem_dict(problem) for problem in problems]})
+    assert geometry_errors(str(tmp_path / "board.scad"))
@@ -0,0 +1,177 @@
+import os
+import stat
+import sys
+import time
+
+import pytest
+
+from src.render_cache import RenderCache
+from src.render_queue import find_openscad, render_one, run_queue, main
+
+# Stands in for openscad: "-o out.stl file.scad" writes part of the STL, then
+# does what STUB_MODE says. Every run appends a line to STUB_RUNS.
+STUB = '''#!{python}
+import os, sys, time
+args = sys.argv[1:]
+if "--help" in args:
+    print("Usage: openscad [options] file.scad")
+    sys.exit(0)
+if "--version" in args:
+    print("OpenSCAD version 2021.01 (stub)", file=sys.stderr)
+    sys.exit(0)
+mode = os.environ.get("STUB_MODE", "ok")
+runs = os.environ["STUB_RUNS"]
+with open(runs, "a") as f:
+    f.write(str(os.getpid()) + "\\n")
+with open(runs) as f:
+    attempt = len(f.read().splitlines())
+out = args[args.index("-o") + 1]
+with open(out, "w") as f:
+    f.write("solid stub\\n")
+if mode == "fail" or (mode == "fail_once" and attempt == 1):
+    print("ERROR: stub failure", file=sys.stderr)
+    sys.exit(1)
+if mode == "hang":
+    print("rendering...", flush=True)
+    time.sleep(60)
+with open(out, "a") as f:
+    f.write("endsolid stub\\n")
+print("Total rendering time: 0:00:00.001")
+'''
+
+
+@pytest.fixture
+def openscad(tmp_path, monkeypatch):
+    path = tmp_path / "openscad"
+    path.write_text(STUB.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    monkeypatch.setenv("STUB_RUNS", str(tmp_path / "runs.txt"))
+    return str(path)
+
+
+@pytest.fixture
+def scad(tmp_path):
+    path = tmp_path / "board.scad"
+    path.write_text("cube(10);\n")
+    return str(path)
+
+
+def runs(tmp_path):
+    path = tmp_path / "runs.txt"
+    return [int(pid) for pid in path.read_text().split()] if path.exists() else []
+
+
+def test_find_openscad_prefers_explicit_path(openscad, monkeypatch):
+    monkeypatch.delenv("OPENSCAD", raising=False)
+    assert find_openscad(openscad) == openscad
+    monkeypatch.setenv("OPENSCAD", openscad)
+    assert find_openscad() == openscad
+
+
+def test_render_succeeds(openscad, scad, tmp_path, monkeypatch):
+    monkeypatch.setenv("STUB_MODE", "ok")
+    summary = render_one(scad, openscad, retries=1)
+    assert summary["status"] == "ok" and summary["attempts"] == 1
+    assert (tmp_path / "board.stl").read_text() == "solid stub\nendsolid stub\n"
+    assert "Total rendering time" in (tmp_path / "board.stl.log").read_text()
+    assert not (tmp_path / "board.partial.stl").exists()
+
+
+def test_failure_is_retried(openscad, scad, tmp_path, monkeypatch):
+    monkeypatch.setenv("STUB_MODE", "fail_once")
+    summary = render_one(scad, openscad, retries=1)
+    assert summary["status"] == "ok" and summary["attempts"] == 2
+    assert len(runs(tmp_path)) == 2
+    log = (tmp_path / "board.stl.log").read_text()
+    assert "--- attempt 1" in log and "stub failure" in log and "--- attempt 2" in log
+
+
+def test_failure_removes_partial_output(openscad, scad, tmp_path, monkeypatch):
+    monkeypatch.setenv("STUB_MODE", "fail")
+    summary = render_one(scad, openscad, retries=2)
+    assert summary["status"] == "failed" and summary["attempts"] == 3
+    assert summary["error"] == "exit code 1" and summary["stl"] is None
+    assert not (tmp_path / "board.stl").exists()
+    assert not (tmp_path / "board.partial.stl").exists()
+
+
+def test_timeout_kills_the_render(openscad, scad, tmp_path, monkeypatch):
+    monkeypatch.setenv("STUB_MODE", "hang")
+    start = time.perf_counter()
+    summary = render_one(scad, openscad, timeout=1, retries=1)
+    assert time.perf_counter() - start < 30
+    assert summary["status"] == "timeout" and summary["attempts"] == 2
+    pids = runs(tmp_path)
+    assert len(pids) == 2
+    for pid in pids:
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
+    assert "timed out after 1 s" in (tmp_path / "board.stl.log").read_text()
+    assert not (tmp_path / "board.stl").exists()
+    assert not (tmp_path / "board.partial.stl").exists()
+
+
+def test_queue_writes_summary(openscad, tmp_path, monkeypatch):
+    monkeypatch.setenv("STUB_MODE", "ok")
+    for name in ("a", "b", "c"):
+        (tmp_path / f"{name}.scad").write_text("cube(1);\n")
+    assert main([str(tmp_path), "--openscad", openscad, "--workers", "2", "--no-cache"]) == 0
+    assert sorted(p for p in os.listdir(tmp_path) if p.endswith(".stl")) == ["a.stl", "b.stl", "c.stl"]
+    lines = (tmp_path / "render_summary.csv").read_text().splitlines()
+    assert lines[0].startswith("scad,stl,status") and len(lines) == 4
+    assert all(",ok," in line for line in lines[1:])
+
+
+def test_queue_reports_failures(openscad, scad, monkeypatch):
+    monkeypatch.setenv("STUB_MODE", "fail")
+    summaries = run_queue([scad], openscad, retries=0)
+    assert [s["status"] for s in summaries] == ["failed"]
+    assert main([scad, "--openscad", openscad, "--retries", "0", "--no-cache"]) == 1
+
+
+def test_evicted_entry_is_a_miss(openscad, scad, tmp_path, monkeypatch):
+    monkeypatch.setenv("STUB_MODE", "ok")
+    cache = RenderCache(str(tmp_path / "cache"))
+    render_one(scad, openscad, cache=cache)
+    key, _, entry, _ = cache.lookup(scad, openscad)
+    os.remove(entry)  # what another worker's evict() does between lookup and copy
+    monkeypatch.setattr(cache, "lookup", lambda *args: (key, {}, entry, None))
+    summary = render_one(scad, openscad, cache=cache)
+    assert summary["status"] == "ok" and summary["cache"] == "miss (evicted from the cache)"
+
+
+def test_second_render_is_a_cache_hit(openscad, scad, tmp_path, monkeypatch):
+    monkeypatch.setenv("STUB_MODE", "ok")
+    cache = RenderCache(str(tmp_path / "cache"))
+    first = render_one(scad, openscad, cache=cache)
+    assert first["cache"] == "miss (first render of this file)"
+    os.remove(first["stl"])
+    second = render_one(scad, openscad, cache=cache)
+    assert second["status"] == "cached" and second["cache"] == "hit"
+    assert (tmp_path / "board.stl").read_text() == "solid stub\nendsolid stub\n"
+    assert len(runs(tmp_path)) == 1
+
+
+def test_changed_dxf_explains_the_miss(openscad, tmp_path, monkeypatch):
+    monkeypatch.setenv("STUB_MODE", "ok")
+    (tmp_path / "tool.dxf").write_text("0\nEOF\n")
+    scad = tmp_path / "board.scad"
+    scad.write_text('linear_extrude(5) import("tool.dxf");\n')
+    cache = RenderCache(str(tmp_path / "cache"))
+    render_one(str(scad), openscad, cache=cache)
+    (tmp_path / "tool.dxf").write_text("0\nSECTION\n0\nEOF\n")
+    summary = render_one(str(scad), openscad, cache=cache)
+    assert summary["status"] == "ok" and summary["cache"] == "miss (changed: asset:tool.dxf)"
+    assert len(runs(tmp_path)) == 2
+
+
+def test_evict_drops_least_recently_used(tmp_path):
+    cache = RenderCache(str(tmp_path / "cache"), max_size_mb=2.5 / 1024)  # 2.5 KB
+    paths = []
+    for index, key in enumerate(["aa01", "bb02", "cc03"]):
+        stl = tmp_path / f"{key}.stl"
+        stl.write_bytes(b"x" * 1024)
+        paths.append(cache.store(key, {"scad": key}, str(tmp_path / f"{key}.scad"), str(stl)))
+        os.utime(paths[-1], (index, index))  # stored in this order
+    assert cache.evict() == 2048
+    assert [os.path.exists(path) for path in paths] == [False, True, True]
@@ -0,0 +1,60 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import src.rig_calibration as rig_calibration
+from src.image_io import save_image
+from src.pipeline import PipelineCache, ProcessParams, process_image_file
+from src.rig_calibration import RigScale, load_rig_scale, save_rig_scale
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), "..", "examples", "Random Wrenches.jpg")
+
+
+def test_saved_shape_is_loaded(tmp_path):
+    rig_file = str(tmp_path / "rig_scale.pkl")
+    calibration_file = str(tmp_path / "missing.pkl")
+    save_rig_scale(40.0, (3000, 4000, 3), 3.0, rig_file=rig_file, calibration_file=calibration_file)
+    data = load_rig_scale(rig_file=rig_file, calibration_file=calibration_file)
+    assert data["image_shape"] == (3000, 4000)
+
+
+def test_same_shape_uses_saved_scale():
+    rig = RigScale(40.0, (3000, 4000), background=False)
+    assert rig.token_diameter(3.0, (3000, 4000, 3)) == 120.0
+
+
+def test_resized_frame_scales_px_per_inch():
+    rig = RigScale(40.0, (3000, 4000), background=False)
+    assert rig.px_per_inch_for((1500, 2000)) == pytest.approx(20.0)
+
+
+def test_other_aspect_ratio_is_refused():
+    rig = RigScale(40.0, (3000, 4000), background=False)
+    with pytest.raises(ValueError, match="4000x3000"):
+        rig.token_diameter(3.0, (4000, 3000))
+
+
+def test_pipeline_uses_source_shape():
+    cache = PipelineCache()
+    cache.rig = RigScale(40.0, (400, 600), background=False)
+    cache.set_image(np.zeros((200, 300, 3), np.uint8))
+    assert cache.token_diameter(110, 3.0) == pytest.approx(60.0)
+
+
+def test_batch_image_of_other_shape_fails(tmp_path):
+    image_path = str(tmp_path / "photo.png")
+    cv2.imwrite(image_path, np.zeros((300, 300, 3), np.uint8))
+    rig = RigScale(40.0, (400, 600), background=False)
+    summary = process_image_file(image_path, str(tmp_path), ProcessParams(110, 0.1, 3.0, 0.1), rig=rig)
+    assert "Re-save the rig scale" in summary["error"]
+
+
+def test_cli_reads_npy_captures(tmp_path, monkeypatch):
+    capture = save_image(cv2.imread(EXAMPLE), str(tmp_path / "capture"), "npy").path
+    saved = []
+    monkeypatch.setattr(rig_calibration, "save_rig_scale", lambda *args: saved.append(args))
+    assert rig_calibration.main([capture, "--token", "3", "--threshold", "145"]) == 0
+    px_per_inch, shape, token = saved[0]
+    assert px_per_inch == pytest.approx(332 / 3, rel=0.01) and shape[:2] == (1975, 1904) and token == 3
@@ -0,0 +1,35 @@
+import os
+
+import cv2
+import pytest
+
+from src.pipeline import preprocess_image
+from src.token_detector import MIN_EXPECTED_FRACTION, MIN_TOKEN_FRACTION, TokenDetector, token_area
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), "..", "examples", "Dymo label maker.jpg")
+
+
+def test_min_area_follows_frame_size():
+    detector = TokenDetector()
+    assert detector.min_token_area((2448, 3264)) == pytest.approx(1000, rel=0.01)
+    assert detector.min_token_area((4896, 6528)) == pytest.approx(4 * detector.min_token_area((2448, 3264)))
+
+
+def test_min_area_from_expected_diameter():
+    detector = TokenDetector(expected_diameter=300)
+    assert detector.min_token_area((100, 100)) == pytest.approx(MIN_EXPECTED_FRACTION * token_area(300))
+
+
+def test_fixed_min_area_wins():
+    assert TokenDetector(min_area=50).min_token_area((2448, 3264)) == 50
+
+
+@pytest.mark.parametrize("scale", [0.25, 0.5, 1.0, 2.0])
+def test_token_found_at_any_resolution(scale):
+    image = cv2.imread(EXAMPLE)
+    image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    _, thresh = preprocess_image(image, 145)
+    match = TokenDetector().detect(thresh)
+    assert match is not None and match.source == "full"
+    assert match.diameter == pytest.approx(335 * scale, rel=0.03)
+    assert MIN_TOKEN_FRACTION * thresh.size < cv2.contourArea(match.contour)